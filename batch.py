@@ -0,0 +1,229 @@
+import argparse
+import contextlib
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# ==========================================
+# BATCH MODE (overnight chart review)
+# ==========================================
+# Streams (patient_id, query) cases from a JSONL or CSV file through the
+# compiled graph with bounded concurrency and appends one JSON result per
+# line to the output file as soon as each case finishes.
+#
+#   python batch.py cases.jsonl results.jsonl --concurrency 16
+#
+# Input: JSONL lines like {"id": "c1", "patient_id": "P001", "query": "..."}
+# or a CSV with patient_id,query[,id] columns. "id" is optional; without it
+# a case is identified by a hash of (patient_id, query). A row that can't be
+# parsed or lacks patient_id / query is written as a failed result ("row-N"
+# id unless it has one) and the batch carries on.
+#
+# Re-running with the same output file resumes: cases that already have an
+# "ok" result are skipped, failed ones are retried.
+#
+# Cases run at "batch" priority, so their PubMed / RxNav / Groq calls queue
+# behind interactive consultations (see scheduler.py).
+
+
+def case_id(case):
+    if case.get("id"):
+        return str(case["id"])
+    digest = hashlib.sha1(f"{case['patient_id']}\n{case['query']}".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def _jsonl_rows(f):
+    for line in f:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield {"_error": f"invalid JSON ({e})"}
+            continue
+        yield row if isinstance(row, dict) else {"_error": "not a JSON object"}
+
+
+def read_cases(path):
+    """
+    Yield case dicts from a JSONL or CSV file without loading it whole.
+    A row that can't be parsed or has no patient_id / query is yielded with
+    an "error" message (and a "row-N" id if it has none) so the batch can
+    record it as failed and carry on.
+    """
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        rows = csv.DictReader(f) if path.endswith(".csv") else _jsonl_rows(f)
+        for number, row in enumerate(rows, 1):
+            query = row.get("query") or row.get("user_query")
+            case = {"id": row.get("id"), "patient_id": row.get("patient_id"), "query": query}
+            missing = [column for column in ("patient_id", "query") if not case[column]]
+            error = row.get("_error") or (f"missing {', '.join(missing)}" if missing else None)
+            if error:
+                case["id"] = case["id"] or f"row-{number}"
+                case["error"] = f"row {number}: {error}"
+            yield case
+
+
+def completed_ids(output_path):
+    """IDs of cases that already have a successful result in the output file."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Torn last line from an interrupted run
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def run_case(app, case):
+    from main import stream_consultation
+
+    start = time.perf_counter()
+    ttft = None
+    try:
+        inputs = {"patient_id": case["patient_id"], "user_query": case["query"], "priority": "batch"}
+        for kind, payload, metrics in stream_consultation(app, inputs):
+            if kind == "result":
+                result, ttft = payload, metrics["ttft_s"]
+        record = {
+            "status": "ok",
+            "research_findings": result.get("research_findings"),
+            "safety_check": result.get("safety_check"),
+            "rule_warnings": result.get("rule_warnings", []),
+        }
+    except Exception as e:
+        record = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+    record["latency_s"] = round(time.perf_counter() - start, 4)
+    record["ttft_s"] = round(ttft, 4) if ttft is not None else None
+    return record
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_batch(input_path, output_path, concurrency=8, app=None, progress_every=100):
+    """
+    Run every pending case and return a summary dict with throughput,
+    latency percentiles and failure counts.
+    """
+    if app is None:
+        from main import get_app
+        app = get_app()
+
+    done = completed_ids(output_path)
+    latencies = []
+    ttfts = []
+    failures = skipped = invalid = 0
+    start = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=concurrency) as pool:
+        if out.tell() and not _ends_with_newline(output_path):
+            out.write("\n")  # Don't glue new results onto a torn last line
+        pending = {}
+
+        def write(case, record):
+            out.write(json.dumps({"id": case["_id"], "patient_id": case["patient_id"],
+                                  "query": case["query"], **record}) + "\n")
+            out.flush()
+
+        def drain():
+            """Block until at least one case finishes and write its result."""
+            nonlocal failures
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                case = pending.pop(future)
+                record = future.result()
+                latencies.append(record["latency_s"])
+                if record["ttft_s"] is not None:
+                    ttfts.append(record["ttft_s"])
+                if record["status"] != "ok":
+                    failures += 1
+                write(case, record)
+                if progress_every and len(latencies) % progress_every == 0:
+                    rate = len(latencies) / (time.perf_counter() - start)
+                    print(f"... {len(latencies)} cases done ({rate:.1f}/s, {failures} failed)", file=sys.stderr)
+
+        for case in read_cases(input_path):
+            case["_id"] = case_id(case)
+            if case["_id"] in done:
+                skipped += 1
+                continue
+            if "error" in case:
+                # Bad input row: record it like a failed case instead of stopping the batch
+                write(case, {"status": "error", "error": case.pop("error"), "latency_s": None, "ttft_s": None})
+                failures += 1
+                invalid += 1
+                continue
+            # Bounded in-flight work: never queue more than 2x the worker count
+            while len(pending) >= concurrency * 2:
+                drain()
+            pending[pool.submit(run_case, app, case)] = case
+
+        while pending:
+            drain()
+
+    elapsed = time.perf_counter() - start
+    ordered = sorted(latencies)
+    ttfts.sort()
+    return {
+        "processed": len(latencies) + invalid,
+        "skipped": skipped,
+        "failures": failures,
+        "invalid": invalid,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_per_s": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "latency_p50_s": percentile(ordered, 50),
+        "latency_p95_s": percentile(ordered, 95),
+        "latency_p99_s": percentile(ordered, 99),
+        "ttft_p50_s": percentile(ttfts, 50),
+        "ttft_p95_s": percentile(ttfts, 95),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run many (patient_id, query) cases through the agent graph.")
+    parser.add_argument("input", help="cases file (.jsonl or .csv)")
+    parser.add_argument("output", help="results file (.jsonl), appended to and used for resuming")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--verbose", action="store_true", help="show the agents' console output")
+    parser.add_argument("--metrics", help="write per-node/per-call latency metrics here (.json or .prom)")
+    args = parser.parse_args()
+
+    print(f"🏥 MED PERPLEXITY BATCH: {args.input} -> {args.output} (concurrency {args.concurrency})",
+          file=sys.stderr)
+    if args.metrics:
+        import tracing
+        tracing.enable()
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    with quiet:
+        summary = run_batch(args.input, args.output, args.concurrency)
+
+    import llm_cache
+    summary["llm_cache"] = llm_cache.cache_stats()
+
+    if args.metrics:
+        tracing.write(args.metrics)
+
+    print("=" * 80, file=sys.stderr)
+    print(json.dumps(summary, indent=2), file=sys.stderr)
@@ -0,0 +1,117 @@
+"""
+Concurrency benchmark: thread-per-request vs. a single asyncio event loop.
+
+Pushes N concurrent consultations through the sync graph (app.invoke on a
+thread pool of N) and through the async graph (async_app.ainvoke on one
+event loop) against the local stub services (run in a separate process),
+at N = 10, 100 and 500.
+Every case uses a distinct query so the PubMed cache does not short-circuit
+the HTTP calls.
+
+Run from the repo root:
+    python -m benchmarks.async_vs_threads [--levels 10 100 500] [--rounds 2]
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import http_client
+from benchmarks.stub_server import StubProcess
+
+PROFILE = {"latency_ms": {"esearch": 100, "efetch": 150, "groq": 400}}
+
+
+def cases(n, tag):
+    patients = ["P001", "P002", "P003"]
+    return [{"patient_id": patients[i % 3], "user_query": f"fever and cough case {tag}-{i}"} for i in range(n)]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def run_threads(app, level, rounds):
+    peak = [threading.active_count()]
+    work = cases(level * rounds, f"t{level}")
+
+    def one(inputs):
+        peak[0] = max(peak[0], threading.active_count())
+        return timed(app.invoke, inputs)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=level) as pool:
+        latencies = list(pool.map(one, work))
+    return time.perf_counter() - start, latencies, peak[0]
+
+
+def run_async(async_app, level, rounds):
+    work = cases(level * rounds, f"a{level}")
+
+    async def main():
+        limit = asyncio.Semaphore(level)
+
+        async def one(inputs):
+            async with limit:
+                start = time.perf_counter()
+                await async_app.ainvoke(inputs)
+                return time.perf_counter() - start
+
+        try:
+            return await asyncio.gather(*(one(inputs) for inputs in work))
+        finally:
+            await http_client.aclose()
+
+    start = time.perf_counter()
+    latencies = asyncio.run(main())
+    return time.perf_counter() - start, latencies, threading.active_count()
+
+
+def summarize(mode, level, elapsed, latencies, threads):
+    ordered = sorted(latencies)
+    return {
+        "mode": mode,
+        "concurrency": level,
+        "requests": len(latencies),
+        "throughput_per_s": round(len(latencies) / elapsed, 1),
+        "p50_s": round(statistics.median(ordered), 3),
+        "p95_s": round(ordered[int(len(ordered) * 0.95) - 1], 3),
+        "peak_threads": threads,
+    }
+
+
+def run(levels, rounds):
+    server = StubProcess(profile=PROFILE).start()
+    os.environ.update(server.env())
+    os.environ["MEDP_CACHE_DIR"] = "off"
+    os.environ["HTTP_POOL_SIZE"] = str(max(levels))  # Don't let the pool cap either mode
+
+    import main
+
+    results = []
+    try:
+        for level in levels:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                threaded = summarize("threads", level, *run_threads(main.app, level, rounds))
+                asynced = summarize("async", level, *run_async(main.async_app, level, rounds))
+            for row in (threaded, asynced):
+                results.append(row)
+                print(json.dumps(row))
+    finally:
+        server.stop()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--rounds", type=int, default=2, help="requests per concurrency slot")
+    args = parser.parse_args()
+    run(args.levels, args.rounds)
@@ -0,0 +1,102 @@
+"""
+Incremental re-evaluation benchmark: per-node checkpoints.
+
+Runs a consultation for P001 against the local stub services
+(benchmarks/stub_server.py), then updates the patient record (appended to
+a JSONL copy of patients.json, as a record update would be) and runs it
+again, with and without checkpoints. For each kind of update it reports
+the nodes checkpoint.affected_nodes() predicts will rerun, the re-run wall
+time and the PubMed / LLM calls it made:
+
+    creatinine     new lab value: only the AI safety review reruns
+    egfr           eGFR (rule threshold input): rule checks + safety review
+    medication     new current medication: research onward
+    none           identical re-run
+
+LLM and PubMed caches are off, so "without checkpoints" is the full graph.
+
+Run from the repo root:
+    python -m benchmarks.checkpoint [--repeats 3]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.stub_server import StubServer
+
+PATIENT_ID = "P001"
+QUERY = "Patient has high fever and chest infection. Recommend antibiotics."
+UPDATES = {
+    "creatinine": (["patient_profile.vitals.creatinine", "patient_profile.lab_flags"],
+                   lambda r: r["vitals"].update(creatinine=round(r["vitals"]["creatinine"] + 0.1, 2))),
+    "egfr": (["patient_profile.vitals.eGFR", "patient_profile.lab_flags"],
+             lambda r: r["vitals"].update(eGFR=r["vitals"]["eGFR"] - 3)),
+    "medication": (["patient_profile.medications"], lambda r: r["medications"].append("Atorvastatin 10mg")),
+    "none": ([], lambda r: None),
+}
+
+
+def run(repeats):
+    server = StubServer().start()
+    workdir = tempfile.mkdtemp(prefix="medp_checkpoint_")
+    db_path = os.path.join(workdir, "patients.jsonl")
+    os.environ.update(server.env())
+    os.environ.update({"MEDP_CACHE_DIR": "off", "LLM_CACHE": "off", "PATIENTS_DB": db_path})
+
+    # Imported after the environment is set so the agents pick up the stub
+    import checkpoint
+    import main
+    import pubmed_cache
+    from patient_store import convert_json_to_jsonl, get_patient_store
+
+    convert_json_to_jsonl("patients.json", db_path)
+    original = get_patient_store().get(PATIENT_ID)
+    graphs = {"full": main.build_graph(checkpoints=False), "checkpointed": main.build_graph(checkpoints=True)}
+    inputs = {"patient_id": PATIENT_ID, "user_query": QUERY}
+
+    def write(record):
+        with open(db_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def invoke(graph):
+        pubmed_cache.search_cache.clear()
+        pubmed_cache.article_cache.clear()
+        before = dict(server.requests)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = graph.invoke(inputs)
+        elapsed = time.perf_counter() - start
+        calls = {k: v - before.get(k, 0) for k, v in server.requests.items() if v - before.get(k, 0)}
+        return result, elapsed, calls
+
+    try:
+        for name, (changed, update) in UPDATES.items():
+            row = {"update": name, "predicted": main.affected_nodes(changed)}
+            for label, graph in graphs.items():
+                samples = []
+                for _ in range(repeats):
+                    checkpoint.checkpoint_cache.clear()
+                    write(original)
+                    invoke(graph)  # The consultation before the update
+                    record = json.loads(json.dumps(original))
+                    update(record)
+                    write(record)
+                    result, elapsed, calls = invoke(graph)
+                    samples.append(elapsed)
+                row[f"{label}_s"] = round(statistics.median(samples), 3)
+                row[f"{label}_calls"] = calls
+            print(json.dumps(row))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    run(args.repeats)
@@ -0,0 +1,151 @@
+"""
+Population-wide safety screening benchmark.
+
+Generates a synthetic patient population (default 1M; brand-name
+medication strings, free-text conditions, eGFR with 10% not recorded),
+encodes it into a cohort_screen.Cohort with the safety agent's rule tables
+and reports (the tables ship without renal thresholds, so metformin gets a
+benchmark-only "egfr_below": 30 to exercise the renal mask):
+
+    build_s        time to encode the population (streamed, one pass)
+    mb             size of the encoded columns
+    screen         per-drug p50 / p95 latency of Cohort.screen and how many
+                   patients each rule flags
+    per_patient    the rule engine's check() run patient by patient over a
+                   sample, extrapolated to the whole population (the LLM
+                   call safety_agent_node adds per patient is not counted)
+    agreement      whether the cohort flags exactly the sampled patients the
+                   per-patient rules flag, for every drug and reason
+
+Run from the repo root:
+    python -m benchmarks.cohort_screen [--patients 1000000] [--sample 20000]
+"""
+import argparse
+import itertools
+import json
+import statistics
+import time
+
+import numpy as np
+
+from cohort_screen import Cohort
+from drug_normalizer import get_normalizer
+from rule_engine import RuleEngine
+from safety_agent import CONTRAINDICATIONS, DRUG_INTERACTIONS
+
+CONDITIONS = ["Chronic Kidney Disease (Stage 3)", "CKD stage 4", "Hypertension", "Type 2 Diabetes Mellitus",
+              "Asthma", "Peptic Ulcer Disease", "Arrhythmia", "Renal Failure", "Osteoarthritis",
+              "Hypothyroidism", "Coronary Artery Disease", "GERD"]
+MEDICATIONS = ["Glycomet 500mg", "Metformin 1g", "Warf 5mg", "Ecosprin 75", "Listril 10mg", "Lisinopril",
+               "Amlodipine 5mg", "Telma 40", "Atorva 20", "Brufen 400", "Nitrocontin 2.6", "Sorbitrate 10mg",
+               "Pan 40", "Dolo 650", "Clopilet 75", "Naprosyn 250", "Levothyroxine 50mcg", "Combiflam"]
+ALLERGIES = ["Sulfa Drugs", "Penicillin", "Aspirin", "Ibuprofen", "Warfarin", "Peanuts"]
+DRUGS = ["metformin", "ibuprofen", "warfarin", "sildenafil", "Brufen", "levofloxacin"]
+EGFR_BELOW = {"metformin": 30}  # Benchmark only: not a shipped rule
+CHUNK = 100_000
+
+
+def patients(n, seed=0):
+    """Synthetic patient records, generated lazily in chunks."""
+    rng = np.random.default_rng(seed)
+    for start in range(0, n, CHUNK):
+        size = min(CHUNK, n - start)
+        n_cond = rng.integers(0, 4, size)
+        n_meds = rng.integers(0, 7, size)
+        n_allergy = (rng.random(size) < 0.2).astype(int)
+        cond = rng.integers(0, len(CONDITIONS), (size, 3))
+        meds = rng.integers(0, len(MEDICATIONS), (size, 6))
+        allergy = rng.integers(0, len(ALLERGIES), size)
+        egfr = np.clip(rng.normal(75, 25, size), 5, 130).round()
+        recorded = rng.random(size) >= 0.1
+        for i in range(size):
+            vitals = {"eGFR": float(egfr[i]), "creatinine": round(88.4 / egfr[i], 2)} if recorded[i] else {}
+            yield {
+                "id": f"P{start + i:07d}",
+                "conditions": [CONDITIONS[c] for c in cond[i, :n_cond[i]]],
+                "medications": [MEDICATIONS[m] for m in meds[i, :n_meds[i]]],
+                "allergies": [ALLERGIES[allergy[i]]] if n_allergy[i] else [],
+                "vitals": vitals,
+            }
+
+
+def reference_flags(engine, drug_name, record):
+    """Reasons the per-patient rule check flags a record for, as a set."""
+    graph = engine.interaction_graph
+    flags = set()
+    for drug in engine.proposed_drugs(drug_name):
+        warnings, _ = engine.check(drug, record)
+        if f"CRITICAL: Patient is allergic to {drug.upper()}." in warnings:
+            flags.add("allergy")
+        if any(w.startswith(f"CONTRAINDICATION: {drug.upper()} + ") for w in warnings):
+            flags.add("contraindication")
+        if any(w.startswith(f"CONTRAINDICATION: {drug.upper()} with eGFR") for w in warnings):
+            flags.add("renal")
+        if drug in graph.ids:
+            meds = {graph.ids[d] for m in record["medications"] for d in engine.drugs_in(m) if d in graph.ids}
+            me = graph.ids[drug]
+            if any(me in (a, b) for a, b, _ in graph.conflicts(meds | {me})):
+                flags.add("interaction")
+    return flags
+
+
+def percentiles_ms(samples):
+    samples = sorted(samples)
+    return {"p50_ms": round(statistics.median(samples) * 1000, 2),
+            "p95_ms": round(samples[int(len(samples) * 0.95) - 1] * 1000, 2)}
+
+
+def run(n_patients, n_sample, repeats):
+    contraindications = {drug: dict(info, egfr_below=EGFR_BELOW.get(drug))
+                         for drug, info in CONTRAINDICATIONS.items()}
+    engine = RuleEngine(contraindications, DRUG_INTERACTIONS, get_normalizer().synonyms())
+
+    start = time.perf_counter()
+    cohort = Cohort.from_records(patients(n_patients), engine)
+    build_s = time.perf_counter() - start
+
+    screens = {}
+    for drug in DRUGS:
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = cohort.screen(drug)
+            times.append(time.perf_counter() - start)
+        screens[drug] = {**percentiles_ms(times), "flagged": len(result), **result.counts()}
+
+    sample = list(itertools.islice(patients(n_patients), n_sample))  # The first rows of the cohort
+    start = time.perf_counter()
+    for record in sample:
+        engine.check(DRUGS[0], record)
+    per_patient_s = (time.perf_counter() - start) / len(sample)
+
+    agreement = True
+    for drug in DRUGS:
+        result = cohort.screen(drug)
+        for row, record in enumerate(sample):
+            got = {reason for reason, mask in result.masks.items() if mask[row]}
+            if got != reference_flags(engine, drug, record):
+                agreement = False
+                break
+
+    row = {
+        "patients": n_patients,
+        "build_s": round(build_s, 2),
+        "mb": round(cohort.nbytes / 1e6, 1),
+        "screen": screens,
+        "per_patient_check_us": round(per_patient_s * 1e6, 1),
+        "per_patient_all_s": round(per_patient_s * n_patients, 1),
+        "agreement_sample": len(sample),
+        "agreement": agreement,
+    }
+    print(json.dumps(row))
+    return row
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patients", type=int, default=1_000_000)
+    parser.add_argument("--sample", type=int, default=20_000, help="patients checked one by one")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+    run(args.patients, args.sample, args.repeats)
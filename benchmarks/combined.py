@@ -0,0 +1,150 @@
+"""
+Combined single-call mode vs. the two-call pipeline.
+
+Runs a fixed scenario set (every demo patient x every demo query) through
+the "parallel" graph (research call, then safety review call) and the
+"combined" graph (one call writing both; a second call only when the rule
+checks flag a conflict, see combined_agent.py), and reports per graph:
+
+    latency        median wall time per consultation, overall and for the
+                   scenarios the rules pass (safe) / flag
+    llm_s          time spent in LLM calls per consultation
+    llm_calls      Groq calls per consultation
+    prompt_tokens  prompt tokens sent per consultation
+    accuracy       agreement with the two-call pipeline, per scenario:
+                     verdict    rule-flagged, or the SAFETY STATUS of the review
+                     warnings   identical rule warnings
+                     drugs      same drugs recommended (drug_normalizer)
+
+Against the local stubs (benchmarks/stub_server.py) the answers are canned,
+so the accuracy rows check the plumbing: every flagged scenario must still
+get its second review. Groq latency is modelled as --overhead-ms per call
+plus --decode-ms per completion token. With --live the scenarios go to the
+real Groq / PubMed / RxNav endpoints from the environment (GROQ_API_KEY),
+which is the meaningful accuracy comparison.
+
+Run from the repo root:
+    python -m benchmarks.combined [--repeats 3] [--live]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import statistics
+import time
+
+from benchmarks.stub_server import StubServer
+
+PATIENTS = ["P001", "P002", "P003"]
+QUERIES = [
+    "Patient has high fever and chest infection. Recommend antibiotics.",
+    "Patient complains of severe headache and sensitivity to light. Recommend treatment.",
+    "Patient's HbA1c is elevated at 7.2. Need medication to control blood sugar.",
+]
+TOPOLOGIES = ("parallel", "combined")
+
+
+def verdict(result):
+    """"FLAGGED" when the rules found a conflict, else the review's SAFETY STATUS."""
+    if result.get("rule_warnings"):
+        return "FLAGGED"
+    match = re.search(r"SAFETY STATUS:\W*(\w+)", result.get("safety_check", ""))
+    return match.group(1).upper() if match else None
+
+
+def llm_counters(tracing):
+    """(calls, seconds, prompt tokens) recorded so far."""
+    snapshot = tracing.snapshot(recent=0)
+    llm = [h for name, h in snapshot["histograms"].items() if name.startswith("llm.")]
+    prompt = sum(c["value"] for c in snapshot["counters"] if c["metric"] == "llm_tokens" and c["kind"] == "prompt")
+    return sum(h["count"] for h in llm), sum(h["sum_s"] for h in llm), prompt
+
+
+def p50(samples):
+    return round(statistics.median(samples), 3) if samples else None
+
+
+def run(repeats, live, overhead_ms, decode_ms):
+    server = None
+    if not live:
+        server = StubServer(profile={"latency_ms": {"groq": overhead_ms},
+                                     "decode_ms_per_token": {"groq": decode_ms}}).start()
+        os.environ.update(server.env())
+    os.environ.update({"MEDP_CACHE_DIR": "off", "LLM_CACHE": "off"})
+
+    # Imported after the environment is set so the agents pick up the stub
+    import main
+    import pubmed_cache
+    import tracing
+    from drug_normalizer import get_normalizer
+
+    tracing.enable()
+    normalizer = get_normalizer()
+    graphs = {topology: main.build_graph(topology) for topology in TOPOLOGIES}
+    totals = {topology: {"latency": {"safe": [], "flagged": []}, "llm_calls": 0, "llm_s": 0.0,
+                         "prompt_tokens": 0, "runs": 0} for topology in TOPOLOGIES}
+    agree = {"verdict": 0, "warnings": 0, "drugs": 0}
+    try:
+        for patient_id in PATIENTS:
+            for query in QUERIES:
+                row = {"patient_id": patient_id, "query": query[:40]}
+                results = {}
+                for topology, graph in graphs.items():
+                    for _ in range(repeats):
+                        pubmed_cache.search_cache.clear()
+                        pubmed_cache.article_cache.clear()
+                        calls, llm_s, prompt = llm_counters(tracing)
+                        start = time.perf_counter()
+                        with contextlib.redirect_stdout(io.StringIO()):
+                            result = graph.invoke({"patient_id": patient_id, "user_query": query})
+                        elapsed = time.perf_counter() - start
+                        after_calls, after_llm_s, after_prompt = llm_counters(tracing)
+                        total = totals[topology]
+                        total["latency"]["flagged" if result.get("rule_warnings") else "safe"].append(elapsed)
+                        total["llm_calls"] += after_calls - calls
+                        total["llm_s"] += after_llm_s - llm_s
+                        total["prompt_tokens"] += after_prompt - prompt
+                        total["runs"] += 1
+                    results[topology] = result
+                    row[topology] = {"verdict": verdict(result), "llm_calls": after_calls - calls,
+                                     "drugs": sorted(set(normalizer.normalize(result["research_findings"])))}
+                two_call, combined = results["parallel"], results["combined"]
+                checks = {
+                    "verdict": verdict(two_call) == verdict(combined),
+                    "warnings": two_call.get("rule_warnings") == combined.get("rule_warnings"),
+                    "drugs": row["parallel"]["drugs"] == row["combined"]["drugs"],
+                }
+                for name, ok in checks.items():
+                    agree[name] += ok
+                row["agree"] = checks
+                print(json.dumps(row))
+
+        n_scenarios = len(PATIENTS) * len(QUERIES)
+        for topology, total in totals.items():
+            print(json.dumps({
+                "graph": topology,
+                "consultations": total["runs"],
+                "latency_p50_s": p50(total["latency"]["safe"] + total["latency"]["flagged"]),
+                "safe_p50_s": p50(total["latency"]["safe"]),
+                "flagged_p50_s": p50(total["latency"]["flagged"]),
+                "llm_s": round(total["llm_s"] / total["runs"], 3),
+                "llm_calls": round(total["llm_calls"] / total["runs"], 2),
+                "prompt_tokens": round(total["prompt_tokens"] / total["runs"]),
+            }))
+        print(json.dumps({"scenarios": n_scenarios,
+                          **{f"{name}_agreement": round(n / n_scenarios, 3) for name, n in agree.items()}}))
+    finally:
+        if server is not None:
+            server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--live", action="store_true", help="use the real services instead of the stubs")
+    parser.add_argument("--overhead-ms", type=float, default=600, help="stub Groq latency per call")
+    parser.add_argument("--decode-ms", type=float, default=8, help="stub Groq latency per completion token")
+    args = parser.parse_args()
+    run(args.repeats, args.live, args.overhead_ms, args.decode_ms)
@@ -0,0 +1,93 @@
+"""
+Drug name normalization and RxNav interaction lookup benchmark.
+
+Against the local stub services (benchmarks/stub_server.py, RxNav latency
+--rxnav-ms), for a consultation naming 8 drugs by brand / strength
+("Glycomet 500mg", "Dolo 650", "Warf 5mg", ...) it reports:
+
+    normalize      local brand/synonym -> generic resolution of the free-text
+                   recommendation plus the medication list
+    resolve_cold   RxCUIs with an empty RxCUI cache (names missing from
+                   drug_names.json go to RxNav once each)
+    resolve_warm   the same with the cache filled
+    per_drug       the old shape: one RxNav interaction call per drug
+    batched        check_drug_interactions_api: one call for all drugs
+
+Run from the repo root:
+    python -m benchmarks.drug_normalizer [--repeats 20] [--rxnav-ms 100]
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+from benchmarks.stub_server import StubServer
+
+RECOMMENDATION = ("**Clinical Recommendation:**\nDolo 650 QID as needed; Brufen 400mg TDS after food "
+                  "if no contraindication. Continue Glycomet 500mg BD.\n\n**Precautions:**\nAvoid NSAIDs "
+                  "with Warf; monitor INR.")
+MEDICATIONS = ["Glycomet 500mg", "Warf 5mg", "Listril 10mg", "Ecosprin 75", "Rosuvastatin 10mg", "Zolpidem 5mg"]
+
+
+def timed(fn, repeats, before=None):
+    samples = []
+    for _ in range(repeats):
+        if before:
+            before()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return round(statistics.median(samples) * 1000, 3)
+
+
+def run(repeats, rxnav_ms):
+    server = StubServer(profile={"latency_ms": {"rxnav": rxnav_ms}, "jitter": 0}).start()
+    os.environ.update(server.env())
+    os.environ["MEDP_CACHE_DIR"] = "off"
+
+    # Imported after the environment is set so the agents pick up the stub
+    import drug_normalizer
+    import http_client
+    import safety_agent
+
+    normalizer = drug_normalizer.get_normalizer()
+    state = {"research_findings": RECOMMENDATION, "patient_profile": {"medications": MEDICATIONS}}
+    drugs = safety_agent.consultation_drugs(state)
+    url = f"{safety_agent.RXNAV_URL}/interaction/list.json"
+
+    def per_drug():
+        for rxcui in safety_agent._rxcuis(normalizer.resolve(drugs)):
+            http_client.get(url, params={"rxcuis": rxcui}, label="rxnav")
+
+    try:
+        timed(lambda: http_client.get(url, params={"rxcuis": "1191"}), 2)  # Open the pooled connection
+        calls_before = server.requests.get("rxnav", 0)
+        safety_agent.check_drug_interactions_api(drugs)
+        batched_calls = server.requests["rxnav"] - calls_before
+        drug_normalizer.rxcui_cache.clear()
+
+        row = {
+            "drugs": drugs,
+            "rxcuis": normalizer.resolve(drugs),
+            "normalize_ms": timed(lambda: safety_agent.consultation_drugs(state), repeats),
+            "resolve_cold_ms": timed(lambda: normalizer.resolve(drugs), repeats,
+                                     before=drug_normalizer.rxcui_cache.clear),
+            "resolve_warm_ms": timed(lambda: normalizer.resolve(drugs), repeats),
+            "per_drug_ms": timed(per_drug, repeats),
+            "batched_ms": timed(lambda: safety_agent.check_drug_interactions_api(drugs), repeats),
+            "batched_rxnav_calls_cold_cache": batched_calls,
+            "warnings": safety_agent.rxnav_warnings(safety_agent.check_drug_interactions_api(drugs)),
+        }
+    finally:
+        server.stop()
+    print(json.dumps(row))
+    return row
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--rxnav-ms", type=float, default=100, help="stub RxNav latency")
+    args = parser.parse_args()
+    run(args.repeats, args.rxnav_ms)
@@ -0,0 +1,181 @@
+"""
+Evidence compaction benchmark: research prompt size and LLM latency with
+raw efetch XML cut at 2000 characters (the previous behaviour) vs. the
+token-budgeted, cited evidence block from evidence.py.
+
+For each demo scenario it builds both research prompts from the same
+PubMed payload and reports prompt tokens (~4 chars each), how many
+abstract sentences and PMIDs actually reach the prompt, compaction time,
+and the research completion latency (median of --repeats calls).
+
+By default the PubMed payload is synthetic but shaped like real efetch
+output (author lists, affiliations, journal and MeSH blocks, structured
+~250-word abstracts) and the LLM is the local stub with a prefill cost of
+--prefill-ms per 1k prompt tokens. With --live, PubMed and Groq are the
+services configured in the environment (GROQ_API_KEY etc.).
+
+Run from the repo root:
+    python -m benchmarks.evidence [--articles 3] [--repeats 5] [--prefill-ms 100] [--live]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import time
+from xml.sax.saxutils import escape
+
+from benchmarks.stub_server import StubServer
+
+SCENARIOS = [
+    ("P001", "Patient has high fever and chest infection. Recommend antibiotics."),
+    ("P002", "Patient complains of severe headache and sensitivity to light. Recommend treatment."),
+    ("P003", "Patient's HbA1c is elevated at 7.2. Need medication to control blood sugar."),
+]
+
+SECTIONS = {
+    "BACKGROUND": ["{topic} remains a leading cause of outpatient visits in India.",
+                   "Evidence on first-line therapy in resource-limited settings is limited.",
+                   "Antimicrobial resistance and comorbidities complicate management of {topic}."],
+    "METHODS": ["We conducted a multicentre retrospective cohort study across {n} tertiary hospitals.",
+                "Adults treated between 2015 and 2021 were included and followed for {days} days.",
+                "Outcomes were compared using propensity-score matching and Cox regression."],
+    "RESULTS": ["{drug} achieved clinical cure in {pct}% of patients with {topic}.",
+                "Patients with chronic kidney disease required dose adjustment of {drug} in {pct2}% of cases.",
+                "Adverse events were reported in {n}.{n2}% of {size} patients and were mostly mild.",
+                "Costs were lower with generic {drug} from Jan Aushadhi outlets."],
+    "CONCLUSIONS": ["{drug} is an effective first-line option for {topic} in Indian patients.",
+                    "Renal function should guide dosing in patients with kidney disease."],
+}
+TOPICS = {
+    "P001": ("community-acquired pneumonia with fever and chest infection", "Amoxicillin"),
+    "P002": ("migraine headache with light sensitivity", "Paracetamol"),
+    "P003": ("type 2 diabetes with elevated HbA1c and blood sugar", "Metformin"),
+}
+
+
+def synthetic_efetch(patient_id, n_articles, seed=0):
+    """An efetch-shaped PubmedArticleSet for the scenario's topic."""
+    rng = random.Random(seed)
+    topic, drug = TOPICS[patient_id]
+    articles = []
+    for i in range(n_articles):
+        pmid = 31_000_000 + rng.randrange(5_000_000)
+        authors = "".join(
+            f"<Author ValidYN=\"Y\"><LastName>Author{j}</LastName><ForeName>A</ForeName><Initials>A</Initials>"
+            f"<AffiliationInfo><Affiliation>Department of Medicine, Institute {j}, New Delhi, India."
+            f"</Affiliation></AffiliationInfo></Author>" for j in range(6))
+        # Study-specific numbers keep every article's sentences distinct
+        facts = {"topic": topic, "drug": drug, "n": rng.randrange(3, 20), "n2": rng.randrange(10),
+                 "pct": rng.randrange(60, 95), "pct2": rng.randrange(10, 40), "days": rng.choice([30, 60, 90]),
+                 "size": rng.randrange(200, 5000)}
+        abstract = "".join(
+            f"<AbstractText Label=\"{label}\" NlmCategory=\"{label}\">"
+            f"{escape(' '.join(s.format(**facts) for s in rng.sample(pool, len(pool))))}"
+            f"</AbstractText>" for label, pool in SECTIONS.items())
+        mesh = "".join(f"<MeshHeading><DescriptorName UI=\"D00{j}\" MajorTopicYN=\"N\">{name}</DescriptorName>"
+                       f"</MeshHeading>" for j, name in enumerate(["Humans", "India", "Adult", drug]))
+        articles.append(
+            f"<PubmedArticle><MedlineCitation Status=\"MEDLINE\" Owner=\"NLM\"><PMID Version=\"1\">{pmid}</PMID>"
+            f"<DateCompleted><Year>2022</Year><Month>01</Month><Day>15</Day></DateCompleted>"
+            f"<Article PubModel=\"Print\"><Journal><ISSN IssnType=\"Print\">0971-5916</ISSN>"
+            f"<JournalIssue CitedMedium=\"Print\"><Volume>15{i}</Volume><Issue>2</Issue><PubDate><Year>202{i % 4}"
+            f"</Year><Month>Feb</Month></PubDate></JournalIssue><Title>Indian Journal of Medical Research</Title>"
+            f"</Journal><ArticleTitle>{drug} outcomes in {topic}: study {i + 1}</ArticleTitle>"
+            f"<Pagination><MedlinePgn>101-110</MedlinePgn></Pagination><Abstract>{abstract}</Abstract>"
+            f"<AuthorList CompleteYN=\"Y\">{authors}</AuthorList><Language>eng</Language>"
+            f"<PublicationTypeList><PublicationType UI=\"D016428\">Journal Article</PublicationType>"
+            f"</PublicationTypeList></Article><MeshHeadingList>{mesh}</MeshHeadingList></MedlineCitation>"
+            f"<PubmedData><PublicationStatus>ppublish</PublicationStatus></PubmedData></PubmedArticle>")
+    return ('<?xml version="1.0" ?>\n<!DOCTYPE PubmedArticleSet PUBLIC "-//NLM//DTD PubMedArticle, '
+            '1st January 2024//EN" "https://dtd.nlm.nih.gov/ncbi/pubmed/out/pubmed_240101.dtd">\n'
+            f"<PubmedArticleSet>{''.join(articles)}</PubmedArticleSet>")
+
+
+def truncated_request(research_agent, query, profile, xml):
+    """The research request as built before compaction: raw XML cut at 2000 characters."""
+    compact = research_agent.compact_evidence
+    research_agent.compact_evidence = lambda payload, *args: payload[:2000] if payload else None
+    try:
+        return research_agent.build_research_request(query, profile, xml)
+    finally:
+        research_agent.compact_evidence = compact
+
+
+def prompt_stats(request, articles, evidence):
+    prompt = request["messages"][-1]["content"]
+    sentences = [text for article in articles for _, text in article["sentences"]]
+    return {
+        "prompt_tokens": evidence.estimate_tokens(prompt),
+        "abstract_sentences": len({s for s in sentences if s in prompt}),
+        "pmids": sum(1 for article in articles if article["pmid"] in prompt),
+    }
+
+
+def llm_latency(research_agent, request, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        research_agent.get_client().chat.completions.create(**request)
+        samples.append(time.perf_counter() - start)
+    return round(statistics.median(samples), 3)
+
+
+def run(n_articles, repeats, prefill_ms, live):
+    server = None
+    if not live:
+        server = StubServer(profile={"prefill_ms_per_1k_tokens": {"groq": prefill_ms}, "jitter": 0}).start()
+        os.environ.update(server.env())
+    os.environ["MEDP_CACHE_DIR"] = "off"
+
+    # Imported after the environment is set so the agents pick up the endpoints
+    import evidence
+    import personalization_agent
+    import research_agent
+
+    results = []
+    try:
+        for patient_id, query in SCENARIOS:
+            with contextlib.redirect_stdout(io.StringIO()):
+                profile = personalization_agent.personalization_node({"patient_id": patient_id})["patient_profile"]
+                if live:
+                    xml = research_agent.search_pubmed(research_agent.pubmed_search_term(query)) or ""
+                else:
+                    xml = synthetic_efetch(patient_id, n_articles)
+            articles = evidence.parse_articles(xml)
+
+            start = time.perf_counter()
+            compacted = evidence.compact_evidence(xml, query, profile.get("conditions", []))
+            compact_ms = (time.perf_counter() - start) * 1000
+
+            before = truncated_request(research_agent, query, profile, xml)
+            after = research_agent.build_research_request(query, profile, xml)
+            row = {
+                "patient_id": patient_id,
+                "articles": len(articles),
+                "xml_tokens": evidence.estimate_tokens(xml),
+                "evidence_tokens": evidence.estimate_tokens(compacted or ""),
+                "compact_ms": round(compact_ms, 3),
+                "before": {**prompt_stats(before, articles, evidence),
+                           "llm_s": llm_latency(research_agent, before, repeats)},
+                "after": {**prompt_stats(after, articles, evidence),
+                          "llm_s": llm_latency(research_agent, after, repeats)},
+            }
+            results.append(row)
+            print(json.dumps(row))
+    finally:
+        if server is not None:
+            server.stop()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--articles", type=int, default=3, help="synthetic articles per search")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--prefill-ms", type=float, default=100, help="stub LLM delay per 1k prompt tokens")
+    parser.add_argument("--live", action="store_true", help="use the PubMed / Groq endpoints from the environment")
+    args = parser.parse_args()
+    run(args.articles, args.repeats, args.prefill_ms, args.live)
@@ -0,0 +1,101 @@
+"""
+Guideline retrieval index benchmark.
+
+Builds BM25 indexes over synthetic guideline passages (~60 words each) at
+10k and 1M chunks and reports build time, save time, memory-mapped load time
+and query latency percentiles.
+
+Word frequencies follow a Zipf law like real text: the most frequent ranks
+are function words (dropped by the tokenizer, as in a real corpus) and the
+clinical terms that queries use sit in the mid-frequency band.
+
+Run from the repo root:
+    python -m benchmarks.guideline_index [--sizes 10000 1000000] [--queries 200]
+"""
+import argparse
+import json
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from guideline_index import STOPWORDS, GuidelineIndex
+
+CLINICAL_TERMS = ("fever cough pneumonia amoxicillin azithromycin levofloxacin renal failure diabetes "
+                  "metformin hba1c egfr kidney disease hypertension amlodipine migraine paracetamol "
+                  "ibuprofen tramadol ulcer asthma salbutamol warfarin bleeding dose adjustment").split()
+
+
+def synthetic_documents(n_chunks, words_per_chunk=60, vocab_size=50_000, seed=0):
+    """Yield (title, [passages]) with 10 passages per document."""
+    rng = np.random.default_rng(seed)
+    head = sorted(STOPWORDS)
+    fillers = [f"term{i}" for i in range(vocab_size - len(head) - len(CLINICAL_TERMS))]
+    # Clinical terms at ranks spread over the mid band, after the function words
+    vocab = head + fillers
+    for i, term in enumerate(CLINICAL_TERMS):
+        vocab.insert(len(head) + 20 + i * 40, term)
+    vocab = np.array(vocab)
+    ranks = np.minimum(rng.zipf(1.3, size=n_chunks * words_per_chunk) - 1, vocab_size - 1)
+    words = vocab[ranks].reshape(n_chunks, words_per_chunk)
+    for doc in range(0, n_chunks, 10):
+        yield f"Synthetic guideline {doc // 10}", [" ".join(row) for row in words[doc:doc + 10]]
+
+
+def random_queries(n, seed=1):
+    rng = np.random.default_rng(seed)
+    return [" ".join(rng.choice(CLINICAL_TERMS, size=rng.integers(3, 8), replace=False)) for _ in range(n)]
+
+
+def run(sizes, n_queries):
+    results = []
+    for size in sizes:
+        documents = list(synthetic_documents(size))
+
+        start = time.perf_counter()
+        index = GuidelineIndex.build(documents)
+        build_s = time.perf_counter() - start
+        del documents
+
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            index.save(directory)
+            save_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            loaded = GuidelineIndex.load(directory)
+            load_s = time.perf_counter() - start
+
+            queries = random_queries(n_queries)
+            loaded.search(queries[0], k=5)  # Fault in the pages a query touches
+            samples = []
+            for query in queries:
+                start = time.perf_counter()
+                loaded.search(query, k=5)
+                samples.append(time.perf_counter() - start)
+            samples.sort()
+
+            row = {
+                "chunks": size,
+                "terms": len(index.vocab),
+                "postings": int(index.indptr[-1]),
+                "build_s": round(build_s, 3),
+                "save_s": round(save_s, 3),
+                "mmap_load_s": round(load_s, 4),
+                "query_p50_ms": round(statistics.median(samples) * 1000, 3),
+                "query_p95_ms": round(samples[int(len(samples) * 0.95) - 1] * 1000, 3),
+            }
+            del loaded
+        del index
+        results.append(row)
+        print(json.dumps(row))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    run(args.sizes, args.queries)
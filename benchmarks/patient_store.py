@@ -0,0 +1,112 @@
+"""
+Patient store lookup benchmark.
+
+Compares the old per-request `json.load` of the whole database with the
+indexed JSONL store at 1k, 100k and 1M synthetic patients.
+
+Run from the repo root:
+    python -m benchmarks.patient_store [--sizes 1000 100000 1000000]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from patient_store import PatientStore
+
+CONDITIONS = ["Hypertension", "Type 2 Diabetes", "Chronic Kidney Disease (Stage 3)",
+              "Asthma", "Migraine", "Peptic Ulcer", "Arrhythmia"]
+MEDICATIONS = ["Lisinopril", "Amlodipine", "Metformin", "Warfarin", "Naproxen", "Aspirin"]
+ALLERGIES = ["Penicillin", "Sulfa Drugs", "Ibuprofen"]
+
+
+def synthetic_patient(i, rng):
+    return {
+        "id": f"P{i:07d}",
+        "name": f"Patient {i}",
+        "age": rng.randint(18, 90),
+        "gender": rng.choice(["Male", "Female"]),
+        "conditions": rng.sample(CONDITIONS, rng.randint(0, 3)),
+        "medications": rng.sample(MEDICATIONS, rng.randint(0, 3)),
+        "allergies": rng.sample(ALLERGIES, rng.randint(0, 1)),
+        "vitals": {"creatinine": round(rng.uniform(0.6, 3.0), 1), "eGFR": rng.randint(15, 120)},
+        "recent_labs": "Synthetic record.",
+    }
+
+
+def write_databases(directory, size, seed=0):
+    rng = random.Random(seed)
+    jsonl_path = os.path.join(directory, f"patients_{size}.jsonl")
+    json_path = os.path.join(directory, f"patients_{size}.json")
+    with open(jsonl_path, "w") as jsonl, open(json_path, "w") as legacy:
+        legacy.write("{")
+        for i in range(size):
+            line = json.dumps(synthetic_patient(i, rng), separators=(",", ":"))
+            jsonl.write(line + "\n")
+            legacy.write(("," if i else "") + json.dumps(f"P{i:07d}") + ":" + line)
+        legacy.write("}")
+    return json_path, jsonl_path
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def time_lookups(lookup, ids, n):
+    samples = []
+    for patient_id in random.Random(1).choices(ids, k=n):
+        start = time.perf_counter()
+        lookup(patient_id)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def run(sizes, lookups, legacy_lookups):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            json_path, jsonl_path = write_databases(tmp, size)
+            ids = [f"P{i:07d}" for i in range(size)]
+
+            start = time.perf_counter()
+            PatientStore(jsonl_path).refresh()
+            build_s = time.perf_counter() - start
+
+            # A fresh process: the index comes from the sidecar
+            store = PatientStore(jsonl_path)
+            start = time.perf_counter()
+            store.refresh()
+            load_s = time.perf_counter() - start
+            indexed = time_lookups(store.get, ids, lookups)
+
+            def legacy_lookup(patient_id):
+                with open(json_path, "r") as f:
+                    return json.load(f).get(patient_id)
+
+            legacy = time_lookups(legacy_lookup, ids, legacy_lookups)
+
+            row = {
+                "patients": size,
+                "index_build_s": round(build_s, 3),
+                "index_load_s": round(load_s, 3),
+                "indexed_p50_us": round(statistics.median(indexed), 1),
+                "indexed_p99_us": round(percentile(indexed, 99), 1),
+                "legacy_p50_us": round(statistics.median(legacy), 1),
+            }
+            results.append(row)
+            print(json.dumps(row))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--lookups", type=int, default=10_000)
+    parser.add_argument("--legacy-lookups", type=int, default=3,
+                        help="full-file json.load lookups per size (slow at 1M)")
+    args = parser.parse_args()
+    run(args.sizes, args.lookups, args.legacy_lookups)
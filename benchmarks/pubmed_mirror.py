@@ -0,0 +1,138 @@
+"""
+Local PubMed mirror benchmark.
+
+Writes synthetic baseline files (PubmedArticleSet XML, gzipped, 30k
+articles each like the real pubmed*n*.xml.gz files) plus one daily update
+file that revises and deletes citations, then reports ingest throughput,
+peak Python heap while ingesting one file (vs its XML size), incremental update time and search latency
+percentiles against the finished mirror.
+
+Abstracts are ~150 words drawn from a Zipf vocabulary with clinical terms
+in the mid-frequency band, so FTS5 posting lists have realistic lengths.
+
+Run from the repo root:
+    python -m benchmarks.pubmed_mirror [--articles 300000] [--queries 200]
+"""
+import argparse
+import gzip
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+import pubmed_mirror
+from benchmarks.guideline_index import CLINICAL_TERMS
+
+FILE_ARTICLES = 30_000
+MESH_TERMS = ["Diabetes Mellitus, Type 2", "Metformin", "Pneumonia", "Anti-Bacterial Agents",
+              "Hypertension", "Renal Insufficiency, Chronic", "Migraine Disorders", "India", "Humans"]
+
+
+def synthetic_vocabulary(vocab_size=80_000):
+    vocab = ["the", "of", "and", "in", "with", "to", "a", "for", "was", "were"]
+    vocab += [f"term{i}" for i in range(vocab_size)]
+    for i, term in enumerate(CLINICAL_TERMS):
+        vocab.insert(30 + i * 60, term)
+    return np.array(vocab)
+
+
+VOCABULARY = synthetic_vocabulary()
+
+
+def article_xml(pmid, title, abstract, mesh):
+    headings = "".join(f"<MeshHeading><DescriptorName>{escape(m)}</DescriptorName></MeshHeading>" for m in mesh)
+    return (f"<PubmedArticle><MedlineCitation Status=\"MEDLINE\"><PMID Version=\"1\">{pmid}</PMID>"
+            f"<Article><ArticleTitle>{escape(title)}</ArticleTitle><Abstract>"
+            f"<AbstractText Label=\"BACKGROUND\">{escape(abstract)}</AbstractText></Abstract></Article>"
+            f"<MeshHeadingList>{headings}</MeshHeadingList></MedlineCitation></PubmedArticle>\n")
+
+
+def write_file(path, pmids, rng, deletions=()):
+    pmids = list(pmids)
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=1) as f:
+        f.write("<?xml version=\"1.0\"?>\n<PubmedArticleSet>\n")
+        for block in range(0, len(pmids), 1000):  # Small blocks keep the generator's memory flat
+            ranks = np.minimum(rng.zipf(1.3, size=(len(pmids[block:block + 1000]), 162)) - 1, len(VOCABULARY) - 1)
+            for pmid, row in zip(pmids[block:block + 1000], VOCABULARY[ranks]):
+                mesh = rng.choice(MESH_TERMS, size=3, replace=False)
+                f.write(article_xml(pmid, " ".join(row[:12]), " ".join(row[12:]), mesh))
+        if len(deletions):
+            f.write("<DeleteCitation>" + "".join(f"<PMID Version=\"1\">{p}</PMID>" for p in deletions)
+                    + "</DeleteCitation>\n")
+        f.write("</PubmedArticleSet>\n")
+
+
+def ingest_peak_mb(path, directory):
+    """Peak Python heap while ingesting one file into a scratch mirror."""
+    tracemalloc.start()
+    pubmed_mirror.ingest(os.path.join(directory, "scratch.db"), [path])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+def run(n_articles, n_queries):
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for i, first in enumerate(range(1, n_articles + 1, FILE_ARTICLES)):
+            path = os.path.join(directory, f"pubmed00n{i + 1:04d}.xml.gz")
+            write_file(path, range(first, min(first + FILE_ARTICLES, n_articles + 1)), rng)
+            paths.append(path)
+        revised = rng.choice(np.arange(1, n_articles + 1), size=2_000, replace=False)
+        update = os.path.join(directory, "pubmed00n9001.xml.gz")
+        write_file(update, revised[:1_000], rng, deletions=revised[1_000:])
+        xml_mb = sum(os.path.getsize(p) for p in paths) / 2 ** 20
+
+        db = os.path.join(directory, "pubmed.db")
+        start = time.perf_counter()
+        pubmed_mirror.ingest(db, paths)
+        ingest_s = time.perf_counter() - start
+        with gzip.open(paths[0]) as f:
+            file_mb = len(f.read()) / 2 ** 20
+        peak_mb = ingest_peak_mb(paths[0], directory)
+
+        start = time.perf_counter()
+        pubmed_mirror.ingest(db, paths + [update])  # Baseline files are skipped
+        update_s = time.perf_counter() - start
+
+        mirror = pubmed_mirror.PubMedMirror(db)
+        queries = [" ".join(rng.choice(CLINICAL_TERMS, size=rng.integers(2, 5), replace=False))
+                   + " India guidelines treatment" for _ in range(n_queries)]
+        mirror.search_articles(queries[0])  # Open the connection, fault in the index root pages
+        samples = []
+        for query in queries:
+            start = time.perf_counter()
+            mirror.search_articles(query, 3)
+            samples.append(time.perf_counter() - start)
+        samples.sort()
+
+        row = {
+            "articles": n_articles,
+            "files": len(paths),
+            "gz_xml_mb": round(xml_mb, 1),
+            "db_mb": round(os.path.getsize(db) / 2 ** 20, 1),
+            "ingest_s": round(ingest_s, 2),
+            "ingest_articles_per_s": round(n_articles / ingest_s),
+            "file_xml_mb": round(file_mb, 1),
+            "file_ingest_peak_heap_mb": round(peak_mb, 1),
+            "update_file_s": round(update_s, 3),
+            "articles_after_update": mirror.stats()["articles"],
+            "search_p50_ms": round(statistics.median(samples) * 1000, 3),
+            "search_p95_ms": round(samples[int(len(samples) * 0.95) - 1] * 1000, 3),
+        }
+    print(json.dumps(row))
+    return row
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--articles", type=int, default=300_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    run(args.articles, args.queries)
@@ -0,0 +1,133 @@
+"""
+Safety rule check benchmark.
+
+Compares the original nested substring loops from safety_agent.py with the
+compiled RuleEngine at 10, 1k and 20k rules, and checks that both produce
+the same warnings on every case (the engine's symmetric interaction check
+may add interaction warnings the legacy loops missed).
+
+Run from the repo root:
+    python -m benchmarks.rule_engine [--rules 10 1000 20000]
+"""
+import argparse
+import json
+import random
+import re
+import statistics
+import string
+import time
+
+from rule_engine import RuleEngine
+
+LEGACY_INTERACTION = re.compile(r"INTERACTION: (.+) interacts with (.+)\.$")
+FILLER = ("based on icmr guidelines start therapy with the following dose twice "
+          "daily after food monitor renal function and review in two weeks").split()
+
+
+def legacy_check(proposed_treatment_text, patient_profile, contraindications, interactions):
+    """The rule loops as they were in safety_agent_node before the rule engine."""
+    patient_conditions = patient_profile.get("conditions", [])
+    patient_allergies = patient_profile.get("allergies", [])
+    current_meds = patient_profile.get("medications", [])
+    warnings = []
+    proposed_lower = proposed_treatment_text.lower()
+
+    for drug in contraindications.keys():
+        if drug in proposed_lower:
+            if any(drug in allergy.lower() for allergy in patient_allergies):
+                warnings.append(f"CRITICAL: Patient is allergic to {drug.upper()}.")
+
+    for drug, info in contraindications.items():
+        if drug in proposed_lower:
+            conflicts = info["condition_conflict"]
+            for condition in patient_conditions:
+                if any(c.lower() in condition.lower() for c in conflicts):
+                    warnings.append(f"CONTRAINDICATION: {drug.upper()} + {condition}. {info['reason']}")
+
+    for drug, interacting_drugs in interactions.items():
+        if drug in proposed_lower:
+            for med in current_meds:
+                if any(interacting in med.lower() for interacting in interacting_drugs):
+                    warnings.append(f"INTERACTION: {drug.upper()} interacts with {med}.")
+
+    return warnings
+
+
+def matches_legacy(warnings, expected):
+    """
+    Allergy and contraindication warnings must be identical. Interactions are
+    now symmetric and include current-vs-current pairs, so every legacy
+    interaction pair must be reported (in whichever wording) and more may be.
+    """
+    legacy_rules = [w for w in expected if not w.startswith("INTERACTION")]
+    rules = [w for w in warnings if not w.startswith("INTERACTION")]
+    interactions = [w.lower() for w in warnings if w.startswith("INTERACTION")]
+    pairs = [LEGACY_INTERACTION.match(w).groups() for w in expected if w.startswith("INTERACTION")]
+    return rules == legacy_rules and all(
+        any(drug.lower() in w and med.lower() in w for w in interactions) for drug, med in pairs)
+
+
+def word(rng, length=9):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def synthetic_tables(n_rules, rng):
+    drugs = [word(rng) for _ in range(n_rules)]
+    condition_pool = [f"{word(rng, 7)} {word(rng, 6)}" for _ in range(max(10, n_rules // 10))]
+    contraindications = {
+        drug: {"condition_conflict": rng.sample(condition_pool, 3), "reason": "Synthetic rule."}
+        for drug in drugs
+    }
+    interactions = {drug: rng.sample([d for d in drugs if d != drug], 2)
+                    for drug in rng.sample(drugs, max(1, n_rules // 2))}
+    return drugs, condition_pool, contraindications, interactions
+
+
+def synthetic_case(drugs, condition_pool, rng):
+    words = rng.choices(FILLER, k=120) + rng.sample(drugs, min(3, len(drugs)))
+    rng.shuffle(words)
+    profile = {
+        "conditions": [f"Chronic {c.title()} (Stage 2)" for c in rng.sample(condition_pool, 3)],
+        "allergies": [rng.choice(drugs).title()],
+        "medications": [f"{d.title()} 50mg" for d in rng.sample(drugs, 4)],
+    }
+    return " ".join(words), profile
+
+
+def run(rule_counts, cases):
+    rng = random.Random(0)
+    for n_rules in rule_counts:
+        drugs, condition_pool, contraindications, interactions = synthetic_tables(n_rules, rng)
+
+        start = time.perf_counter()
+        engine = RuleEngine(contraindications, interactions)
+        compile_s = time.perf_counter() - start
+
+        workload = [synthetic_case(drugs, condition_pool, rng) for _ in range(cases)]
+        legacy_us, engine_us, mismatches = [], [], 0
+        for text, profile in workload:
+            start = time.perf_counter()
+            expected = legacy_check(text, profile, contraindications, interactions)
+            legacy_us.append((time.perf_counter() - start) * 1e6)
+
+            start = time.perf_counter()
+            warnings, _ = engine.check(text, profile)
+            engine_us.append((time.perf_counter() - start) * 1e6)
+            mismatches += not matches_legacy(warnings, expected)
+
+        print(json.dumps({
+            "rules": n_rules,
+            "compile_s": round(compile_s, 3),
+            "legacy_p50_us": round(statistics.median(legacy_us), 1),
+            "engine_p50_us": round(statistics.median(engine_us), 1),
+            "speedup": round(statistics.median(legacy_us) / statistics.median(engine_us), 1),
+            "mismatches": mismatches,
+        }))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rules", type=int, nargs="+", default=[10, 1_000, 20_000])
+    parser.add_argument("--cases", type=int, default=200)
+    args = parser.parse_args()
+    run(args.rules, args.cases)
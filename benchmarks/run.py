@@ -0,0 +1,324 @@
+"""
+Offline benchmark harness.
+
+Starts the local stand-ins for Groq, PubMed E-utilities and RxNav
+(benchmarks/stub_server.py, in a separate process) with a named latency /
+error-rate profile, then drives the compiled graphs and the individual
+nodes through these scenarios:
+
+    nodes        median latency of each node called directly
+    throughput   N consultations at a fixed concurrency (threads and async)
+    sweep        throughput and latency percentiles across concurrency levels
+    cold_start   fresh interpreter: import time and first consultation
+
+Caches are disabled and every consultation uses a distinct query, so each
+run pays for the full PubMed and LLM round trips. Results are written as
+JSON together with the git commit, so runs can be compared across commits:
+
+    python -m benchmarks.run [--profile realistic] [--scenarios nodes throughput]
+    python -m benchmarks.run --compare benchmarks/results/OLD.json benchmarks/results/NEW.json
+
+Run from the repo root. No network access or API key is needed.
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.stub_server import StubProcess
+
+PROFILES = {
+    # Near-zero service latency: measures the pipeline's own overhead
+    "fast": {"latency_ms": {"esearch": 1, "efetch": 1, "rxnav": 1, "groq": 5}, "ttft_ms": {"groq": 1}},
+    # Roughly what the live services look like from India
+    "realistic": {},
+    # Slow and flaky upstreams: exercises retries and backoff
+    "degraded": {"latency_ms": {"esearch": 600, "efetch": 900, "rxnav": 400, "groq": 2500},
+                 "error_rate": {"esearch": 0.1, "efetch": 0.1, "rxnav": 0.1, "groq": 0.05},
+                 "jitter": 0.5},
+    # PubMed down: exercises the circuit breaker and local fallbacks
+    "pubmed_outage": {"error_rate": {"esearch": 1.0, "efetch": 1.0}},
+}
+
+SCENARIOS = ("nodes", "throughput", "sweep", "cold_start")
+
+PATIENTS = ["P001", "P002", "P003"]
+QUERIES = [
+    "Patient has high fever and chest infection. Recommend antibiotics.",
+    "Patient complains of severe headache and sensitivity to light. Recommend treatment.",
+    "Patient's HbA1c is elevated at 7.2. Need medication to control blood sugar.",
+]
+
+COLD_START_CHILD = """
+import contextlib, io, json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    main.app.invoke({"patient_id": "P001", "user_query": %r})
+done = time.perf_counter()
+print(json.dumps({"import_s": imported - start, "first_request_s": done - imported}))
+"""
+
+
+def cases(n, tag):
+    """n distinct consultations (distinct queries defeat the PubMed cache)."""
+    return [{"patient_id": PATIENTS[i % 3], "user_query": f"{QUERIES[i % 3]} [{tag}-{i}]"}
+            for i in range(n)]
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    pick = lambda pct: ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+    return {
+        "p50_s": round(statistics.median(ordered), 4),
+        "p95_s": round(pick(95), 4),
+        "p99_s": round(pick(99), 4),
+        "mean_s": round(statistics.fmean(ordered), 4),
+    }
+
+
+def git_commit():
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        **git_commit(),
+    }
+
+
+# ==========================================
+# SCENARIOS
+# ==========================================
+def bench_nodes(repeats):
+    """Each node called directly on a realistic state, `repeats` times."""
+    import personalization_agent
+    import research_agent
+    import safety_agent
+
+    base = {"patient_id": "P001", "user_query": QUERIES[0]}
+    state = dict(base)
+    state.update(personalization_agent.personalization_node(state))
+    state.update(research_agent.retrieval_node(state))
+    state.update(research_agent.research_node(state))
+    state.update(safety_agent.rule_check_node(state))
+
+    nodes = {
+        "personalize": (personalization_agent.personalization_node, lambda i: base),
+        "retrieve": (research_agent.retrieval_node,
+                     lambda i: {**state, "user_query": f"{QUERIES[0]} [node-{i}]"}),
+        "research": (research_agent.research_node, lambda i: state),
+        "rule_check": (safety_agent.rule_check_node, lambda i: state),
+        "safety": (safety_agent.safety_agent_node, lambda i: state),
+    }
+    results = {}
+    for name, (node, make_state) in nodes.items():
+        samples = []
+        for i in range(repeats):
+            inputs = make_state(i)
+            start = time.perf_counter()
+            node(inputs)
+            samples.append(time.perf_counter() - start)
+        results[name] = percentiles(samples)
+    return results
+
+
+def run_threads(app, work, concurrency):
+    def one(inputs):
+        start = time.perf_counter()
+        try:
+            app.invoke(inputs)
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, type(e).__name__
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, work))
+    return time.perf_counter() - start, outcomes
+
+
+def run_async(async_app, work, concurrency):
+    import http_client
+
+    async def main():
+        limit = asyncio.Semaphore(concurrency)
+
+        async def one(inputs):
+            async with limit:
+                start = time.perf_counter()
+                try:
+                    await async_app.ainvoke(inputs)
+                    return time.perf_counter() - start, None
+                except Exception as e:
+                    return time.perf_counter() - start, type(e).__name__
+
+        try:
+            return await asyncio.gather(*(one(inputs) for inputs in work))
+        finally:
+            await http_client.aclose()
+
+    start = time.perf_counter()
+    outcomes = asyncio.run(main())
+    return time.perf_counter() - start, outcomes
+
+
+def load_point(mode, concurrency, requests, tag):
+    import main
+
+    work = cases(requests, tag)
+    if mode == "threads":
+        elapsed, outcomes = run_threads(main.app, work, concurrency)
+    else:
+        elapsed, outcomes = run_async(main.async_app, work, concurrency)
+    errors = [error for _, error in outcomes if error]
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": len(errors),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(requests / elapsed, 2),
+        **percentiles([latency for latency, _ in outcomes]),
+    }
+
+
+def bench_throughput(requests, concurrency):
+    return [load_point(mode, concurrency, requests, f"tp-{mode}") for mode in ("threads", "async")]
+
+
+def bench_sweep(levels, per_level):
+    return [load_point(mode, level, level * per_level, f"sw-{mode}-{level}")
+            for level in levels for mode in ("threads", "async")]
+
+
+def bench_cold_start(repeats, env):
+    samples = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", COLD_START_CHILD % f"{QUERIES[0]} [cold-{i}]"],
+                             capture_output=True, text=True, env=env, check=True).stdout
+        total = time.perf_counter() - start
+        child = json.loads(out.strip().splitlines()[-1])
+        samples.append({"process_s": total, **child})
+    return {key: percentiles([s[key] for s in samples]) for key in ("process_s", "import_s", "first_request_s")}
+
+
+# ==========================================
+# DRIVER
+# ==========================================
+def run(args):
+    profile = dict(PROFILES[args.profile])
+    if args.profile_json:
+        profile.update(json.loads(args.profile_json))
+
+    server = StubProcess(profile=profile).start()
+    env = {
+        **server.env(),
+        "MEDP_CACHE_DIR": "off",
+        "LLM_CACHE": "off",
+        "HTTP_POOL_SIZE": str(max(args.levels + [args.concurrency])),
+    }
+    os.environ.update(env)
+
+    results = {"environment": environment(), "profile": {"name": args.profile, **profile}, "scenarios": {}}
+    scenarios = results["scenarios"]
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            if "cold_start" in args.scenarios:
+                # Before anything is imported here, so the page cache is the only warm thing
+                scenarios["cold_start"] = bench_cold_start(args.repeats, dict(os.environ))
+            if "nodes" in args.scenarios:
+                scenarios["nodes"] = bench_nodes(args.repeats)
+            if "throughput" in args.scenarios:
+                scenarios["throughput"] = bench_throughput(args.requests, args.concurrency)
+            if "sweep" in args.scenarios:
+                scenarios["sweep"] = bench_sweep(args.levels, args.per_level)
+    finally:
+        server.stop()
+    return results
+
+
+def flatten(results):
+    """{metric path: value} for every numeric leaf, for comparing runs."""
+    flat = {}
+
+    def walk(prefix, value):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                walk(f"{prefix}.{key}" if prefix else key, item)
+        elif isinstance(value, list):
+            for item in value:
+                walk(f"{prefix}[{item.get('mode')}@{item.get('concurrency')}]", item)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix] = value
+
+    walk("", results["scenarios"])
+    return flat
+
+
+def compare(old_path, new_path):
+    """Print every metric of two result files side by side with the ratio."""
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"old: {old['environment'].get('commit')}  profile={old['profile']['name']}")
+    print(f"new: {new['environment'].get('commit')}  profile={new['profile']['name']}")
+    old_flat, new_flat = flatten(old), flatten(new)
+    for metric in sorted(old_flat.keys() & new_flat.keys()):
+        before, after = old_flat[metric], new_flat[metric]
+        ratio = f"{after / before:6.2f}x" if before else "     -"
+        print(f"{metric:60} {before:>10} -> {after:<10} {ratio}")
+
+
+def default_output(results):
+    commit = (results["environment"].get("commit") or "unknown")[:10]
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    return os.path.join("benchmarks", "results", f"{stamp}-{commit}-{results['profile']['name']}.json")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="realistic")
+    parser.add_argument("--profile-json", help="extra stub profile overrides as JSON")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--repeats", type=int, default=5, help="samples for nodes / cold_start")
+    parser.add_argument("--requests", type=int, default=60, help="consultations in the throughput run")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrency of the throughput run")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 4, 16, 64], help="sweep levels")
+    parser.add_argument("--per-level", type=int, default=2, help="sweep requests per concurrency slot")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<time>-<commit>-<profile>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+
+    results = run(args)
+    output = args.output or default_output(results)
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results["scenarios"], indent=2))
+    print(f"Results written to {output}", file=sys.stderr)
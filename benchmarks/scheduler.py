@@ -0,0 +1,142 @@
+"""
+Outbound call scheduler benchmark.
+
+Runs bursts of external calls against the local stub services
+(benchmarks/stub_server.py), with the scheduler on and off
+(scheduler.ENABLED), and reports:
+
+    rate_limit     --searches concurrent PubMed searches against a stub that
+                   allows 10 requests/s for E-utilities (NCBI's limit with an
+                   API key) and answers 429 above it: wall time, failed
+                   searches, requests sent and 429s received. Without the
+                   scheduler the burst is rejected, retried into further 429s
+                   and trips the circuit breaker
+    priority       --batch batch-priority completions queued on a Groq limit
+                   of 2 in flight, then one more call at "urgent" (or
+                   "batch", i.e. first come first served): its latency
+                   against the batch median
+    coalescing     --duplicates identical completions issued at once: Groq
+                   requests made and wall time
+
+Run from the repo root:
+    python -m benchmarks.scheduler [--searches 30] [--batch 16] [--duplicates 20]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.stub_server import StubServer
+
+NCBI_RATE = 10
+
+
+def completion_request(text):
+    return {"model": "llama-3.3-70b-versatile", "temperature": 0.2, "max_tokens": 400,
+            "messages": [{"role": "system", "content": "You are a clinical research assistant."},
+                         {"role": "user", "content": f"CLINICAL QUERY: {text}"}]}
+
+
+def delta(server, before):
+    return {k: v - before.get(k, 0) for k, v in server.requests.items() if v - before.get(k, 0)}
+
+
+def run(n_searches, n_batch, n_duplicates):
+    server = StubServer(profile={"rate_limit": {"ncbi": NCBI_RATE}, "latency_ms": {"groq": 900}}).start()
+    os.environ.update(server.env())
+    os.environ.update({"MEDP_CACHE_DIR": "off", "LLM_CACHE": "off",
+                       "SCHED_NCBI_RATE": str(NCBI_RATE), "SCHED_NCBI_CONCURRENCY": "3",
+                       "SCHED_GROQ_CONCURRENCY": "2"})
+
+    # Imported after the environment is set so the agents pick up the stub
+    import http_client
+    import llm_cache
+    import research_agent
+    import scheduler
+    from llm_client import get_client
+
+    def configure(enabled):
+        scheduler.ENABLED = enabled
+        scheduler.reset()
+        http_client._breakers.clear()
+
+    try:
+        for enabled in (False, True):
+            configure(enabled)
+            time.sleep(1)  # Refill the stub's rate limit
+            before = dict(server.requests)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(n_searches) as pool:
+                results = list(pool.map(research_agent.search_pubmed,
+                                        [f"fever case {enabled} {i}" for i in range(n_searches)]))
+            calls = delta(server, before)
+            print(json.dumps({
+                "scenario": "rate_limit",
+                "scheduler": enabled,
+                "searches": n_searches,
+                "wall_s": round(time.perf_counter() - start, 2),
+                "failed": sum(r is None for r in results),
+                "requests": calls.get("esearch", 0) + calls.get("efetch", 0),
+                "429s": calls.get("esearch_429", 0) + calls.get("efetch_429", 0),
+            }))
+
+        configure(True)
+        client = get_client()
+        for level in ("batch", "urgent"):
+            batch_latency = []
+
+            def batch_call(i):
+                with scheduler.priority("batch"):
+                    start = time.perf_counter()
+                    llm_cache.complete(client, completion_request(f"batch {level} {i}"))
+                    batch_latency.append(time.perf_counter() - start)
+
+            threads = [threading.Thread(target=batch_call, args=(i,)) for i in range(n_batch)]
+            for thread in threads:
+                thread.start()
+            time.sleep(0.2)  # Let the batch fill the queue
+            with scheduler.priority(level):
+                start = time.perf_counter()
+                llm_cache.complete(client, completion_request(f"late {level}"))
+                late_s = time.perf_counter() - start
+            for thread in threads:
+                thread.join()
+            print(json.dumps({
+                "scenario": "priority",
+                "late_call": level,
+                "batch_calls": n_batch,
+                "late_s": round(late_s, 2),
+                "batch_p50_s": round(statistics.median(batch_latency), 2),
+            }))
+
+        for enabled in (False, True):
+            configure(enabled)
+            before = dict(server.requests)
+            request = completion_request(f"duplicate {enabled}")
+            start = time.perf_counter()
+            with ThreadPoolExecutor(n_duplicates) as pool:
+                answers = list(pool.map(lambda _: llm_cache.complete(client, request), range(n_duplicates)))
+            print(json.dumps({
+                "scenario": "coalescing",
+                "scheduler": enabled,
+                "calls": n_duplicates,
+                "groq_requests": delta(server, before).get("groq", 0),
+                "wall_s": round(time.perf_counter() - start, 2),
+                "same_answer": len(set(answers)) == 1,
+            }))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--searches", type=int, default=30)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--duplicates", type=int, default=20)
+    args = parser.parse_args()
+    run(args.searches, args.batch, args.duplicates)
@@ -0,0 +1,191 @@
+"""
+Consultation server load test.
+
+Starts the local stand-ins for Groq, PubMed and RxNav
+(benchmarks/stub_server.py, in a separate process), then server.py with
+each --workers count in turn, and drives POST /consult from a closed-loop
+client (--concurrency requests in flight, distinct queries, caches off):
+
+    scaling      --requests consultations per worker count: throughput,
+                 p50 / p95 latency, shed (503) and failed requests,
+                 throughput relative to one worker, and the memory each
+                 worker does not share with the others (private_mb, from
+                 /proc smaps_rollup). With the "fast" stub profile a
+                 consultation is mostly the pipeline's own CPU time, so
+                 throughput should grow with workers up to the number of
+                 cores (reported as "cpus"; the client shares them with
+                 the server)
+    overload     the largest worker count with --overload-concurrency
+                 clients against a deliberately small queue: how many
+                 requests are shed, how fast a 503 comes back, and the
+                 latency of the ones admitted
+
+--patients N serves a synthetic N-patient JSONL database
+(benchmarks/patient_store.py) instead of the demo patients.json, so the
+memory-mapped patient index is part of what the workers share.
+
+Run from the repo root:
+    python -m benchmarks.server [--workers 1 2 4] [--requests 600] [--profile fast] [--patients 1000000]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.patient_store import write_databases
+from benchmarks.stub_server import StubProcess
+
+PROFILES = {
+    # Near-zero service latency: throughput is bounded by the pipeline's CPU time
+    "fast": {"latency_ms": {"esearch": 1, "efetch": 1, "rxnav": 1, "groq": 5}, "ttft_ms": {"groq": 1}},
+    # Roughly the live services: throughput is bounded by concurrency
+    "realistic": {},
+}
+
+PATIENTS = ["P001", "P002", "P003"]
+QUERIES = [
+    "Patient has high fever and chest infection. Recommend antibiotics.",
+    "Patient complains of severe headache and sensitivity to light. Recommend treatment.",
+    "Patient's HbA1c is elevated at 7.2. Need medication to control blood sugar.",
+]
+
+
+class ServerProcess:
+    """server.py in a child process on a free port."""
+
+    def __init__(self, workers, env):
+        self.workers = workers
+        self.env = env
+        self.base_url = None
+        self._proc = None
+
+    def __enter__(self):
+        cmd = [sys.executable, "server.py", "--port", "0", "--workers", str(self.workers)]
+        self._proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, env=self.env, text=True)
+        for line in self._proc.stdout:
+            if line.startswith("Med Perplexity server listening on "):
+                self.base_url = line.split()[5]
+                break
+        else:
+            raise RuntimeError("server failed to start")
+        return self
+
+    def __exit__(self, *exc):
+        self._proc.terminate()
+        self._proc.wait()
+
+    def private_mb(self):
+        """Median memory private to one worker process (None off Linux)."""
+        try:
+            with open(f"/proc/{self._proc.pid}/task/{self._proc.pid}/children") as f:
+                pids = f.read().split()
+        except OSError:
+            return None
+        sizes = []
+        for pid in pids:
+            try:
+                with open(f"/proc/{pid}/smaps_rollup") as f:
+                    fields = dict(line.split(":", 1) for line in f if ":" in line)
+            except OSError:
+                continue
+            sizes.append(sum(int(fields[k].split()[0]) for k in ("Private_Clean", "Private_Dirty")) / 1024)
+        return round(statistics.median(sizes), 1) if sizes else None
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))], 3) if ordered else None
+
+
+async def load(base_url, n_requests, concurrency, tag, patients=PATIENTS):
+    """Closed loop: `concurrency` clients each sending their next request as soon as one returns."""
+    import aiohttp
+
+    cases = itertools.count()
+    latency = {200: [], 503: []}
+    failed = 0
+
+    async def client(session):
+        nonlocal failed
+        while (i := next(cases)) < n_requests:
+            body = {"patient_id": patients[i * 7919 % len(patients)],
+                    "query": f"{QUERIES[i % len(QUERIES)]} [{tag} {i}]"}
+            start = time.perf_counter()
+            async with session.post(f"{base_url}/consult", json=body) as response:
+                await response.read()
+            if response.status in latency:
+                latency[response.status].append(time.perf_counter() - start)
+            else:
+                failed += 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=300)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+    return {
+        "wall_s": round(wall, 2),
+        "throughput_rps": round(len(latency[200]) / wall, 2),
+        "p50_s": percentile(latency[200], 50),
+        "p95_s": percentile(latency[200], 95),
+        "shed": len(latency[503]),
+        "shed_p50_s": percentile(latency[503], 50),
+        "failed": failed,
+    }
+
+
+def run(worker_counts, n_requests, concurrency, profile, overload_concurrency, n_patients):
+    stubs = StubProcess(PROFILES[profile]).start()
+    tmp = tempfile.TemporaryDirectory()
+    env = {**os.environ, **stubs.env(), "MEDP_CACHE_DIR": "off", "LLM_CACHE": "off",
+           "SERVER_QUEUE_SIZE": str(4 * concurrency), "SERVER_QUEUE_TIMEOUT": "60"}
+    patients = PATIENTS
+    if n_patients:
+        from patient_store import PatientStore
+
+        _, env["PATIENTS_DB"] = write_databases(tmp.name, n_patients)
+        PatientStore(env["PATIENTS_DB"]).refresh()  # Index once, up front
+        patients = [f"P{i:07d}" for i in range(n_patients)]
+    try:
+        baseline = None
+        for workers in worker_counts:
+            with ServerProcess(workers, env) as server:
+                asyncio.run(load(server.base_url, min(n_requests, 4 * workers), workers, "warmup", patients))
+                row = asyncio.run(load(server.base_url, n_requests, concurrency, f"w{workers}", patients))
+                private_mb = server.private_mb()
+            baseline = baseline or row["throughput_rps"]
+            print(json.dumps({"scenario": "scaling", "profile": profile, "cpus": os.cpu_count(),
+                              "patients": len(patients), "workers": workers, "concurrency": concurrency,
+                              **row, "scaling": round(row["throughput_rps"] / baseline, 2),
+                              "private_mb": private_mb}))
+
+        workers = max(worker_counts)
+        small = {**env, "SERVER_WORKER_CONCURRENCY": "4", "SERVER_QUEUE_SIZE": str(4 * workers),
+                 "SERVER_QUEUE_TIMEOUT": "2"}
+        with ServerProcess(workers, small) as server:
+            row = asyncio.run(load(server.base_url, n_requests, overload_concurrency, "overload", patients))
+        print(json.dumps({"scenario": "overload", "profile": profile, "workers": workers,
+                          "capacity": 4 * workers, "queue_size": 4 * workers,
+                          "concurrency": overload_concurrency, **row}))
+    finally:
+        stubs.stop()
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="fast")
+    parser.add_argument("--overload-concurrency", type=int, default=256)
+    parser.add_argument("--patients", type=int, default=0, help="synthetic JSONL database size (0: demo patients)")
+    args = parser.parse_args()
+    run(args.workers, args.requests, args.concurrency, args.profile, args.overload_concurrency, args.patients)
@@ -0,0 +1,118 @@
+"""
+Process startup benchmark.
+
+Every CLI run, test and worker process starts by importing the agents, so
+this measures, each in a fresh interpreter (median of --repeats):
+
+    import_ms      `import <module>` for the entry points (main, batch, the
+                   agents, cohort_screen)
+    workers        --workers processes forked from one parent, each running
+                   one consultation against the local stubs
+                   (benchmarks/stub_server.py), with and without
+                   main.preload() in the parent first:
+                     first_result_s   fork to first result, per worker
+                     private_mb       memory the worker does not share with
+                                      the parent (from /proc smaps_rollup)
+
+The cold_start scenario of benchmarks/run.py tracks import + first request
+across commits as well.
+
+Run from the repo root:
+    python -m benchmarks.startup [--repeats 5] [--workers 4]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.stub_server import StubProcess
+
+MODULES = ["main", "batch", "research_agent", "safety_agent", "cohort_screen"]
+
+IMPORT_CHILD = """
+import time
+start = time.perf_counter()
+import {module}
+print((time.perf_counter() - start) * 1000)
+"""
+
+FORK_CHILD = """
+import contextlib, io, json, os, time
+import main
+if {preload}:
+    main.preload()
+
+def private_mb():
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+    except OSError:
+        return None
+    kb = sum(int(fields[k].split()[0]) for k in ("Private_Clean", "Private_Dirty"))
+    return round(kb / 1024, 1)
+
+pids = []
+for i in range({workers}):
+    read_fd, write_fd = os.pipe()
+    start = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        with contextlib.redirect_stdout(io.StringIO()):
+            main.app.invoke({{"patient_id": "P00%d" % (i % 3 + 1), "user_query": "fever and cough [%d]" % i}})
+        row = {{"first_result_s": time.perf_counter() - start, "private_mb": private_mb()}}
+        os.write(write_fd, json.dumps(row).encode())
+        os._exit(0)
+    os.close(write_fd)
+    pids.append((pid, read_fd))
+
+rows = []
+for pid, read_fd in pids:
+    os.waitpid(pid, 0)
+    with os.fdopen(read_fd) as f:
+        rows.append(json.loads(f.read()))
+print(json.dumps(rows))
+"""
+
+
+def child(code, env):
+    return subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                          env=env, check=True).stdout.strip().splitlines()[-1]
+
+
+def median(values):
+    values = [v for v in values if v is not None]
+    return round(statistics.median(values), 3) if values else None
+
+
+def run(repeats, workers):
+    server = StubProcess().start()
+    env = {**os.environ, **server.env(), "MEDP_CACHE_DIR": "off", "LLM_CACHE": "off"}
+    try:
+        imports = {module: median([float(child(IMPORT_CHILD.format(module=module), env))
+                                   for _ in range(repeats)])
+                   for module in MODULES}
+        print(json.dumps({"import_ms": imports}))
+
+        for preload in (False, True):
+            rows = []
+            for _ in range(repeats):
+                rows += json.loads(child(FORK_CHILD.format(preload=preload, workers=workers), env))
+            print(json.dumps({
+                "workers": workers,
+                "preload": preload,
+                "first_result_s": median([r["first_result_s"] for r in rows]),
+                "private_mb": median([r["private_mb"] for r in rows]),
+            }))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    run(args.repeats, args.workers)
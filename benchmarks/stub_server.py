@@ -0,0 +1,456 @@
+"""
+Local stand-ins for the external services the agents call:
+
+    /entrez/eutils/esearch.fcgi          PubMed esearch (JSON)
+    /entrez/eutils/efetch.fcgi           PubMed efetch (XML)
+    /REST/interaction/list.json          RxNav interactions
+    /REST/rxcui.json                     RxNav name -> RxCUI lookup
+    /openai/v1/chat/completions          Groq chat completions (JSON or SSE stream)
+
+Each endpoint has a configurable latency, error rate and rate limit, so the
+pipeline can be exercised (and the HTTP client's retries / circuit breaker
+and the scheduler checked) without network access.
+
+Run standalone from the repo root:
+    python -m benchmarks.stub_server --port 8099
+and point the agents at it with the variables printed on startup.
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from urllib.parse import parse_qs, urlsplit
+
+DEFAULT_PROFILE = {
+    # Mean latency per endpoint in milliseconds
+    "latency_ms": {"esearch": 150, "efetch": 250, "rxnav": 100, "groq": 900},
+    # Fraction of requests answered with HTTP 503
+    "error_rate": {"esearch": 0.0, "efetch": 0.0, "rxnav": 0.0, "groq": 0.0},
+    # +/- fraction of uniform jitter applied to every latency
+    "jitter": 0.2,
+    # Streamed completions: delay before the first token; the rest of the
+    # endpoint latency is spread evenly over the remaining chunks
+    "ttft_ms": {"groq": 200},
+    # Extra delay per 1k prompt tokens (~4 chars each), modelling prefill
+    "prefill_ms_per_1k_tokens": {"groq": 0},
+    # Extra delay per completion token, modelling decode (so longer answers
+    # take longer; off by default, when latency_ms is the whole call)
+    "decode_ms_per_token": {"groq": 0},
+    # Requests per second per provider ("ncbi" covers esearch + efetch, like
+    # NCBI's 3/s) above which it answers HTTP 429; unlimited when absent
+    "rate_limit": {},
+}
+
+PROVIDERS = {"esearch": "ncbi", "efetch": "ncbi", "rxnav": "rxnav", "groq": "groq"}
+
+RESEARCH_ANSWERS = {
+    "infection": ("**Clinical Recommendation:**\nAmoxicillin 500mg TDS for 5 days. "
+                  "Alternative: Levofloxacin 750mg OD for severe cases.\n\n"
+                  "**Precautions:**\nAdjust dose to renal function.\n\n"
+                  "**Evidence Basis:**\nICMR Guidelines for Antimicrobial Use 2024."),
+    "diabetes": ("**Clinical Recommendation:**\nMetformin 500mg BD, titrate to 1g BD.\n\n"
+                 "**Precautions:**\nAvoid if eGFR < 30.\n\n"
+                 "**Evidence Basis:**\nICMR Guidelines for Type 2 Diabetes 2018."),
+    "pain": ("**Clinical Recommendation:**\nParacetamol 500mg QID as needed; "
+             "Ibuprofen 400mg TDS if no contraindication.\n\n"
+             "**Precautions:**\nAvoid NSAIDs in CKD or ulcer disease.\n\n"
+             "**Evidence Basis:**\nStandard Treatment Guidelines India."),
+    "default": ("**Clinical Recommendation:**\nParacetamol 500mg as needed.\n\n"
+                "**Precautions:**\nReview in 48 hours.\n\n"
+                "**Evidence Basis:**\nStandard Treatment Guidelines India."),
+}
+
+SAFETY_ANSWER = ("SAFETY STATUS: SAFE\nCONFIDENCE: 95%\n"
+                 "ANALYSIS: Proposed medications are appropriate for the documented lab values.\n"
+                 "RECOMMENDATIONS: Proceed as proposed.")
+
+ARTICLE_TEMPLATE = """<PubmedArticle><MedlineCitation Status="MEDLINE" Owner="NLM"><PMID Version="1">{pmid}</PMID><Article PubModel="Print"><ArticleTitle>{title}</ArticleTitle><Abstract><AbstractText>{abstract}</AbstractText></Abstract></Article><MeshHeadingList><MeshHeading><DescriptorName UI="D000900">Anti-Bacterial Agents</DescriptorName></MeshHeading></MeshHeadingList></MedlineCitation></PubmedArticle>"""
+
+ABSTRACT = ("Background: Antimicrobial resistance is a growing concern in India. "
+            "Methods: We reviewed outcomes of patients treated for community-acquired pneumonia. "
+            "Results: Amoxicillin remained effective as first-line therapy, while fluoroquinolones "
+            "required dose adjustment in chronic kidney disease. "
+            "Conclusions: Guideline-concordant therapy improved outcomes.")
+
+
+def classify_research(text):
+    text = text.lower()
+    if any(k in text for k in ("infection", "fever", "cough", "antibiotic")):
+        return "infection"
+    if any(k in text for k in ("sugar", "diabetes", "hba1c")):
+        return "diabetes"
+    if any(k in text for k in ("pain", "headache", "migraine")):
+        return "pain"
+    return "default"
+
+
+def pmids_for(term, count):
+    """Deterministic PMIDs per search term so caching behaves realistically."""
+    seed = zlib.crc32(term.encode("utf-8")) % 10_000_000
+    return [str(30_000_000 + (seed + i * 7919) % 10_000_000) for i in range(count)]
+
+
+def esearch(params):
+    ids = pmids_for(params.get("term", ""), int(params.get("retmax", 3)))
+    return "application/json", json.dumps({"esearchresult": {"count": str(len(ids)), "idlist": ids}})
+
+
+def efetch(params):
+    articles = "".join(
+        ARTICLE_TEMPLATE.format(pmid=pmid, title=f"Treatment outcomes study {pmid}", abstract=ABSTRACT)
+        for pmid in params.get("id", "").split(",") if pmid
+    )
+    payload = ('<?xml version="1.0" ?>\n<!DOCTYPE PubmedArticleSet PUBLIC "-//NLM//DTD PubMedArticle, '
+               '1st January 2024//EN" "https://dtd.nlm.nih.gov/ncbi/pubmed/out/pubmed_240101.dtd">\n'
+               f"<PubmedArticleSet>{articles}</PubmedArticleSet>")
+    return "text/xml", payload
+
+
+# RxCUIs the stub knows by name, and the interactions it reports between them
+RXCUIS = {"warfarin": "11289", "aspirin": "1191", "ibuprofen": "5640", "lisinopril": "29046"}
+RXNAV_PAIRS = {("11289", "1191"): "Aspirin may increase the anticoagulant activities of Warfarin.",
+               ("11289", "5640"): "Ibuprofen may increase the anticoagulant activities of Warfarin.",
+               ("29046", "5640"): "Ibuprofen may decrease the antihypertensive activities of Lisinopril."}
+
+
+def rxnav(params):
+    """Interaction list for every known pair among the (space-separated) RxCUIs."""
+    rxcuis = params.get("rxcuis", "").split()
+    names = {rxcui: name for name, rxcui in RXCUIS.items()}
+    pairs = [
+        {"severity": "N/A", "description": description,
+         "interactionConcept": [{"minConceptItem": {"rxcui": a, "name": names[a], "tty": "IN"}},
+                                {"minConceptItem": {"rxcui": b, "name": names[b], "tty": "IN"}}]}
+        for (a, b), description in RXNAV_PAIRS.items() if a in rxcuis and b in rxcuis
+    ]
+    groups = [{"sourceName": "DrugBank", "fullInteractionType": [{"interactionPair": pairs}]}] if pairs else []
+    return "application/json", json.dumps({"fullInteractionTypeGroup": groups})
+
+
+def rxcui(params):
+    """RxNorm name lookup: a stable made-up RxCUI for any name ending in "in" or "ol"."""
+    name = params.get("name", "").lower()
+    if name in RXCUIS:
+        ids = [RXCUIS[name]]
+    elif name.endswith(("in", "ol")):
+        ids = [str(900_000 + zlib.crc32(name.encode("utf-8")) % 100_000)]
+    else:
+        ids = []
+    return "application/json", json.dumps({"idGroup": {"name": name, "rxnormId": ids} if ids else {"name": name}})
+
+
+def chat_completion(body):
+    """
+    Canned completion (research answer, safety review, or both for the
+    combined call); a list of SSE events instead when body["stream"] is set.
+    """
+    messages = body.get("messages", [])
+    system = messages[0]["content"] if messages else ""
+    prompt = messages[-1]["content"] if messages else ""
+    query = prompt.split("CLINICAL QUERY:", 1)[-1].split("\n", 1)[0]
+    if "CLINICAL QUERY:" in prompt and "SAFETY STATUS:" in prompt:
+        content = RESEARCH_ANSWERS[classify_research(query)] + "\n\n" + SAFETY_ANSWER  # Combined call
+    elif "safety" in system.lower():
+        content = SAFETY_ANSWER
+    else:
+        content = RESEARCH_ANSWERS[classify_research(query)]
+    prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+    completion_tokens = len(content) // 4
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+             "total_tokens": prompt_tokens + completion_tokens}
+    header = {
+        "id": f"chatcmpl-stub-{random.randrange(1 << 30)}",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "system_fingerprint": "stub",
+    }
+    if body.get("stream"):
+        return "text/event-stream", stream_events(header, content, usage)
+    return "application/json", json.dumps({
+        **header,
+        "object": "chat.completion",
+        "choices": [{"index": 0, "finish_reason": "stop", "logprobs": None,
+                     "message": {"role": "assistant", "content": content}}],
+        "usage": usage,
+    })
+
+
+def stream_events(header, content, usage):
+    """Split a completion into chat.completion.chunk SSE events (~4 chars per token)."""
+    def event(delta, finish_reason=None, **extra):
+        chunk = {**header, "object": "chat.completion.chunk", **extra,
+                 "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason, "logprobs": None}]}
+        return f"data: {json.dumps(chunk)}\n\n"
+
+    pieces = [content[i:i + 4] for i in range(0, len(content), 4)]
+    events = [event({"role": "assistant", "content": ""})]
+    events += [event({"content": piece}) for piece in pieces]
+    events.append(event({}, "stop", x_groq={"id": header["id"], "usage": usage}))
+    events.append("data: [DONE]\n\n")
+    return events
+
+
+def route(method, path):
+    """Map a request to (endpoint name, handler), or (None, None)."""
+    if method == "GET":
+        if path.endswith("/esearch.fcgi"):
+            return "esearch", esearch
+        if path.endswith("/efetch.fcgi"):
+            return "efetch", efetch
+        if path.endswith("/interaction/list.json"):
+            return "rxnav", rxnav
+        if path.endswith("/rxcui.json"):
+            return "rxnav", rxcui
+    elif method == "POST" and path.endswith("/chat/completions"):
+        return "groq", chat_completion
+    return None, None
+
+
+class StubServer:
+    """
+    Minimal keep-alive HTTP/1.1 server on asyncio, so hundreds of concurrent
+    connections cost one coroutine each instead of one thread each.
+    `start()` runs it on a background thread; `serve_forever()` blocks.
+    """
+
+    def __init__(self, port=0, profile=None):
+        self.port = port
+        self.profile = merge_profile(profile)
+        self.requests = {}
+        self._buckets = {}  # provider -> (tokens, last refill) for rate_limit
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def env(self):
+        """
+        Environment variables that point the agents at this server. The stubs
+        are not rate limited like the real providers, so neither is the
+        scheduler (benchmarks/scheduler.py sets its own limits).
+        """
+        return {
+            "PUBMED_EUTILS_URL": f"{self.base_url}/entrez/eutils",
+            "RXNAV_URL": f"{self.base_url}/REST",
+            "GROQ_BASE_URL": self.base_url,
+            "GROQ_API_KEY": "stub-key",
+            **{f"SCHED_{provider}_{limit}": "0"
+               for provider in ("NCBI", "RXNAV", "GROQ") for limit in ("RATE", "CONCURRENCY")},
+        }
+
+    def count(self, endpoint):
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def _over_limit(self, endpoint):
+        """Token bucket (one second of burst) per rate-limited provider."""
+        provider = PROVIDERS[endpoint]
+        rate = self.profile["rate_limit"].get(provider)
+        if not rate:
+            return False
+        now = time.monotonic()
+        tokens, last = self._buckets.get(provider, (rate, now))
+        tokens = min(rate, tokens + (now - last) * rate)
+        if tokens < 1:
+            self._buckets[provider] = (tokens, now)
+            return True
+        self._buckets[provider] = (tokens - 1, now)
+        return False
+
+    # ------------------------------------------
+    # Lifecycle
+    # ------------------------------------------
+    def serve_forever(self, on_ready=None):
+        async def main():
+            self._loop = asyncio.get_running_loop()
+            self._server = await asyncio.start_server(self._handle, "127.0.0.1", self.port, backlog=4096)
+            self.port = self._server.sockets[0].getsockname()[1]
+            self._ready.set()
+            if on_ready:
+                on_ready()
+            async with self._server:
+                try:
+                    await self._server.serve_forever()
+                except asyncio.CancelledError:
+                    pass
+
+        asyncio.run(main())
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    # ------------------------------------------
+    # Request handling
+    # ------------------------------------------
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+
+                url = urlsplit(target)
+                await self._respond(writer, method, url.path, url.query, body)
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            pass  # Idle keep-alive connection at shutdown
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, method, path, query, body):
+        endpoint, handler = route(method, path)
+        if handler is None:
+            self._write(writer, 404, "text/plain", "not found")
+            return
+
+        self.count(endpoint)
+        if self._over_limit(endpoint):
+            self.count(f"{endpoint}_429")
+            self._write(writer, 429, "application/json", json.dumps({"error": "rate limit exceeded"}))
+            return
+        if method == "POST":
+            payload = json.loads(body or b"{}")
+        else:
+            payload = {k: v[0] for k, v in parse_qs(query).items()}
+
+        jitter = self.profile.get("jitter", 0)
+        latency = self.profile["latency_ms"].get(endpoint, 0) / 1000.0
+        latency = max(0.0, latency * random.uniform(1 - jitter, 1 + jitter))
+        prefill = 0.0
+        if method == "POST" and self.profile["prefill_ms_per_1k_tokens"].get(endpoint):
+            prompt_tokens = sum(len(m.get("content", "")) for m in payload.get("messages", [])) / 4
+            prefill = self.profile["prefill_ms_per_1k_tokens"][endpoint] * prompt_tokens / 1e6
+        streaming = bool(payload.get("stream"))
+        content_type, text = handler(payload)
+        if self.profile["decode_ms_per_token"].get(endpoint):
+            tokens = len(text) - 3 if streaming else json.loads(text)["usage"]["completion_tokens"]
+            latency += self.profile["decode_ms_per_token"][endpoint] * tokens / 1000.0
+        ttft = min(latency, self.profile["ttft_ms"].get(endpoint, 0) / 1000.0) if streaming else latency
+        latency += prefill  # Prompt processing delays the first token
+        ttft += prefill
+        await asyncio.sleep(ttft)
+        if random.random() < self.profile["error_rate"].get(endpoint, 0):
+            self._write(writer, 503, "application/json", json.dumps({"error": "stub failure"}))
+            return
+
+        if not streaming:
+            self._write(writer, 200, content_type, text)
+            return
+
+        # Chunked SSE: first event now, the rest paced over the remaining latency
+        writer.write(f"HTTP/1.1 200 OK\r\nContent-Type: {content_type}\r\n"
+                     "Transfer-Encoding: chunked\r\nConnection: keep-alive\r\n\r\n".encode("latin-1"))
+        gap = (latency - ttft) / max(1, len(text) - 1)
+        for i, event in enumerate(text):
+            if i:
+                await asyncio.sleep(gap)
+            data = event.encode("utf-8")
+            writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+
+    @staticmethod
+    def _write(writer, status, content_type, text):
+        data = text.encode("utf-8")
+        reason = {200: "OK", 404: "Not Found", 429: "Too Many Requests",
+                  503: "Service Unavailable"}.get(status, "")
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(data)}\r\nConnection: keep-alive\r\n\r\n".encode("latin-1") + data
+        )
+
+
+class StubProcess:
+    """
+    Runs the stub server in a child process, so its request handling does not
+    compete with the code under test for the GIL. Use as a context manager.
+    """
+
+    def __init__(self, profile=None):
+        self.profile = profile
+        self.base_url = None
+        self._proc = None
+
+    def start(self):
+        cmd = [sys.executable, "-m", "benchmarks.stub_server", "--port", "0"]
+        if self.profile:
+            cmd += ["--profile", json.dumps(self.profile)]
+        self._proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+        for line in self._proc.stdout:
+            if line.startswith("Stub services listening on "):
+                self.base_url = line.split()[4]
+                break
+        else:
+            raise RuntimeError("stub server failed to start")
+        return self
+
+    def env(self):
+        return StubServer.env(self)
+
+    def stop(self):
+        self._proc.terminate()
+        self._proc.wait()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def merge_profile(overrides=None):
+    profile = json.loads(json.dumps(DEFAULT_PROFILE))
+    for key, value in (overrides or {}).items():
+        if isinstance(value, dict):
+            profile[key].update(value)
+        else:
+            profile[key] = value
+    return profile
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--profile", help="JSON overrides, e.g. '{\"latency_ms\": {\"groq\": 300}}'")
+    args = parser.parse_args()
+
+    server = StubServer(args.port, json.loads(args.profile) if args.profile else None)
+
+    def announce():
+        for key, value in server.env().items():
+            print(f"export {key}={value}")
+        print(f"Stub services listening on {server.base_url} (Ctrl+C to stop)", flush=True)
+
+    try:
+        server.serve_forever(on_ready=announce)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,87 @@
+"""
+Graph topology benchmark: sequential chain vs. parallel fan-out.
+
+Runs the three demo scenarios from main.py through both topologies against
+the local stub services (benchmarks/stub_server.py) and reports per-scenario
+wall time. Caches are cleared so every run does the full PubMed and LLM round trips.
+Patient loading is local and near-instant here; --patient-latency-ms adds a
+delay to model a remote ABDM fetch, which is where the overlap pays off most.
+
+Run from the repo root:
+    python -m benchmarks.topology [--repeats 5] [--patient-latency-ms 200]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import time
+
+from benchmarks.stub_server import StubServer
+
+SCENARIOS = [
+    ("P001", "Patient has high fever and chest infection. Recommend antibiotics."),
+    ("P002", "Patient complains of severe headache and sensitivity to light. Recommend treatment."),
+    ("P003", "Patient's HbA1c is elevated at 7.2. Need medication to control blood sugar."),
+]
+
+
+def configure(server):
+    os.environ.update(server.env())
+    os.environ["MEDP_CACHE_DIR"] = "off"
+
+
+def clear_caches():
+    import llm_cache
+    import pubmed_cache
+    llm_cache.completion_cache.clear()
+    pubmed_cache.search_cache.clear()
+    pubmed_cache.article_cache.clear()
+
+
+def run(repeats, patient_latency_ms):
+    server = StubServer().start()
+    configure(server)
+
+    # Imported after configure() so the agents pick up the stub endpoints
+    import main
+    import personalization_agent
+
+    if patient_latency_ms:
+        load_patient = personalization_agent.personalization_node
+
+        def remote_personalization_node(state):
+            time.sleep(patient_latency_ms / 1000.0)
+            return load_patient(state)
+
+        main.personalization_node = remote_personalization_node
+
+    graphs = {topology: main.build_graph(topology) for topology in ("sequential", "parallel")}
+    results = []
+    try:
+        for patient_id, query in SCENARIOS:
+            row = {"patient_id": patient_id}
+            for topology, graph in graphs.items():
+                samples = []
+                for _ in range(repeats):
+                    clear_caches()
+                    start = time.perf_counter()
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        graph.invoke({"patient_id": patient_id, "user_query": query})
+                    samples.append(time.perf_counter() - start)
+                row[f"{topology}_s"] = round(statistics.median(samples), 3)
+            row["saved_s"] = round(row["sequential_s"] - row["parallel_s"], 3)
+            results.append(row)
+            print(json.dumps(row))
+    finally:
+        server.stop()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--patient-latency-ms", type=float, default=200)
+    args = parser.parse_args()
+    run(args.repeats, args.patient_latency_ms)
@@ -0,0 +1,197 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# ==========================================
+# TIERED (MEMORY + DISK) CACHE
+# ==========================================
+# A small in-memory LRU in front of a SQLite file. Entries expire after
+# `ttl` seconds and both tiers are size-bounded. Values must be
+# JSON-serializable. Several caches can share one SQLite file by using
+# different namespaces.
+
+DEFAULT_CACHE_DIR = ".cache"
+
+
+def default_cache_path(filename):
+    """Path inside $MEDP_CACHE_DIR (default: .cache/), or None if disabled."""
+    cache_dir = os.getenv("MEDP_CACHE_DIR", DEFAULT_CACHE_DIR)
+    if cache_dir.lower() in ("", "0", "off", "none"):
+        return None
+    return os.path.join(cache_dir, filename)
+
+
+class TieredCache:
+    """
+    Size-bounded LRU cache with TTL expiry and an optional SQLite backing store.
+    Thread-safe. `path=None` keeps everything in memory.
+    """
+
+    def __init__(self, path, namespace, max_memory_items=1024, max_disk_items=100_000, ttl=None):
+        self.path = path
+        self.namespace = namespace
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self.ttl = ttl
+        self._memory = OrderedDict()   # key -> (created, value)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self._writes_since_prune = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+
+    # ------------------------------------------
+    # Public API
+    # ------------------------------------------
+    def get(self, key, default=None):
+        """Return the cached value for `key`, or `default` on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if self._fresh(entry[0], now):
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return entry[1]
+                # The disk copy has the same timestamp, so it is stale too
+                del self._memory[key]
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                self._disk_delete(key)
+                return default
+
+            row = self._disk_get(key, now)
+            if row is None:
+                self.stats["misses"] += 1
+                return default
+
+            created, value = row
+            self.stats["disk_hits"] += 1
+            self._remember(key, created, value)
+            return value
+
+    def get_many(self, keys):
+        """Return {key: value} for every key that is cached."""
+        found = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            conn = self._connection()
+            if conn is None:
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (namespace, key, value, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), now, now),
+            )
+            conn.commit()
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= max(1, self.max_disk_items // 100):
+                self._prune(conn, now)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            conn = self._connection()
+            if conn is not None:
+                conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+                conn.commit()
+
+    def hit_rate(self):
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    # ------------------------------------------
+    # Internals (called with the lock held)
+    # ------------------------------------------
+    def _fresh(self, created, now):
+        return self.ttl is None or now - created < self.ttl
+
+    def _remember(self, key, created, value):
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _connection(self):
+        if self.path is None:
+            return None
+        # SQLite handles must not cross a fork; reopen in child processes
+        if self._conn is None or self._conn_pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " created REAL NOT NULL, accessed REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS cache_entries_accessed ON cache_entries (namespace, accessed)"
+            )
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _disk_get(self, key, now):
+        conn = self._connection()
+        if conn is None:
+            return None
+        row = conn.execute(
+            "SELECT value, created FROM cache_entries WHERE namespace = ? AND key = ?",
+            (self.namespace, key),
+        ).fetchone()
+        if row is None:
+            return None
+        value, created = row
+        if not self._fresh(created, now):
+            self._disk_delete(key)
+            self.stats["expired"] += 1
+            return None
+        conn.execute(
+            "UPDATE cache_entries SET accessed = ? WHERE namespace = ? AND key = ?",
+            (now, self.namespace, key),
+        )
+        conn.commit()
+        return created, json.loads(value)
+
+    def _disk_delete(self, key):
+        conn = self._connection()
+        if conn is not None:
+            conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+            conn.commit()
+
+    def _prune(self, conn, now):
+        """Drop expired rows, then the least recently used rows over the size limit."""
+        self._writes_since_prune = 0
+        if self.ttl is not None:
+            conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND created < ?",
+                (self.namespace, now - self.ttl),
+            )
+        (count,) = conn.execute(
+            "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        excess = count - self.max_disk_items
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM cache_entries WHERE rowid IN ("
+                " SELECT rowid FROM cache_entries WHERE namespace = ? ORDER BY accessed LIMIT ?)",
+                (self.namespace, excess),
+            )
+            self.stats["evictions"] += excess
+        conn.commit()
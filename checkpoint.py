@@ -0,0 +1,171 @@
+import asyncio
+import contextvars
+import functools
+import hashlib
+import json
+import os
+
+import tracing
+from cache import TieredCache, default_cache_path
+from streaming import FieldStream
+
+# ==========================================
+# PER-NODE CHECKPOINTS
+# ==========================================
+# Graph node outputs are cached on a hash of the state each node actually
+# reads, so re-running a consultation after a patient record changes only
+# recomputes the nodes that depend on the changed data. A new creatinine
+# value reruns the rule checks and the safety review; the PubMed search and
+# the research synthesis come back from their checkpoints.
+#
+# Every checkpointed node declares its inputs as dotted state paths:
+#
+#   "user_query"                   a top-level state key
+#   "patient_profile.conditions"   one field of a nested dict
+#
+# and is called with a projection of the state holding only those paths, so
+# it cannot depend on anything its checkpoint key does not cover (an
+# undeclared field reads as missing, every time). `affected_nodes()` answers
+# "what reruns if these paths change?" from the same declarations.
+#
+# A node calls skip() when its output should not be kept (a fallback after an
+# API error), so a transient failure is not served for a day.
+#
+# "bypass_cache" in the state forces a recompute (the fresh output still
+# refreshes the checkpoint) and is passed through to the node.
+#
+# Tunables (environment):
+#   MEDP_CHECKPOINTS      "on" to checkpoint graph nodes (default off)
+#   CHECKPOINT_TTL        seconds a checkpoint is kept (default 1 day)
+
+CHECKPOINT_VERSION = 1  # Bump when a node's output format changes
+DEFAULT_TTL = 24 * 3600  # Same horizon as the LLM completion cache
+
+ENABLED = os.getenv("MEDP_CHECKPOINTS", "off").lower() in ("1", "on", "true", "yes")
+
+checkpoint_cache = TieredCache(default_cache_path("checkpoints.sqlite"), "node_output",
+                               max_memory_items=1024, max_disk_items=100_000,
+                               ttl=float(os.getenv("CHECKPOINT_TTL", DEFAULT_TTL)))
+
+_MISSING = object()
+_skip = contextvars.ContextVar("medp_checkpoint_skip", default=False)
+
+
+def _get(state, path):
+    value = state
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def project(state, paths):
+    """The part of `state` under the given dotted paths, as nested dicts (absent paths are left out)."""
+    projected = {}
+    for path in paths:
+        value = _get(state, path)
+        if value is _MISSING:
+            continue
+        *parents, leaf = path.split(".")
+        target = projected
+        for part in parents:
+            target = target.setdefault(part, {})
+        target[leaf] = value
+    return projected
+
+
+def input_key(node, projected):
+    """Checkpoint key for a node run on a projected state."""
+    payload = json.dumps({"v": CHECKPOINT_VERSION, "node": node, "inputs": projected},
+                         sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def overlaps(a, b):
+    """True if one dotted path is equal to or inside the other."""
+    return a == b or a.startswith(b + ".") or b.startswith(a + ".")
+
+
+def changed_paths(old_state, new_state, paths):
+    """The given paths whose value differs between two states."""
+    return [path for path in paths if _get(old_state, path) != _get(new_state, path)]
+
+
+def affected_nodes(dependencies, changed):
+    """
+    Nodes that must re-run when the state under `changed` paths changes.
+    `dependencies` maps node -> (inputs, outputs) in execution order; a node
+    is affected when it reads a changed path or an affected node's output.
+    """
+    changed = list(changed)
+    affected = []
+    for node, (inputs, outputs) in dependencies.items():
+        if any(overlaps(path, c) for path in inputs for c in changed):
+            affected.append(node)
+            changed.extend(outputs)
+    return affected
+
+
+def skip():
+    """Don't checkpoint the output of the node currently running."""
+    _skip.set(True)
+
+
+def _lookup(name, state, inputs):
+    projected = project(state, inputs)
+    key = input_key(name, projected)
+    if state.get("bypass_cache"):
+        projected["bypass_cache"] = True
+        return projected, key, None
+    output = checkpoint_cache.get(key)
+    tracing.count("cache_requests", cache="checkpoint", result="miss" if output is None else "hit")
+    return projected, key, output
+
+
+def _replay(output, replay):
+    """Stream checkpointed text fields in one piece, so streaming callers still see them."""
+    for field in replay:
+        if isinstance(output.get(field), str):
+            stream = FieldStream(field)
+            stream(output[field])
+            stream.done()
+
+
+def checkpointed(name, node, inputs, replay=()):
+    """
+    Wrap a sync or async graph node so its output is checkpointed on its
+    declared `inputs`. `replay` names streamed text fields to re-emit on a hit.
+    """
+    if asyncio.iscoroutinefunction(node):
+        @functools.wraps(node)
+        async def async_wrapper(state):
+            projected, key, output = _lookup(name, state, inputs)
+            if output is None:
+                token = _skip.set(False)
+                try:
+                    output = await node(projected)
+                    if not _skip.get():
+                        checkpoint_cache.set(key, output)
+                finally:
+                    _skip.reset(token)
+            else:
+                _replay(output, replay)
+            return output
+        return async_wrapper
+
+    @functools.wraps(node)
+    def wrapper(state):
+        projected, key, output = _lookup(name, state, inputs)
+        if output is None:
+            token = _skip.set(False)
+            try:
+                output = node(projected)
+                if not _skip.get():
+                    checkpoint_cache.set(key, output)
+            finally:
+                _skip.reset(token)
+        else:
+            _replay(output, replay)
+        return output
+    return wrapper
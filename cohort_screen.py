@@ -0,0 +1,217 @@
+from array import array
+
+import numpy as np
+
+from interaction_graph import SEVERITIES
+from rule_engine import egfr_value
+
+# ==========================================
+# POPULATION-WIDE SAFETY SCREENING
+# ==========================================
+# Answers "which of our patients would be flagged if they were prescribed
+# drug X?" for the whole patient store at once, e.g. when a drug joins the
+# formulary or a safety alert comes out, instead of running the safety agent
+# (and its LLM call) once per patient.
+#
+# The store is encoded once, column by column, with the rule engine's own
+# matchers, so brand names and condition phrases mean exactly what they mean
+# in safety_agent.py:
+#
+#   conditions     condition phrase ID -> patient rows    (CSC postings)
+#   medications    rule drug ID -> patient rows           (CSC postings)
+#   allergies      rule drug ID -> patient rows           (CSC postings)
+#   eGFR           float32 per patient, NaN when not recorded
+#
+# Screening a drug ORs a few posting lists into one boolean mask per rule:
+#
+#   allergy            allergic to the drug (any rule drug, as in RuleEngine.check)
+#   contraindication   has a condition the drug conflicts with
+#   renal              eGFR below the drug's "egfr_below" threshold
+#   interaction        takes any drug it interacts with (its neighbours in
+#                      the interaction graph), keeping the highest severity
+#
+# The encoding reflects the rule tables it was built with; rebuild it after
+# changing the rules or the patient store.
+
+REASONS = ("allergy", "contraindication", "renal", "interaction")
+
+
+class Postings:
+    """Feature -> sorted patient rows, as CSC-style (indptr, rows) arrays."""
+
+    def __init__(self, indptr, rows):
+        self.indptr = indptr
+        self.rows = rows
+
+    @classmethod
+    def from_counts(cls, features, counts, n_features):
+        """Build from the features of each row in turn, with `counts[row]` features per row."""
+        features = np.frombuffer(features, dtype=np.int32)
+        rows = np.repeat(np.arange(len(counts), dtype=np.int32), np.frombuffer(counts, dtype=np.int32))
+        order = np.argsort(features, kind="stable")  # Stable: rows stay sorted within a feature
+        indptr = np.zeros(n_features + 1, dtype=np.int64)
+        np.cumsum(np.bincount(features, minlength=n_features), out=indptr[1:])
+        return cls(indptr, rows[order])
+
+    def mask(self, features, n):
+        """Boolean mask over n rows: True where the row has any of `features`."""
+        mask = np.zeros(n, dtype=bool)
+        indptr, rows = self.indptr, self.rows
+        slices = [rows[indptr[f]:indptr[f + 1]] for f in features]
+        if slices:
+            mask[np.concatenate(slices)] = True
+        return mask
+
+    @property
+    def nbytes(self):
+        return self.indptr.nbytes + self.rows.nbytes
+
+
+class ScreenResult:
+    """Patients flagged for one drug, with a row mask per reason."""
+
+    def __init__(self, name, drugs, cohort, masks, severity):
+        self.name = name
+        self.drugs = drugs
+        self.masks = masks
+        self.severity = severity  # Highest interaction severity level per row (0 = none)
+        self._cohort = cohort
+        flagged = np.zeros(len(cohort), dtype=bool)
+        for mask in masks.values():
+            flagged |= mask
+        self.rows = np.flatnonzero(flagged)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def counts(self):
+        return {reason: int(np.count_nonzero(mask)) for reason, mask in self.masks.items()}
+
+    def patient_ids(self):
+        ids = self._cohort.ids
+        return [ids[row] for row in self.rows.tolist()]
+
+    def reasons(self, row):
+        """Reasons a row was flagged, e.g. ["renal", "interaction (major)"]."""
+        reasons = []
+        for reason, mask in self.masks.items():
+            if mask[row]:
+                if reason == "interaction":
+                    reason = f"interaction ({SEVERITIES[self.severity[row] - 1]})"
+                reasons.append(reason)
+        return reasons
+
+
+class Cohort:
+    """Columnar encoding of a patient population for RuleEngine rules."""
+
+    def __init__(self, engine, ids, conditions, medications, allergies, egfr):
+        self.engine = engine
+        self.ids = ids
+        self.conditions = conditions
+        self.medications = medications
+        self.allergies = allergies
+        self.egfr = egfr
+        self.drug_ids = self.drug_columns(engine)
+
+    @staticmethod
+    def drug_columns(engine):
+        """Rule drug -> column; interaction graph drugs keep their graph IDs."""
+        columns = dict(engine.interaction_graph.ids)
+        for drug in engine.contra_drugs:
+            columns.setdefault(drug, len(columns))
+        return columns
+
+    @classmethod
+    def from_records(cls, records, engine):
+        """Encode an iterable of patient records (consumed once, never held in memory)."""
+        drug_ids = cls.drug_columns(engine)
+        n_phrases = len({p for ids in engine.drug_conflicts.values() for p in ids})
+        ids = []
+        columns = {field: (array("i"), array("i")) for field in ("conditions", "medications", "allergies")}
+        egfr = array("f")
+        scanners = {
+            "conditions": engine.conditions_in,
+            "medications": lambda text: [drug_ids[d] for d in engine.drugs_in(text)],
+            "allergies": lambda text: [drug_ids[d] for d in engine.drugs_in(text)],
+        }
+
+        for record in records:
+            ids.append(record.get("id"))
+            for field, (features, counts) in columns.items():
+                found = set()
+                for text in record.get(field) or []:
+                    found.update(scanners[field](text))
+                features.extend(found)
+                counts.append(len(found))
+            value = egfr_value(record)
+            egfr.append(np.nan if value is None else value)
+
+        return cls(
+            engine,
+            ids,
+            Postings.from_counts(*columns["conditions"], n_phrases),
+            Postings.from_counts(*columns["medications"], len(drug_ids)),
+            Postings.from_counts(*columns["allergies"], len(drug_ids)),
+            np.frombuffer(egfr, dtype=np.float32),
+        )
+
+    @classmethod
+    def from_store(cls, store, engine):
+        return cls.from_records(store.records(), engine)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        """Size of the encoded columns (patient IDs not included)."""
+        return self.conditions.nbytes + self.medications.nbytes + self.allergies.nbytes + self.egfr.nbytes
+
+    def screen(self, name):
+        """
+        Every patient the rules would flag if `name` (generic, brand or
+        synonym) were prescribed. A name the rules do not know flags nobody.
+        """
+        engine, graph, n = self.engine, self.engine.interaction_graph, len(self)
+        drugs = sorted(engine.proposed_drugs(name))
+        masks = {reason: np.zeros(n, dtype=bool) for reason in REASONS}
+        severity = np.zeros(n, dtype=np.int8)
+
+        for drug in drugs:
+            column = self.drug_ids[drug]
+            masks["allergy"] |= self.allergies.mask([column], n)
+            if drug in engine.drug_conflicts:
+                masks["contraindication"] |= self.conditions.mask(engine.drug_conflicts[drug], n)
+            threshold = engine.egfr_below.get(drug)
+            if threshold is not None:
+                masks["renal"] |= self.egfr < threshold  # NaN (not recorded) compares False
+
+            if drug in graph.ids:
+                i = graph.ids[drug]
+                partners = graph.neighbors[graph.indptr[i]:graph.indptr[i + 1]]
+                levels = graph.severity[graph.indptr[i]:graph.indptr[i + 1]]
+                for level in np.unique(levels).tolist():
+                    takes = self.medications.mask(partners[levels == level].tolist(), n)
+                    np.maximum(severity, np.where(takes, level, 0).astype(np.int8), out=severity)
+                    masks["interaction"] |= takes
+
+        return ScreenResult(name, drugs, self, masks, severity)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) >= 2:
+        from patient_store import get_patient_store
+        from safety_agent import get_rule_engine
+
+        cohort = Cohort.from_store(get_patient_store(sys.argv[2] if len(sys.argv) > 2 else None),
+                                   get_rule_engine())
+        result = cohort.screen(sys.argv[1])
+        print(f"{len(result)} of {len(cohort)} patients flagged for {sys.argv[1]} "
+              f"({', '.join(result.drugs) or 'no rules'}): {result.counts()}")
+        for row, patient_id in zip(result.rows.tolist(), result.patient_ids()):
+            print(f"{patient_id}\t{', '.join(result.reasons(row))}")
+    else:
+        print("Usage: python cohort_screen.py <drug> [patients_db]")
@@ -0,0 +1,288 @@
+from evidence import compact_evidence
+from guideline_index import format_passages
+import llm_cache
+from llm_client import get_async_client, get_client
+from research_agent import (RESEARCH_INPUTS, asearch_pubmed, local_guidelines, pubmed_search_term,
+                            research_fallback, search_pubmed)
+import scheduler
+from safety_agent import (RXNAV_INTERACTIONS, SAFETY_INPUTS, aai_safety_review, acheck_drug_interactions_api,
+                          ai_safety_review, check_drug_interactions_api, combine_safety_results,
+                          consultation_drugs, current_rule_warnings, review_priority, rxnav_warnings,
+                          safety_report_header)
+from streaming import FieldStream
+
+# ==========================================
+# COMBINED MODE (one LLM call per consultation)
+# ==========================================
+# The default graph makes two sequential Groq calls, research then safety
+# review, and the second one re-sends most of the patient profile. In the
+# "combined" graph (main.build_graph("combined")) a single structured call
+# writes the recommendation and then reviews it against the full record:
+#
+#   START -> personalize, retrieve -> consult -> rule_check -> safety -> END
+#
+# The deterministic rule checks still run on the recommendation. Only when
+# they flag a conflict (or the model's review is missing) does the safety
+# node make the second, dedicated review call; otherwise the review from the
+# first call is the report. In the common safe case that is one round trip
+# instead of two. `python -m benchmarks.combined` compares both graphs.
+
+# The review starts at the first line beginning with this label
+REVIEW_MARKER = "SAFETY STATUS"
+
+# State each node reads (see checkpoint.py): consult reviews the lab values
+# as well, so unlike research it reruns when they change
+CONSULT_INPUTS = RESEARCH_INPUTS + ("patient_profile.vitals", "patient_profile.lab_flags",
+                                    "patient_profile.recent_labs")
+COMBINED_SAFETY_INPUTS = SAFETY_INPUTS + ("safety_review",)
+
+
+def build_combined_request(query, patient_profile, pubmed_results):
+    """Keyword arguments for the combined recommendation + safety review call."""
+    conditions = patient_profile.get("conditions", [])
+    conditions_str = ", ".join(conditions) if conditions else "general patient"
+    current_meds = patient_profile.get("medications", [])
+    allergies = patient_profile.get("allergies", [])
+    age = patient_profile.get("age", "Unknown")
+    gender = patient_profile.get("gender", "Unknown")
+
+    passages = local_guidelines(query, conditions)
+    evidence = compact_evidence(pubmed_results, query, conditions)
+
+    prompt = f"""You are an expert clinical decision support AI for Indian healthcare, trained on ICMR guidelines, Indian pharmacology standards and drug safety protocols.
+
+COMPLETE PATIENT PROFILE:
+- Age: {age} years | Gender: {gender}
+- Medical Conditions: {conditions_str}
+- Current Medications: {', '.join(current_meds) if current_meds else 'None'}
+- Known Allergies: {', '.join(allergies) if allergies else 'None'}
+- Laboratory Values: {patient_profile.get('vitals', {})}
+- Lab Summary: {patient_profile.get('lab_flags', '')}
+- Recent Lab Report: {patient_profile.get('recent_labs', '')}
+
+CLINICAL QUERY: {query}
+
+RESEARCH DATA AVAILABLE:
+- PubMed Evidence: {evidence if evidence else "Limited"}
+- ICMR Guidelines: {format_passages(passages) if passages else "Available for reference"}
+
+YOUR TASK, IN TWO PARTS:
+Part 1 - Provide a detailed, evidence-based treatment recommendation that:
+1. References specific ICMR/Indian clinical guidelines
+2. Lists 2-3 medications with exact dosages appropriate for THIS patient's age, conditions and organ function
+3. Prioritizes Jan Aushadhi (generic) alternatives with approximate costs
+4. Includes specific precautions based on the patient's comorbidities and current medications
+
+Part 2 - Then act as the final safety validator of your own recommendation:
+1. Cross-reference each proposed medication against the lab values (creatinine, eGFR, liver function, etc.)
+2. Check for drug-drug interactions with current medications and for allergy conflicts
+3. State any dosage adjustment needed for renal/hepatic function
+
+CONFIDENCE SCORING GUIDANCE:
+- 95-100%: All data available, no concerns, standard dosing appropriate
+- 85-94%: Minor precautions needed but treatment is safe
+- 70-84%: Moderate concerns, dosage adjustment recommended
+- Below 70%: Significant safety concerns, alternative treatment suggested
+
+OUTPUT FORMAT (250 words max), these sections in this order:
+**Clinical Recommendation:**
+[Medication recommendations with dosages]
+
+**Precautions:**
+[Specific to this patient's profile]
+
+**Evidence Basis:**
+[ICMR guideline reference or clinical evidence, citing PMIDs]
+
+SAFETY STATUS: [SAFE/WARNING/CRITICAL]
+CONFIDENCE: [85-100% - Be confident when lab data supports your assessment]
+ANALYSIS: [2-3 sentences with specific reference to lab values and clinical rationale]
+RECOMMENDATIONS: [Specific dosage adjustments OR confirm treatment is safe as proposed]"""
+
+    return {
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are an expert Indian medical AI trained on ICMR guidelines and Indian pharmacology. Provide evidence-based, India-specific treatment recommendations, then validate them conservatively against the patient's full record."
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        "model": "llama-3.3-70b-versatile",
+        "temperature": 0.1,  # The review is in this answer: as low as the safety call
+        "max_tokens": 900  # Research (500) + review (400)
+    }
+
+
+class ReviewSplitter:
+    """
+    on_token callback for the combined completion. Streams the
+    recommendation to `stream` as it arrives and holds back everything from
+    the REVIEW_MARKER line on. A line is only held while it could still turn
+    out to be the marker ("**SAFETY ST..."), so streaming stays per token.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.findings = []
+        self.review = None  # Review text chunks once the marker line is seen
+        self._line = ""     # Start of the current line, not streamed yet
+        self._mid_line = False
+
+    def _emit(self, text):
+        self.findings.append(text)
+        self.stream(text)
+
+    def __call__(self, text):
+        if self.review is not None:
+            self.review.append(text)
+            return
+        self._line += text
+        while self._line:
+            end = self._line.find("\n")
+            if self._mid_line:
+                if end < 0:
+                    self._emit(self._line)
+                    self._line = ""
+                    return
+                self._emit(self._line[:end + 1])
+                self._line = self._line[end + 1:]
+                self._mid_line = False
+                continue
+            label = (self._line if end < 0 else self._line[:end]).lstrip(" \t*#>_").upper()
+            if label.startswith(REVIEW_MARKER):
+                self.review = [self._line]
+                self._line = ""
+                return
+            if end < 0:
+                if not REVIEW_MARKER.startswith(label):
+                    self._emit(self._line)
+                    self._line = ""
+                    self._mid_line = True
+                return
+            self._emit(self._line[:end + 1])
+            self._line = self._line[end + 1:]
+
+    def done(self):
+        if self._line:
+            self._emit(self._line)
+            self._line = ""
+        self.stream.done()
+
+    def result(self):
+        """{"research_findings": ..., "safety_review": ...} ("" when the model wrote no review)."""
+        return {"research_findings": "".join(self.findings), "safety_review": "".join(self.review or [])}
+
+
+def consult_node(state):
+    """
+    Research and safety review in one LLM call (the "combined" graph).
+    Streams the recommendation as research_findings and keeps the model's
+    own review in safety_review for combined_safety_node.
+    """
+    print("\n--- 📚 AGENT 2: RESEARCH + SAFETY REVIEW (SINGLE CALL) ---")
+
+    query = state.get("user_query", "")
+    if "pubmed_results" in state:
+        pubmed_results = state["pubmed_results"]
+    else:
+        print("Searching PubMed database...")
+        pubmed_results = search_pubmed(pubmed_search_term(query))
+
+    try:
+        request = build_combined_request(query, state.get("patient_profile", {}), pubmed_results)
+
+        print("Analyzing with AI medical reasoning...")
+        splitter = ReviewSplitter(FieldStream("research_findings"))
+        llm_cache.stream(get_client(), request, splitter, bypass=state.get("bypass_cache", False),
+                         label="combined")
+        splitter.done()
+        print(f"✓ Recommendation and self-review ready.")
+
+        return splitter.result()
+
+    except Exception as e:
+        return research_fallback(query, e)  # No review: the safety node makes the full call
+
+
+async def aconsult_node(state):
+    """Async variant of consult_node (AsyncGroq + async PubMed search)."""
+    print("\n--- 📚 AGENT 2: RESEARCH + SAFETY REVIEW (SINGLE CALL) ---")
+
+    query = state.get("user_query", "")
+    if "pubmed_results" in state:
+        pubmed_results = state["pubmed_results"]
+    else:
+        print("Searching PubMed database...")
+        pubmed_results = await asearch_pubmed(pubmed_search_term(query))
+
+    try:
+        request = build_combined_request(query, state.get("patient_profile", {}), pubmed_results)
+
+        print("Analyzing with AI medical reasoning...")
+        splitter = ReviewSplitter(FieldStream("research_findings"))
+        await llm_cache.astream(get_async_client(), request, splitter, bypass=state.get("bypass_cache", False),
+                                label="combined")
+        splitter.done()
+        print(f"✓ Recommendation and self-review ready.")
+
+        return splitter.result()
+
+    except Exception as e:
+        return research_fallback(query, e)
+
+
+def self_review_result(review):
+    """Safety report from the combined call's own review (rule checks passed)."""
+    print("Rule checks passed: using the review from the combined call.")
+    stream = FieldStream("safety_check")
+    stream(safety_report_header([]))
+    stream(review)
+    stream.done()
+    return combine_safety_results([], review)
+
+
+def announce_full_review(warnings):
+    """Say why the full AI safety review runs: a flagged conflict or no usable self-review."""
+    if warnings:
+        print("Conflict flagged: running the full AI safety review...")
+    else:
+        print("Self-review missing or unparseable: running the full AI safety review...")
+
+
+def combined_safety_node(state):
+    """
+    Safety report for the combined graph: the review written with the
+    recommendation when the rule checks (and RxNav, if enabled) find
+    nothing, otherwise the full AI safety review as a second call.
+    """
+    print("\n--- 🛡️ AGENT 3: SAFETY GUARDRAIL ANALYZING ---")
+
+    warnings, is_safe = current_rule_warnings(state)
+    review = state.get("safety_review")
+    with scheduler.priority(review_priority(warnings)):
+        if RXNAV_INTERACTIONS:
+            warnings = warnings + rxnav_warnings(check_drug_interactions_api(consultation_drugs(state)))
+            is_safe = not warnings
+        if warnings or not review:
+            announce_full_review(warnings)
+            return ai_safety_review(state, warnings, is_safe)
+    return self_review_result(review)
+
+
+async def acombined_safety_node(state):
+    """Async variant of combined_safety_node."""
+    print("\n--- 🛡️ AGENT 3: SAFETY GUARDRAIL ANALYZING ---")
+
+    warnings, is_safe = current_rule_warnings(state)
+    review = state.get("safety_review")
+    with scheduler.priority(review_priority(warnings)):
+        if RXNAV_INTERACTIONS:
+            warnings = warnings + rxnav_warnings(await acheck_drug_interactions_api(consultation_drugs(state)))
+            is_safe = not warnings
+        if warnings or not review:
+            announce_full_review(warnings)
+            return await aai_safety_review(state, warnings, is_safe)
+    return self_review_result(review)
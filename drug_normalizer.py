@@ -0,0 +1,182 @@
+import json
+import os
+import re
+import threading
+
+import http_client
+import tracing
+from cache import TieredCache, default_cache_path
+from rule_engine import Automaton
+
+# ==========================================
+# DRUG NAME NORMALIZATION & RXCUI RESOLUTION
+# ==========================================
+# Maps what doctors and patient records actually say ("Glycomet 500mg",
+# "Dolo 650", "Combiflam", "acetaminophen") to canonical generic names and
+# RxNorm concept IDs (RxCUIs), locally:
+#
+#   - drug_names.json lists each ingredient with its RxCUI and its synonyms
+#     and brand names (Indian brands included); combination brands map to
+#     several ingredients
+#   - exact names are found with a dict lookup, and mentions in free text
+#     with one Aho-Corasick pass (rule_engine.Automaton, word-bounded)
+#   - a name the table has no RxCUI for is looked up once on RxNav
+#     (/rxcui.json) and the answer, including "not found", is cached on
+#     disk, so a consultation never waits on more than the new names
+#
+# The resolved RxCUIs of all the drugs in a consultation then go to RxNav's
+# interaction endpoint in a single request (see safety_agent.py).
+#
+# Tunables (environment):
+#   DRUG_NAMES_FILE   synonym / brand table (default drug_names.json)
+#   RXCUI_CACHE_TTL   seconds a remote resolution is kept (default 30 days)
+#   RXNAV_URL         RxNav endpoint (shared with safety_agent.py)
+
+DEFAULT_NAMES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "drug_names.json")
+DEFAULT_TTL = 30 * 24 * 3600  # RxNorm concepts are stable; new brands appear rarely
+
+RXNAV_URL = os.getenv("RXNAV_URL", "https://rxnav.nlm.nih.gov/REST")
+
+rxcui_cache = TieredCache(default_cache_path("rxnorm.sqlite"), "rxcui", max_memory_items=4096,
+                          ttl=float(os.getenv("RXCUI_CACHE_TTL", DEFAULT_TTL)))
+
+
+# Strengths and dosage forms in medication entries ("Zolpidem 5mg tab")
+DOSE_RE = re.compile(r"\b(\d+(\.\d+)?\s*(mg|mcg|g|ml|iu|units?|%)?|tabs?|tablets?|caps?|capsules?|syrup|sr|er|xl)\b")
+
+
+def normalize_name(name):
+    return " ".join(name.lower().split())
+
+
+class DrugNormalizer:
+    """Brand / synonym -> generic index over a drug_names.json table."""
+
+    def __init__(self, ingredients, combinations=None):
+        self.rxcuis = {}   # generic -> RxCUI (None when the table has none)
+        self.names = {}    # normalized name -> (generic, ...)
+        self.matcher = Automaton()
+        for generic, info in ingredients.items():
+            generic = normalize_name(generic)
+            self.rxcuis[generic] = info.get("rxcui")
+            for name in [generic] + info.get("synonyms", []):
+                self._index(name, generic)
+        for brand, generics in (combinations or {}).items():
+            for generic in generics:
+                self._index(brand, normalize_name(generic))
+        self.matcher.build()
+
+    def _index(self, name, generic):
+        key = normalize_name(name)
+        if generic not in self.names.get(key, ()):
+            self.names[key] = self.names.get(key, ()) + (generic,)
+            self.matcher.add(key, generic)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("ingredients", {}), data.get("combinations", {}))
+
+    def synonyms(self):
+        """{generic: [other names]}, the format RuleEngine takes."""
+        table = {}
+        for name, generics in self.names.items():
+            for generic in generics:
+                if name != generic:
+                    table.setdefault(generic, []).append(name)
+        return table
+
+    def normalize(self, text):
+        """Generic names of every drug mentioned in `text`, in order of first mention."""
+        found = []
+        for _, _, generic in self.matcher.find(text):
+            if generic not in found:
+                found.append(generic)
+        return found
+
+    def canonical(self, name):
+        """
+        Generic names for one drug entry ("Glycomet 500mg" -> ["metformin"]).
+        Unknown names come back normalized, as their own canonical form.
+        """
+        generics = self.names.get(normalize_name(name))
+        if generics:
+            return list(generics)
+        return self.normalize(name) or [normalize_name(DOSE_RE.sub(" ", name.lower())) or normalize_name(name)]
+
+    def local_rxcui(self, generic):
+        return self.rxcuis.get(generic)
+
+    def _unresolved(self, names):
+        """({name: rxcui} known locally or cached, [names to look up remotely])."""
+        resolved, missing = {}, []
+        for name in dict.fromkeys(normalize_name(n) for n in names):
+            rxcui = self.local_rxcui(name)
+            if rxcui is None:
+                rxcui = rxcui_cache.get(name)
+            if rxcui is None:
+                missing.append(name)
+            else:
+                resolved[name] = rxcui or None  # "" marks a cached "not found"
+        tracing.count("cache_requests", len(resolved), cache="rxcui", result="hit")
+        tracing.count("cache_requests", len(missing), cache="rxcui", result="miss")
+        return resolved, missing
+
+    def resolve(self, names):
+        """{canonical name: RxCUI or None} for canonical drug names."""
+        resolved, missing = self._unresolved(names)
+        for name in missing:
+            resolved[name] = _remember(name, _rxcui_from(http_client.get(
+                f"{RXNAV_URL}/rxcui.json", params={"name": name, "search": 2}, label="rxnav_rxcui",
+                provider="rxnav")))
+        return resolved
+
+    async def aresolve(self, names):
+        """Async variant of resolve()."""
+        resolved, missing = self._unresolved(names)
+        for name in missing:
+            resolved[name] = _remember(name, _rxcui_from(await http_client.aget(
+                f"{RXNAV_URL}/rxcui.json", params={"name": name, "search": 2}, label="rxnav_rxcui",
+                provider="rxnav")))
+        return resolved
+
+
+def _rxcui_from(response):
+    if response.status_code != 200:
+        return None
+    ids = (response.json().get("idGroup") or {}).get("rxnormId") or []
+    return ids[0] if ids else ""
+
+
+def _remember(name, rxcui):
+    """Cache a remote answer ("" = not found); errors (None) are not cached."""
+    if rxcui is not None:
+        rxcui_cache.set(name, rxcui)
+    return rxcui or None
+
+
+_normalizer = None
+_normalizer_lock = threading.Lock()
+
+
+def get_normalizer():
+    """The process-wide normalizer over $DRUG_NAMES_FILE, loaded on first use."""
+    global _normalizer
+    if _normalizer is None:
+        with _normalizer_lock:
+            if _normalizer is None:
+                _normalizer = DrugNormalizer.from_file(os.getenv("DRUG_NAMES_FILE", DEFAULT_NAMES_FILE))
+    return _normalizer
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) >= 2:
+        normalizer = get_normalizer()
+        text = " ".join(sys.argv[1:])
+        generics = normalizer.normalize(text) or normalizer.canonical(text)
+        print(json.dumps(normalizer.resolve(generics), indent=2))
+    else:
+        print('Usage: python drug_normalizer.py "Glycomet 500mg BD, Dolo 650 SOS"')
@@ -0,0 +1,185 @@
+import math
+import os
+import re
+import xml.etree.ElementTree as ET
+
+from guideline_index import B, CONTEXT_WEIGHT, K1, tokenize
+
+# ==========================================
+# EVIDENCE COMPACTION
+# ==========================================
+# Turns PubMed efetch XML into a short, cited evidence block for the research
+# prompt, instead of pasting raw XML (mostly tags and DOCTYPE boilerplate).
+#
+#   1. parse_articles: efetch XML -> [{pmid, title, year, sentences}]
+#   2. rank_sentences: BM25 over the abstract sentences of the retrieved
+#      articles, query terms at full weight and the patient's conditions at
+#      CONTEXT_WEIGHT (as in guideline retrieval); conclusion and result
+#      sections get a small boost
+#   3. pack: greedily take the best sentences until the token budget is
+#      spent, then render them grouped per article with its PMID
+#
+#   [PMID 31234567] Amoxicillin for community-acquired pneumonia (2021)
+#   - Amoxicillin remained effective as first-line therapy...
+#
+# Token counts are estimated at ~4 characters per token, close enough for
+# the Llama tokenizer on English text to budget a prompt.
+#
+# Tunables (environment):
+#   EVIDENCE_TOKENS   token budget for the PubMed evidence block (default 350)
+
+EVIDENCE_TOKENS = int(os.getenv("EVIDENCE_TOKENS", 350))
+
+# Abstract section labels worth more than background / methods
+SECTION_BOOST = {"CONCLUSIONS": 1.3, "CONCLUSION": 1.3, "INTERPRETATION": 1.3, "RESULTS": 1.15, "FINDINGS": 1.15}
+
+# Query words that say nothing about the evidence wanted
+QUERY_NOISE = frozenset("patient patients recommend recommended need needs complains has high severe".split())
+
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9(])")
+
+
+def estimate_tokens(text):
+    return (len(text) + 3) // 4
+
+
+def _terms(text):
+    """Tokens with a plural 's' folded, so 'antibiotics' matches 'antibiotic'."""
+    return [t[:-1] if len(t) > 3 and t.endswith("s") and not t.endswith("ss") else t for t in tokenize(text)]
+
+
+def _text(elem):
+    return " ".join("".join(elem.itertext()).split()) if elem is not None else ""
+
+
+# ------------------------------------------
+# Parsing
+# ------------------------------------------
+def parse_articles(xml):
+    """Structured articles from efetch (or mirror) XML, in document order."""
+    try:
+        root = ET.fromstring(xml)
+    except (ET.ParseError, TypeError):
+        return []
+    articles = []
+    for node in root.iter("PubmedArticle"):
+        citation = node.find("MedlineCitation")
+        if citation is None:
+            continue
+        article = citation.find("Article")
+        year = (citation.findtext("Article/Journal/JournalIssue/PubDate/Year")
+                or (citation.findtext("Article/Journal/JournalIssue/PubDate/MedlineDate") or "")[:4])
+        sentences = []
+        for part in (article.iterfind("Abstract/AbstractText") if article is not None else ()):
+            label = (part.get("NlmCategory") or part.get("Label") or "").upper()
+            sentences.extend((label, s) for s in SENTENCE_RE.split(_text(part)) if s)
+        articles.append({
+            "pmid": (citation.findtext("PMID") or "").strip(),
+            "title": _text(article.find("ArticleTitle")) if article is not None else "",
+            "year": year or None,
+            "sentences": sentences,
+        })
+    return articles
+
+
+# ------------------------------------------
+# Ranking and packing
+# ------------------------------------------
+def rank_sentences(articles, query, conditions=()):
+    """[(score, article index, sentence index)] for sentences matching the query, best first."""
+    weights = {}
+    for term in _terms(" ".join(conditions)):
+        weights[term] = CONTEXT_WEIGHT
+    for term in _terms(query):
+        if term not in QUERY_NOISE:
+            weights[term] = 1.0
+    units = [(a, s, _terms(text)) for a, article in enumerate(articles)
+             for s, (_, text) in enumerate(article["sentences"])]
+    if not units or not weights:
+        return []
+
+    df = {}
+    for _, _, terms in units:
+        for term in set(terms) & weights.keys():
+            df[term] = df.get(term, 0) + 1
+    n = len(units)
+    avg_len = sum(len(terms) for _, _, terms in units) / n or 1.0
+    idf = {t: math.log(1 + (n - d + 0.5) / (d + 0.5)) for t, d in df.items()}
+
+    ranked = []
+    for a, s, terms in units:
+        counts = {}
+        for term in terms:
+            if term in idf:
+                counts[term] = counts.get(term, 0) + 1
+        if not counts:
+            continue
+        norm = K1 * (1 - B + B * len(terms) / avg_len)
+        score = sum(weights[t] * idf[t] * tf * (K1 + 1) / (tf + norm) for t, tf in counts.items())
+        score *= SECTION_BOOST.get(articles[a]["sentences"][s][0], 1.0)
+        ranked.append((score, a, s))
+    ranked.sort(key=lambda item: (-item[0], item[1], item[2]))
+    return ranked
+
+
+def _header(article):
+    year = f" ({article['year']})" if article["year"] else ""
+    return f"[PMID {article['pmid']}] {article['title']}{year}"
+
+
+def pack(articles, ranked, budget=EVIDENCE_TOKENS):
+    """Render the best sentences that fit in `budget` tokens, grouped per article."""
+    chosen = {}  # article index -> sentence indexes
+    seen = set()  # Identical sentences (boilerplate, duplicate records) are cited once
+    used = 0
+    for _, a, s in ranked:
+        text = articles[a]["sentences"][s][1]
+        if text in seen:
+            continue
+        cost = estimate_tokens(text) + 1
+        if a not in chosen:
+            cost += estimate_tokens(_header(articles[a])) + 1
+        if used + cost > budget:
+            continue  # A shorter sentence further down may still fit
+        chosen.setdefault(a, []).append(s)
+        seen.add(text)
+        used += cost
+
+    blocks = []
+    for a in sorted(chosen):
+        article = articles[a]
+        lines = [_header(article)] + [f"- {article['sentences'][s][1]}" for s in sorted(chosen[a])]
+        blocks.append("\n".join(lines))
+    return "\n".join(blocks)
+
+
+def compact_evidence(xml, query, conditions=(), budget=EVIDENCE_TOKENS):
+    """
+    The PubMed evidence for a prompt: the best-matching abstract sentences,
+    cited by PMID, within `budget` tokens. Articles with no matching
+    sentence are still listed by title while room remains. None when there
+    are no articles.
+    """
+    articles = parse_articles(xml) if xml else []
+    if not articles:
+        return None
+    text = pack(articles, rank_sentences(articles, query, conditions), budget)
+    cited = {line for line in text.splitlines() if line.startswith("[PMID ")}
+    for article in articles:
+        header = _header(article)
+        if header not in cited and estimate_tokens(text) + estimate_tokens(header) + 1 <= budget:
+            text = f"{text}\n{header}" if text else header
+    return text or None
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) >= 3:
+        with open(sys.argv[1], encoding="utf-8") as f:
+            payload = f.read()
+        evidence = compact_evidence(payload, " ".join(sys.argv[2:]))
+        print(evidence)
+        print(f"\n(~{estimate_tokens(evidence or '')} tokens from ~{estimate_tokens(payload)} tokens of XML)")
+    else:
+        print("Usage: python evidence.py <efetch.xml> <query>")
@@ -0,0 +1,346 @@
+import hashlib
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from cache import default_cache_path
+
+# ==========================================
+# GUIDELINE RETRIEVAL INDEX (BM25)
+# ==========================================
+# Ranked retrieval over a directory of guideline documents (ICMR, STG, ...).
+# Documents are split into ~CHUNK_WORDS-word passages and indexed into an
+# inverted index stored as CSR arrays:
+#
+#   postings for term t:  docs[indptr[t]:indptr[t + 1]]     (chunk ids)
+#                         weight[indptr[t]:indptr[t + 1]]   (BM25 tf part)
+#
+# The query-independent half of BM25, tf * (k1 + 1) / (tf + k1 * (1 - b +
+# b * len / avgdl)), is computed once at build time, so scoring a query is
+# one vectorized multiply-add per query term (times its idf) and an
+# argpartition for the top k.
+#
+# The arrays are saved as .npy files and memory-mapped on load, so startup
+# does not rebuild or even read the whole index. A saved index is reused as
+# long as the corpus files are unchanged (same names, sizes and mtimes).
+#
+# Documents are .md / .txt files. A first line "[SOURCE: <title>]" names the
+# document; otherwise the file name is used. Titles are indexed with every
+# passage, but a hit must also match a query term in the passage itself
+# that is not a number or a GENERIC_TERMS word ("treatment", "management"),
+# so a query about something the corpus does not cover finds nothing.
+#
+# Tunables (environment):
+#   GUIDELINES_DIR        corpus directory (default guidelines/)
+#   GUIDELINE_INDEX_DIR   where the index is saved (default .cache/guideline_index)
+
+DEFAULT_GUIDELINES_DIR = "guidelines"
+INDEX_VERSION = 1
+CHUNK_WORDS = 120
+K1 = 1.2
+B = 0.75
+CONTEXT_WEIGHT = 0.3
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+SOURCE_RE = re.compile(r"^\s*\[SOURCE:\s*(.+?)\]\s*$")
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have if in into is it its of on or that the their this
+to was were will with within without not no can may should after before than then
+""".split())
+
+# Words every clinical query uses; a passage needs at least one query term
+# beyond these (and beyond its document title) to count as a match
+GENERIC_TERMS = frozenset("""
+patient patients complains recommend recommended suggest advise treatment treatments treat management manage
+need needs medication medications medicine drug drugs therapy options best guideline guidelines
+""".split())
+
+ARRAYS = ("indptr", "docs", "weight", "doc_len", "chunk_source", "text_offsets", "text_blob")
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def specific_terms(query):
+    """Query terms that can make a passage relevant on their own: no numbers, no GENERIC_TERMS."""
+    return {t for t in tokenize(query) if not t.isdigit() and t not in GENERIC_TERMS}
+
+
+def chunk_document(text, max_words=CHUNK_WORDS):
+    """Split a document into (title, [passages]) on paragraph boundaries."""
+    lines = text.strip().splitlines()
+    title = None
+    if lines:
+        match = SOURCE_RE.match(lines[0])
+        if match:
+            title = match.group(1)
+            lines = lines[1:]
+
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", "\n".join(lines)) if p.strip()]
+    chunks, current, words = [], [], 0
+    for paragraph in paragraphs:
+        size = len(paragraph.split())
+        if current and words + size > max_words:
+            chunks.append("\n\n".join(current))
+            current, words = [], 0
+        if size > max_words:
+            # One oversized paragraph: cut it into max_words windows
+            tokens = paragraph.split()
+            for start in range(0, len(tokens), max_words):
+                chunks.append(" ".join(tokens[start:start + max_words]))
+            continue
+        current.append(paragraph)
+        words += size
+    if current:
+        chunks.append("\n\n".join(current))
+    return title, chunks
+
+
+def corpus_files(directory):
+    files = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if name.endswith((".md", ".txt")):
+                files.append(os.path.join(root, name))
+    return sorted(files)
+
+
+def corpus_signature(directory):
+    """Changes whenever a corpus file is added, removed or modified."""
+    digest = hashlib.sha1()
+    for path in corpus_files(directory):
+        stat = os.stat(path)
+        digest.update(f"{os.path.relpath(path, directory)}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+class GuidelineIndex:
+    """
+    BM25 index over guideline passages. Build with from_directory() or
+    build(), persist with save(), reopen (memory-mapped) with load().
+    """
+
+    def __init__(self, vocab, sources, arrays, avgdl, signature=None):
+        self.vocab = vocab            # term -> term id
+        self.sources = sources        # source id -> document title
+        self.signature = signature
+        self.avgdl = avgdl
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.n_chunks = len(self.doc_len)
+
+    # ------------------------------------------
+    # Building
+    # ------------------------------------------
+    @classmethod
+    def build(cls, documents, signature=None):
+        """Index an iterable of (title, text or [passages]) documents."""
+        vocab, sources = {}, []
+        term_ids, doc_lens, chunk_source, texts = [], [], [], []
+        for title, text in documents:
+            source_id = len(sources)
+            sources.append(title)
+            for passage in text if isinstance(text, list) else [text]:
+                ids = [vocab.setdefault(t, len(vocab)) for t in tokenize(f"{title}\n{passage}")]
+                term_ids.append(np.asarray(ids, dtype=np.int64))
+                doc_lens.append(len(ids))
+                chunk_source.append(source_id)
+                texts.append(passage)
+
+        n_chunks = len(doc_lens)
+        doc_len = np.asarray(doc_lens, dtype=np.int32)
+        terms = np.concatenate(term_ids) if term_ids else np.zeros(0, dtype=np.int64)
+        chunk_of = np.repeat(np.arange(n_chunks, dtype=np.int64), doc_len)
+
+        # (term, chunk) pairs sorted by term then chunk, with counts = tf
+        keys, tf = np.unique(terms * max(n_chunks, 1) + chunk_of, return_counts=True)
+        posting_terms = keys // max(n_chunks, 1)
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(posting_terms, minlength=len(vocab)), out=indptr[1:])
+
+        docs = (keys % max(n_chunks, 1)).astype(np.int32)
+        avgdl = float(doc_len.mean()) if n_chunks else 0.0
+        norm = K1 * (1 - B + B * doc_len[docs] / max(avgdl, 1e-9))
+        weight = (tf * (K1 + 1) / (tf + norm)).astype(np.float32)
+
+        blob = "".join(texts).encode("utf-8")
+        offsets = np.zeros(n_chunks + 1, dtype=np.int64)
+        np.cumsum([len(t.encode("utf-8")) for t in texts], out=offsets[1:])
+
+        arrays = {
+            "indptr": indptr,
+            "docs": docs,
+            "weight": weight,
+            "doc_len": doc_len,
+            "chunk_source": np.asarray(chunk_source, dtype=np.int32),
+            "text_offsets": offsets,
+            "text_blob": np.frombuffer(blob, dtype=np.uint8),
+        }
+        return cls(vocab, sources, arrays, avgdl, signature)
+
+    @classmethod
+    def from_directory(cls, directory):
+        def documents():
+            for path in corpus_files(directory):
+                with open(path, "r", encoding="utf-8") as f:
+                    title, chunks = chunk_document(f.read())
+                yield title or os.path.splitext(os.path.basename(path))[0], chunks
+
+        return cls.build(documents(), signature=corpus_signature(directory))
+
+    # ------------------------------------------
+    # Persistence
+    # ------------------------------------------
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            os.remove(meta_path)  # Readers must not pair old metadata with new arrays
+        for name in ARRAYS:
+            # Write-then-rename: processes that still have the old file mapped keep a valid inode
+            path = os.path.join(directory, f"{name}.npy")
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, np.asarray(getattr(self, name)))
+            os.replace(path + ".tmp", path)
+        with open(os.path.join(directory, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump(sorted(self.vocab, key=self.vocab.get), f)
+        # meta.json last: its presence marks a complete index
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "avgdl": self.avgdl, "sources": self.sources,
+                       "signature": self.signature, "k1": K1, "b": B}, f)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Open a saved index; arrays are memory-mapped unless mmap=False."""
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported guideline index version: {meta.get('version')}")
+        with open(os.path.join(directory, "vocab.json"), "r", encoding="utf-8") as f:
+            vocab = {term: i for i, term in enumerate(json.load(f))}
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if mmap else None)
+                  for name in ARRAYS}
+        return cls(vocab, meta["sources"], arrays, meta["avgdl"], meta.get("signature"))
+
+    # ------------------------------------------
+    # Search
+    # ------------------------------------------
+    def scores(self, query, context=""):
+        """
+        BM25 score of every chunk for `query` (float32 array). Terms that
+        only appear in `context` (e.g. the patient's conditions) count at
+        CONTEXT_WEIGHT, so they refine the ranking without dominating it.
+        """
+        scores = np.zeros(self.n_chunks, dtype=np.float32)
+        weights = dict.fromkeys(tokenize(context), CONTEXT_WEIGHT)
+        weights.update(dict.fromkeys(tokenize(query), 1.0))
+        for term, weight in weights.items():
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            df = end - start
+            idf = weight * np.log1p((self.n_chunks - df + 0.5) / (df + 0.5))
+            # Chunk ids are unique within one posting list, so fancy-index += is safe
+            scores[self.docs[start:end]] += np.float32(idf) * self.weight[start:end]
+        return scores
+
+    def search(self, query, k=3, context=""):
+        """
+        Top-k passages as [{"source", "text", "score"}], best first. Only
+        passages that match a specific query term in their own text (see
+        specific_terms) are returned.
+        """
+        specific = specific_terms(query)
+        if not self.n_chunks or not specific:
+            return []
+        scores = self.scores(query, context)
+        candidates = np.flatnonzero(scores > 0)
+        hits, seen = [], 0
+        while len(hits) < k and seen < len(candidates):
+            # Rank a few more than k at a time; most rejected passages sit at the top only rarely
+            m = min(len(candidates), max(4 * k, 2 * seen))
+            top = candidates[np.argpartition(-scores[candidates], m - 1)[:m]]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            for i in top[seen:].tolist():
+                text = self.passage(i)
+                if specific.isdisjoint(tokenize(text)):
+                    continue  # Matched only on its title, generic words or the patient context
+                hits.append({"source": self.sources[self.chunk_source[i]], "text": text,
+                             "score": round(float(scores[i]), 4)})
+                if len(hits) == k:
+                    break
+            seen = m
+        return hits
+
+    def passage(self, chunk_id):
+        start, end = self.text_offsets[chunk_id], self.text_offsets[chunk_id + 1]
+        return bytes(self.text_blob[start:end]).decode("utf-8")
+
+
+def open_index(corpus_dir, index_dir=None):
+    """
+    Load the saved index for corpus_dir if it is current, otherwise build
+    it (and save it when index_dir is given).
+    """
+    signature = corpus_signature(corpus_dir)
+    if index_dir and os.path.exists(os.path.join(index_dir, "meta.json")):
+        try:
+            index = GuidelineIndex.load(index_dir)
+            if index.signature == signature:
+                return index
+        except (OSError, ValueError):
+            pass  # Corrupt or old format: rebuild below
+
+    index = GuidelineIndex.from_directory(corpus_dir)
+    if index_dir:
+        index.save(index_dir)
+    return index
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_guideline_index():
+    """Shared index over $GUIDELINES_DIR, or None if there is no corpus."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                corpus_dir = os.getenv("GUIDELINES_DIR", DEFAULT_GUIDELINES_DIR)
+                if not os.path.isdir(corpus_dir):
+                    return None
+                index_dir = os.getenv("GUIDELINE_INDEX_DIR") or default_cache_path("guideline_index")
+                _index = open_index(corpus_dir, index_dir)
+    return _index
+
+
+def format_passages(passages):
+    """Render passages for a prompt or fallback answer, one cited block each."""
+    return "\n\n".join(f"[SOURCE: {p['source']}]\n{p['text']}" for p in passages)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) >= 2 and sys.argv[1] == "build":
+        corpus_dir = sys.argv[2] if len(sys.argv) > 2 else os.getenv("GUIDELINES_DIR", DEFAULT_GUIDELINES_DIR)
+        index_dir = sys.argv[3] if len(sys.argv) > 3 else (
+            os.getenv("GUIDELINE_INDEX_DIR") or default_cache_path("guideline_index"))
+        if not index_dir:
+            sys.exit("No index directory: pass one or set GUIDELINE_INDEX_DIR")
+        index = GuidelineIndex.from_directory(corpus_dir)
+        index.save(index_dir)
+        print(f"Indexed {index.n_chunks} passages from {len(index.sources)} documents into {index_dir}")
+    elif len(sys.argv) >= 3 and sys.argv[1] == "search":
+        index = get_guideline_index()
+        for hit in index.search(" ".join(sys.argv[2:]), k=5) if index else []:
+            print(f"{hit['score']:8.3f}  {hit['source']}\n{hit['text']}\n")
+    else:
+        print("Usage: python guideline_index.py build [corpus_dir] [index_dir]\n"
+              "       python guideline_index.py search <query>")
@@ -0,0 +1,316 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import weakref
+from urllib.parse import urlsplit
+
+import scheduler
+import tracing
+
+# ==========================================
+# SHARED HTTP CLIENT (PubMed, RxNav)
+# ==========================================
+# One keep-alive session per process with a bounded connection pool per
+# host, bounded exponential-backoff retries, split connect/read timeouts and
+# a per-host circuit breaker. When a host keeps failing, calls fail
+# immediately with CircuitOpenError so agents drop to their local fallback
+# instead of waiting out the timeout on every request. `aget` is the asyncio
+# equivalent (aiohttp) with the same limits, retry policy and breakers.
+# Calls that name a provider are first queued by its scheduler (rate limit,
+# priority, coalescing; see scheduler.py), which holds the slot across the
+# retries.
+# requests and aiohttp are imported on first use (together they add ~0.35s
+# to every process start, and most processes only ever need one of them).
+#
+# Tunables (environment):
+#   HTTP_CONNECT_TIMEOUT   seconds to establish a connection (default 3)
+#   HTTP_READ_TIMEOUT      seconds to wait for a response (default 8)
+#   HTTP_MAX_RETRIES       retries on connection errors / 429 / 5xx (default 2)
+#   HTTP_POOL_SIZE         max open connections per host (default 10)
+#   HTTP_BREAKER_FAILURES  consecutive failures that open the circuit (default 5)
+#   HTTP_BREAKER_RESET     seconds before a half-open trial request (default 30)
+
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 3))
+READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 8))
+MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 2))
+POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 10))
+BREAKER_FAILURES = int(os.getenv("HTTP_BREAKER_FAILURES", 5))
+BREAKER_RESET = float(os.getenv("HTTP_BREAKER_RESET", 30))
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a host whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Classic closed -> open -> half-open breaker. After `failure_threshold`
+    consecutive failures the circuit opens for `reset_timeout` seconds; then
+    a single trial request is let through to decide whether to close it.
+    A trial that ends without an outcome (cancelled, or an unexpected
+    error) calls abandon(), so the next caller gets the trial instead.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                return True  # This caller is the trial request
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def abandon(self):
+        """A request ended with neither success nor failure recorded; free the half-open trial."""
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+                self.opened_at = time.monotonic() - self.reset_timeout  # Due for a new trial now
+
+
+_session = None
+_session_pid = None
+_breakers = {}
+_lock = threading.Lock()
+
+
+def get_session():
+    """Return the process-wide pooled session (recreated after a fork)."""
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _lock:
+            if _session is None or _session_pid != os.getpid():
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+
+                retry = Retry(
+                    total=MAX_RETRIES,
+                    backoff_factor=0.25,  # 0.25s, 0.5s, 1s, ...
+                    status_forcelist=RETRY_STATUSES,
+                    allowed_methods=frozenset(["GET"]),
+                    respect_retry_after_header=True,
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(pool_connections=8, pool_maxsize=POOL_SIZE,
+                                      pool_block=True, max_retries=retry)
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session, _session_pid = session, os.getpid()
+    return _session
+
+
+def get_breaker(host):
+    breaker = _breakers.get(host)
+    if breaker is None:
+        with _lock:
+            breaker = _breakers.setdefault(host, CircuitBreaker())
+    return breaker
+
+
+def breaker_states():
+    """{host: state} for every host contacted so far (for health reporting)."""
+    return {host: breaker.state for host, breaker in _breakers.items()}
+
+
+def _span_name(url, label):
+    """Span name for a request: "http.<label>", by default the endpoint's file stem."""
+    if label is None:
+        label = urlsplit(url).path.rsplit("/", 1)[-1].split(".", 1)[0] or "root"
+    return f"http.{label}"
+
+
+def _coalesce_key(url, params):
+    return url, tuple(sorted((params or {}).items()))
+
+
+def get(url, params=None, timeout=None, label=None, provider=None):
+    """
+    GET through the shared session. Raises CircuitOpenError if the host is
+    known to be down, and requests exceptions on failure like requests.get.
+    `label` names the tracing span (default: the endpoint, e.g. "esearch").
+    With `provider` ("ncbi", "rxnav") the request is queued behind that
+    provider's rate limit, and identical requests in flight share one
+    response (see scheduler.py).
+    """
+    if provider is not None:
+        return scheduler.call(provider, lambda: _get(url, params, timeout, label),
+                              key=_coalesce_key(url, params))
+    return _get(url, params, timeout, label)
+
+
+def _get(url, params, timeout, label):
+    import requests
+
+    host = urlsplit(url).netloc
+    breaker = get_breaker(host)
+    if not breaker.allow():
+        tracing.count("http_circuit_open", host=host)
+        raise CircuitOpenError(f"{host} unavailable (circuit open)")
+
+    recorded = False
+    try:
+        with tracing.span(_span_name(url, label), host=host) as span:
+            try:
+                response = get_session().get(url, params=params,
+                                             timeout=timeout or (CONNECT_TIMEOUT, READ_TIMEOUT))
+            except requests.RequestException:
+                recorded = True
+                breaker.record_failure()
+                raise
+            span.set(status=response.status_code)
+
+        recorded = True
+        if response.status_code in RETRY_STATUSES:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+    finally:
+        if not recorded:
+            breaker.abandon()
+
+
+def preload():
+    """Import the HTTP libraries up front (for a parent process that forks workers)."""
+    import aiohttp  # noqa: F401
+    import requests  # noqa: F401
+
+
+_loop_registries = []
+
+
+def loop_local(factory):
+    """
+    Memoize `factory()` per running event loop. aiohttp sessions are bound to
+    the loop that created them, so async clients cannot be plain globals.
+    """
+    clients = weakref.WeakKeyDictionary()
+    _loop_registries.append(clients)
+
+    def get():
+        loop = asyncio.get_running_loop()
+        client = clients.get(loop)
+        if client is None:
+            client = clients[loop] = factory()
+        return client
+
+    return get
+
+
+async def aclose():
+    """
+    Close every loop-local client created on the running loop. Call it at the
+    end of an asyncio.run() so sessions don't leak "Unclosed client session"
+    warnings when the loop goes away.
+    """
+    loop = asyncio.get_running_loop()
+    for clients in _loop_registries:
+        client = clients.pop(loop, None)
+        if client is not None:
+            await client.close()
+
+
+def _new_async_session():
+    import aiohttp
+
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=POOL_SIZE, limit_per_host=POOL_SIZE),
+        timeout=aiohttp.ClientTimeout(sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT),
+    )
+
+
+get_async_session = loop_local(_new_async_session)
+
+
+class AsyncResponse:
+    """The parts of requests.Response the agents use, for aget() results."""
+
+    def __init__(self, status_code, content, headers):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+async def aget(url, params=None, timeout=None, label=None, provider=None):
+    """Async equivalent of get(): pooled, retried, behind the same breakers and schedulers."""
+    if provider is not None:
+        return await scheduler.acall(provider, lambda: _aget(url, params, timeout, label),
+                                     key=_coalesce_key(url, params))
+    return await _aget(url, params, timeout, label)
+
+
+async def _aget(url, params, timeout, label):
+    host = urlsplit(url).netloc
+    breaker = get_breaker(host)
+    if not breaker.allow():
+        tracing.count("http_circuit_open", host=host)
+        raise CircuitOpenError(f"{host} unavailable (circuit open)")
+
+    with tracing.span(_span_name(url, label), host=host) as span:
+        response = await _aget_with_retries(url, params, timeout, breaker)
+        span.set(status=response.status_code)
+    return response
+
+
+async def _aget_with_retries(url, params, timeout, breaker):
+    recorded = False
+    try:
+        import aiohttp
+
+        session = get_async_session()
+        request_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else None
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                async with session.get(url, params=params, timeout=request_timeout) as raw:
+                    response = AsyncResponse(raw.status, await raw.read(), raw.headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == MAX_RETRIES:
+                    recorded = True
+                    breaker.record_failure()
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    recorded = True
+                    breaker.record_success()
+                    return response
+                if attempt == MAX_RETRIES:
+                    recorded = True
+                    breaker.record_failure()
+                    return response
+            await asyncio.sleep(0.25 * (2 ** attempt))  # Same backoff as the sync session
+    finally:
+        if not recorded:
+            breaker.abandon()  # Cancelled or failed unexpectedly: no outcome was recorded
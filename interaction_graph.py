@@ -0,0 +1,120 @@
+import numpy as np
+
+# ==========================================
+# DRUG INTERACTION GRAPH
+# ==========================================
+# Drug-drug interactions as an undirected graph over integer drug IDs, stored
+# as a symmetric CSR adjacency matrix with a severity per edge:
+#
+#   neighbours of drug d:  neighbors[indptr[d]:indptr[d + 1]]   (sorted IDs)
+#                          severity[indptr[d]:indptr[d + 1]]
+#
+# Rows are sorted and so are the columns within a row, so the flattened keys
+# row * n + col are globally sorted. Screening a medication list is then one
+# searchsorted over the keys of all k * (k - 1) / 2 candidate pairs,
+# whatever the number of edges or the degree of hub drugs like warfarin.
+#
+# An interaction applies in both directions, so it does not matter which
+# drug of a pair is the newly proposed one. The patient's existing
+# medications are screened against each other as well.
+#
+# Finding drug names in free text is the rule engine's job (an Automaton
+# over `names`); this module only deals in IDs.
+#
+# Table format (as in rule files): {"warfarin": ["aspirin", ...]} with the
+# default severity, or {"warfarin": {"aspirin": "major", ...}}.
+
+SEVERITIES = ("minor", "moderate", "major", "contraindicated")
+SEVERITY_LEVEL = {name: level for level, name in enumerate(SEVERITIES, start=1)}
+DEFAULT_SEVERITY = "major"
+
+
+_pairs = {}
+
+
+def _pair_indices(k):
+    """Index arrays of all i < j pairs among k items (np.triu_indices is slow enough to cache)."""
+    pairs = _pairs.get(k)
+    if pairs is None:
+        pairs = _pairs[k] = np.triu_indices(k, 1)
+    return pairs
+
+
+class InteractionGraph:
+    """Symmetric sparse interaction graph; see the module comment for the layout."""
+
+    def __init__(self, names, indptr, neighbors, severity):
+        self.names = list(names)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self.indptr = indptr
+        self.neighbors = neighbors
+        self.severity = severity
+        rows = np.repeat(np.arange(len(self.names), dtype=np.int64), np.diff(indptr))
+        self.keys = rows * len(self.names) + neighbors
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        """Build from (drug, drug, severity name) triples; repeated pairs keep the highest severity."""
+        ids = {}
+        src, dst, level = [], [], []
+        for a, b, severity in pairs:
+            a, b = a.lower(), b.lower()
+            if a == b:
+                continue
+            src.append(ids.setdefault(a, len(ids)))
+            dst.append(ids.setdefault(b, len(ids)))
+            level.append(SEVERITY_LEVEL[severity])
+        n = len(ids)
+
+        # Both directions, sorted by (row, col); for duplicates the highest
+        # severity sorts last and is the one kept
+        rows = np.array(src + dst, dtype=np.int64)
+        cols = np.array(dst + src, dtype=np.int64)
+        levels = np.array(level + level, dtype=np.int8)
+        order = np.lexsort((levels, cols, rows))
+        rows, cols, levels = rows[order], cols[order], levels[order]
+        last = np.ones(len(rows), dtype=bool)
+        last[:-1] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        rows, cols, levels = rows[last], cols[last], levels[last]
+
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+        return cls(sorted(ids, key=ids.get), indptr, cols, levels)
+
+    @classmethod
+    def from_table(cls, interactions):
+        """Build from a rule-file style interactions table."""
+        def pairs():
+            for drug, partners in interactions.items():
+                if isinstance(partners, dict):
+                    for partner, severity in partners.items():
+                        yield drug, partner, severity
+                else:
+                    for partner in partners:
+                        yield drug, partner, DEFAULT_SEVERITY
+        return cls.from_pairs(pairs())
+
+    @property
+    def edges(self):
+        return len(self.neighbors) // 2
+
+    def interacting(self, drug):
+        """[(partner, severity name)] for one drug."""
+        i = self.ids.get(drug.lower())
+        if i is None:
+            return []
+        lo, hi = self.indptr[i], self.indptr[i + 1]
+        return [(self.names[j], SEVERITIES[s - 1]) for j, s in zip(self.neighbors[lo:hi], self.severity[lo:hi])]
+
+    def conflicts(self, ids):
+        """Every interacting pair among `ids`, as (id, id, severity level) with the smaller ID first."""
+        query = np.fromiter(sorted(set(ids)), dtype=np.int64)
+        k = len(query)
+        if k < 2 or not len(self.keys):
+            return []
+        i, j = _pair_indices(k)
+        a, b = query[i], query[j]
+        wanted = a * len(self.names) + b
+        pos = np.minimum(np.searchsorted(self.keys, wanted), len(self.keys) - 1)
+        hit = self.keys[pos] == wanted
+        return list(zip(a[hit].tolist(), b[hit].tolist(), self.severity[pos[hit]].tolist()))
@@ -0,0 +1,237 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import scheduler
+import tracing
+from cache import TieredCache, default_cache_path
+
+# ==========================================
+# LLM COMPLETION CACHE
+# ==========================================
+# Chat completions are cached on a hash of everything that shapes the
+# answer: model, system message, prompt (canonicalized), temperature and
+# max_tokens. A re-run of the same patient + query (page refresh, batch
+# re-run) is then served locally instead of paying another API round trip.
+# stream()/astream() are the token-streaming variants used by the agents.
+#
+# Tunables (environment):
+#   LLM_CACHE        "off" disables the cache entirely (default on)
+#   LLM_CACHE_TTL    seconds before a cached answer expires (default 1 day)
+#
+# Per call, pass bypass=True (or put "bypass_cache": True in the graph
+# state) to force a fresh completion; the fresh answer still refreshes the
+# cache.
+#
+# Misses go to Groq through the "groq" scheduler (rate limit, priority; see
+# scheduler.py). Identical requests already in flight are coalesced on the
+# cache key, so concurrent duplicates cost one completion.
+
+DEFAULT_TTL = 24 * 3600  # Guidelines don't move daily, but model updates do
+
+ENABLED = os.getenv("LLM_CACHE", "on").lower() not in ("0", "off", "false", "no")
+
+completion_cache = TieredCache(default_cache_path("llm.sqlite"), "chat_completion",
+                               max_memory_items=512, max_disk_items=50_000,
+                               ttl=float(os.getenv("LLM_CACHE_TTL", DEFAULT_TTL)))
+
+_metrics = {"hits": 0, "misses": 0, "bypassed": 0, "tokens_saved": 0, "latency_saved_s": 0.0}
+_metrics_lock = threading.Lock()
+
+
+def canonicalize(text):
+    """Normalize line endings and insignificant whitespace in a prompt."""
+    lines = text.replace("\r\n", "\n").split("\n")
+    return "\n".join(re.sub(r"[ \t]+", " ", line).strip() for line in lines).strip()
+
+
+def cache_key(request):
+    """Stable hash of the parts of a chat completion request that shape the answer."""
+    system = [m["content"] for m in request["messages"] if m["role"] == "system"]
+    prompt = [(m["role"], canonicalize(m["content"]))
+              for m in request["messages"] if m["role"] != "system"]
+    material = json.dumps([
+        request["model"],
+        [canonicalize(s) for s in system],
+        prompt,
+        request.get("temperature"),
+        request.get("max_tokens"),
+    ], ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _record(**counts):
+    with _metrics_lock:
+        for name, value in counts.items():
+            _metrics[name] += value
+
+
+def _lookup(request, bypass, span):
+    """(key, cached entry or None). key is None when caching is off."""
+    if not ENABLED:
+        span.set(cache="off")
+        return None, None
+    key = cache_key(request)
+    if bypass:
+        _record(bypassed=1)
+        result = "bypass"
+        entry = None
+    else:
+        entry = completion_cache.get(key)
+        if entry is None:
+            _record(misses=1)
+            result = "miss"
+        else:
+            _record(hits=1, tokens_saved=entry["total_tokens"], latency_saved_s=entry["latency_s"])
+            result = "hit"
+    span.set(cache=result)
+    tracing.count("cache_requests", cache="llm", result=result)
+    return key, entry
+
+
+def _store(key, content, usage, latency, span, label):
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    span.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    tracing.count("llm_tokens", prompt_tokens, call=label, kind="prompt")
+    tracing.count("llm_tokens", completion_tokens, call=label, kind="completion")
+    if key is not None and content:
+        completion_cache.set(key, {
+            "content": content,
+            "total_tokens": getattr(usage, "total_tokens", 0) or 0,
+            "latency_s": round(latency, 3),
+        })
+    return content
+
+
+def _chunk_parts(chunk):
+    """(text delta, usage) from a streamed chunk; Groq reports usage on the last one."""
+    delta = chunk.choices[0].delta.content if chunk.choices else None
+    usage = chunk.usage or getattr(chunk.x_groq, "usage", None)
+    return delta, usage
+
+
+def _flight_key(key, request):
+    """Coalescing key for a miss (the cache key, also when caching is off)."""
+    return key or cache_key(request)
+
+
+def complete(client, request, bypass=False, label="chat"):
+    """
+    Return the assistant message content for `request` (the kwargs for
+    client.chat.completions.create), from the cache when possible.
+    `label` names the tracing span ("llm.<label>").
+    """
+    with tracing.span(f"llm.{label}", model=request["model"]) as span:
+        key, entry = _lookup(request, bypass, span)
+        if entry is not None:
+            return entry["content"]
+
+        def fetch():
+            start = time.perf_counter()
+            completion = client.chat.completions.create(**request)
+            return _store(key, completion.choices[0].message.content, completion.usage,
+                          time.perf_counter() - start, span, label)
+
+        return scheduler.call("groq", fetch, key=_flight_key(key, request))
+
+
+async def acomplete(client, request, bypass=False, label="chat"):
+    """Async equivalent of complete() for AsyncGroq clients."""
+    with tracing.span(f"llm.{label}", model=request["model"]) as span:
+        key, entry = _lookup(request, bypass, span)
+        if entry is not None:
+            return entry["content"]
+
+        async def fetch():
+            start = time.perf_counter()
+            completion = await client.chat.completions.create(**request)
+            return _store(key, completion.choices[0].message.content, completion.usage,
+                          time.perf_counter() - start, span, label)
+
+        return await scheduler.acall("groq", fetch, key=_flight_key(key, request))
+
+
+def stream(client, request, on_token, bypass=False, label="chat"):
+    """
+    Like complete(), but requests a streamed completion and calls
+    on_token(text) for every delta as it arrives. A cache hit (or a
+    duplicate of a request already streaming) is delivered as a single
+    delta. Returns the full content.
+    """
+    with tracing.span(f"llm.{label}", model=request["model"]) as span:
+        key, entry = _lookup(request, bypass, span)
+        if entry is not None:
+            on_token(entry["content"])
+            return entry["content"]
+        parts, usage = [], None
+
+        def fetch():
+            nonlocal usage
+            start = time.perf_counter()
+            for chunk in client.chat.completions.create(stream=True, **request):
+                delta, chunk_usage = _chunk_parts(chunk)
+                usage = chunk_usage or usage
+                if delta:
+                    if not parts:
+                        span.set(ttft_s=round(time.perf_counter() - start, 6))
+                    parts.append(delta)
+                    on_token(delta)
+            return _store(key, "".join(parts), usage, time.perf_counter() - start, span, label)
+
+        content = scheduler.call("groq", fetch, key=_flight_key(key, request))
+        if not parts and content:
+            on_token(content)  # Coalesced onto another caller's stream
+        return content
+
+
+async def astream(client, request, on_token, bypass=False, label="chat"):
+    """Async equivalent of stream() for AsyncGroq clients."""
+    with tracing.span(f"llm.{label}", model=request["model"]) as span:
+        key, entry = _lookup(request, bypass, span)
+        if entry is not None:
+            on_token(entry["content"])
+            return entry["content"]
+        parts, usage = [], None
+
+        async def fetch():
+            nonlocal usage
+            start = time.perf_counter()
+            async for chunk in await client.chat.completions.create(stream=True, **request):
+                delta, chunk_usage = _chunk_parts(chunk)
+                usage = chunk_usage or usage
+                if delta:
+                    if not parts:
+                        span.set(ttft_s=round(time.perf_counter() - start, 6))
+                    parts.append(delta)
+                    on_token(delta)
+            return _store(key, "".join(parts), usage, time.perf_counter() - start, span, label)
+
+        content = await scheduler.acall("groq", fetch, key=_flight_key(key, request))
+        if not parts and content:
+            on_token(content)  # Coalesced onto another caller's stream
+        return content
+
+
+def cache_stats():
+    """Hit rate plus the tokens and API latency the cache has saved."""
+    with _metrics_lock:
+        stats = dict(_metrics)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+    stats["latency_saved_s"] = round(stats["latency_saved_s"], 3)
+    stats["storage"] = dict(completion_cache.stats)
+    return stats
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) >= 2 and sys.argv[1] == "clear":
+        completion_cache.clear()
+        print("LLM completion cache cleared.")
+    else:
+        print("Usage: python llm_cache.py clear")
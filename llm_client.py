@@ -0,0 +1,46 @@
+import os
+import threading
+
+import http_client
+
+# ==========================================
+# GROQ CLIENTS (built on first use)
+# ==========================================
+# The groq package (httpx, pydantic models) takes about half a second to
+# import, so the clients are created when an agent first calls the LLM
+# rather than when the agent modules are imported. CLI runs, tests and
+# benchmarks that never reach an LLM call don't pay for it, and a worker
+# forked from a preloaded parent builds its own client (and connection pool)
+# instead of inheriting the parent's sockets.
+
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+
+
+def get_client():
+    """The process-wide blocking Groq client (recreated after a fork)."""
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _lock:
+            if _client is None or _client_pid != os.getpid():
+                from groq import Groq
+
+                _client, _client_pid = Groq(api_key=os.getenv("GROQ_API_KEY")), os.getpid()
+    return _client
+
+
+def _new_async_client():
+    from groq import AsyncGroq, DefaultAioHttpClient
+
+    return AsyncGroq(api_key=os.getenv("GROQ_API_KEY"), http_client=DefaultAioHttpClient())
+
+
+# One asyncio client per event loop, on aiohttp, which holds up far better
+# than httpx at high concurrency
+get_async_client = http_client.loop_local(_new_async_client)
+
+
+def preload():
+    """Import the groq package without creating a client (for a parent process that forks workers)."""
+    import groq  # noqa: F401
@@ -1,50 +1,265 @@
+import gc
 import json
-from typing import TypedDict
-from langgraph.graph import StateGraph, END
+import os
+import threading
+import time
+from typing import Optional, TypedDict
+
+import checkpoint
+import scheduler
+import tracing
 
 # Import our agents
-from personalization_agent import personalization_node
-from research_agent import research_node
-from safety_agent import safety_agent_node
+from combined_agent import (COMBINED_SAFETY_INPUTS, CONSULT_INPUTS, aconsult_node, acombined_safety_node,
+                            combined_safety_node, consult_node)
+from personalization_agent import apersonalization_node, personalization_node
+from research_agent import (RESEARCH_INPUTS, RETRIEVAL_INPUTS, aresearch_node, aretrieval_node, research_node,
+                            retrieval_node)
+from safety_agent import RULE_CHECK_INPUTS, SAFETY_INPUTS, asafety_agent_node, rule_check_node, safety_agent_node
 
 # 1. Define the State (The Baton passed between agents)
 class AgentState(TypedDict):
     patient_id: str
     user_query: str
     patient_profile: dict
+    pubmed_results: Optional[str]
     research_findings: str
+    rule_warnings: list
     safety_check: str
     final_answer: str
+    bypass_cache: bool  # Optional: force fresh LLM completions for this run
+    priority: str  # Optional: "urgent", "normal" (default) or "batch" (see scheduler.py)
+    safety_review: str  # "combined" graph: the review written with the recommendation
+
+# What each checkpointed node reads and writes, in execution order (see
+# checkpoint.py). personalize is not checkpointed: its input is the patient
+# store itself, and an indexed lookup costs less than a checkpoint would.
+NODE_DEPENDENCIES = {
+    "retrieve": (RETRIEVAL_INPUTS, ("pubmed_results",)),
+    "research": (RESEARCH_INPUTS, ("research_findings",)),
+    "rule_check": (RULE_CHECK_INPUTS, ("rule_warnings",)),
+    "safety": (SAFETY_INPUTS, ("safety_check", "final_answer")),
+}
+# The same for the "combined" graph (see combined_agent.py)
+COMBINED_DEPENDENCIES = {
+    "retrieve": (RETRIEVAL_INPUTS, ("pubmed_results",)),
+    "consult": (CONSULT_INPUTS, ("research_findings", "safety_review")),
+    "rule_check": (RULE_CHECK_INPUTS, ("rule_warnings",)),
+    "safety": (COMBINED_SAFETY_INPUTS, ("safety_check", "final_answer")),
+}
+STREAMED_FIELDS = ("research_findings", "safety_check")  # Re-emitted in one piece on a checkpoint hit
+
+# Topology of the default graph (get_app / main.app): "parallel" or "combined"
+GRAPH_TOPOLOGY = os.getenv("MEDP_GRAPH", "parallel")
+
+def affected_nodes(changed, topology="parallel"):
+    """
+    Nodes a re-run recomputes when the given state paths change, e.g.
+    affected_nodes(["patient_profile.vitals.creatinine"]) -> ["safety"].
+    """
+    dependencies = COMBINED_DEPENDENCIES if topology == "combined" else NODE_DEPENDENCIES
+    return checkpoint.affected_nodes(dependencies, changed)
 
 # 2. Build the Graph
-workflow = StateGraph(AgentState)
+def build_graph(topology="parallel", use_async=False, checkpoints=None):
+    """
+    Compile the agent workflow.
+
+    "parallel" (default): PubMed retrieval only needs the query, so it starts
+    at the entry point alongside patient loading; both branches join before
+    the LLM synthesis, then rule checks and the AI safety review follow.
+
+        START -> personalize --\
+                                +--> research -> rule_check -> safety -> END
+        START -> retrieve -----/
+
+    "sequential": the original personalize -> research -> safety chain.
+
+    "combined": like "parallel", but one LLM call writes the recommendation
+    and its safety review (consult); the safety node makes a second call only
+    when the rule checks flag a conflict (see combined_agent.py).
+
+    use_async=True wires in the async node variants (AsyncGroq + aiohttp), so
+    the graph must be driven with `ainvoke` / `astream`; many consultations
+    can then share one event loop instead of one thread each.
+
+    checkpoints=True (default: $MEDP_CHECKPOINTS) caches each node's output
+    on the state it reads (NODE_DEPENDENCIES), so re-running a consultation
+    after a patient record changes recomputes only the affected nodes.
+    """
+    from langgraph.graph import END, START, StateGraph  # Deferred: ~1s to import
+
+    workflow = StateGraph(AgentState)
+    if checkpoints is None:
+        checkpoints = checkpoint.ENABLED
+    dependencies = COMBINED_DEPENDENCIES if topology == "combined" else NODE_DEPENDENCIES
+
+    def add_node(name, node):
+        if checkpoints and name in dependencies:
+            node = checkpoint.checkpointed(name, node, dependencies[name][0], replay=STREAMED_FIELDS)
+        # External calls queue at the run's priority (read before the checkpoint projection)
+        node = scheduler.prioritized(node)
+        # Every node is timed as a "node.<name>" span when tracing is enabled
+        workflow.add_node(name, tracing.traced(f"node.{name}", node))
+
+    if use_async:
+        personalize, retrieve, research, safety = (
+            apersonalization_node, aretrieval_node, aresearch_node, asafety_agent_node)
+    else:
+        personalize, retrieve, research, safety = (
+            personalization_node, retrieval_node, research_node, safety_agent_node)
 
-# Add Nodes
-workflow.add_node("personalize", personalization_node)
-workflow.add_node("research", research_node)
-workflow.add_node("safety", safety_agent_node)
+    if topology == "sequential":
+        add_node("personalize", personalize)
+        add_node("research", research)
+        add_node("safety", safety)
 
-# Add Edges (The Logic Flow)
-workflow.set_entry_point("personalize")
-workflow.add_edge("personalize", "research")
-workflow.add_edge("research", "safety")
-workflow.add_edge("safety", END)
+        workflow.set_entry_point("personalize")
+        workflow.add_edge("personalize", "research")
+        workflow.add_edge("research", "safety")
+        workflow.add_edge("safety", END)
+        return workflow.compile()
 
-# Compile
-app = workflow.compile()
+    if topology == "combined":
+        if use_async:
+            consult, combined_safety = aconsult_node, acombined_safety_node
+        else:
+            consult, combined_safety = consult_node, combined_safety_node
+        add_node("personalize", personalize)
+        add_node("retrieve", retrieve)
+        add_node("consult", consult)
+        add_node("rule_check", rule_check_node)
+        add_node("safety", combined_safety)
+
+        workflow.add_edge(START, "personalize")
+        workflow.add_edge(START, "retrieve")
+        workflow.add_edge(["personalize", "retrieve"], "consult")
+        workflow.add_edge("consult", "rule_check")
+        workflow.add_edge("rule_check", "safety")
+        workflow.add_edge("safety", END)
+        return workflow.compile()
+
+    if topology != "parallel":
+        raise ValueError(f"Unknown topology: {topology}")
+
+    # Add Nodes (rule_check is pure CPU work, so it has no async variant)
+    add_node("personalize", personalize)
+    add_node("retrieve", retrieve)
+    add_node("research", research)
+    add_node("rule_check", rule_check_node)
+    add_node("safety", safety)
+
+    # Add Edges (The Logic Flow): fan out, join, then validate
+    workflow.add_edge(START, "personalize")
+    workflow.add_edge(START, "retrieve")
+    workflow.add_edge(["personalize", "retrieve"], "research")
+    workflow.add_edge("research", "rule_check")
+    workflow.add_edge("rule_check", "safety")
+    workflow.add_edge("safety", END)
+    return workflow.compile()
+
+# Compiled on first use, so importing main stays cheap
+_apps = {}
+_apps_lock = threading.Lock()
+
+def get_app(use_async=False):
+    """The default ($MEDP_GRAPH) compiled graph (async_app for use_async=True), built once per process."""
+    app = _apps.get(use_async)
+    if app is None:
+        with _apps_lock:
+            app = _apps.get(use_async)
+            if app is None:
+                app = _apps[use_async] = build_graph(GRAPH_TOPOLOGY, use_async=use_async)
+    return app
+
+def __getattr__(name):
+    # main.app / main.async_app (drive with async_app.ainvoke / astream)
+    if name == "app":
+        return get_app()
+    if name == "async_app":
+        return get_app(use_async=True)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def preload():
+    """
+    Build everything read-only a consultation needs (both compiled graphs,
+    the heavy imports, rule tables, drug names, patient index, guideline
+    index) in a parent process, before it forks workers. The workers then
+    share it copy-on-write instead of each paying for it on its first request.
+    Network clients are not created here: each worker builds its own.
+    """
+    import http_client
+    import llm_client
+    from drug_normalizer import get_normalizer
+    from guideline_index import get_guideline_index
+    from patient_store import get_patient_store
+    from safety_agent import get_rule_engine
+
+    get_app()
+    get_app(use_async=True)
+    http_client.preload()
+    llm_client.preload()
+    get_rule_engine()
+    get_normalizer()
+    get_guideline_index()
+    try:
+        get_patient_store().refresh()
+    except FileNotFoundError:
+        pass  # Reported on the first lookup, as without preloading
+    # Move everything allocated so far out of the collector's reach: a GC
+    # pass in a worker would otherwise write to these objects' headers and
+    # un-share their pages
+    gc.freeze()
 
 # ==========================================
 # 3. HELPER FUNCTION TO RUN SCENARIOS
 # ==========================================
+STREAM_HEADINGS = {
+    "research_findings": "📚 AI RESEARCH FINDINGS (live):",
+    "safety_check": "🛡️ SAFETY VALIDATION (live):",
+}
+
+def stream_consultation(graph, inputs):
+    """
+    Run the graph with token streaming. Yields ("token", field, delta) as
+    research/safety text arrives and finally ("result", state, metrics),
+    where metrics has time-to-first-token and total latency in seconds.
+    """
+    start = time.perf_counter()
+    ttft = None
+    result = {}
+    for mode, payload in graph.stream(inputs, stream_mode=["custom", "values"]):
+        if mode == "values":
+            result = payload
+        elif "delta" in payload:
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            yield "token", payload["field"], payload["delta"]
+        else:
+            yield "done", payload["field"], None
+    total = time.perf_counter() - start
+    yield "result", result, {"ttft_s": ttft, "total_s": total}
+
 def run_scenario(scenario_num, patient_id, query, description):
-    """Run a single test scenario and display results."""
+    """Run a single test scenario, streaming the AI output as it is generated."""
     print("\n" + "="*80)
     print(f"📋 SCENARIO {scenario_num}: {description}")
     print("="*80)
     print(f"👤 Patient: {patient_id} | Query: {query}")
     
-    # Run the Agents
-    result = app.invoke({"patient_id": patient_id, "user_query": query})
+    # Run the Agents, rendering research and safety text token by token
+    current = None
+    for kind, first, second in stream_consultation(get_app(), {"patient_id": patient_id, "user_query": query}):
+        if kind == "token":
+            if first != current:
+                current = first
+                print(f"\n{STREAM_HEADINGS.get(first, first)}\n   ", end="")
+            print(second, end="", flush=True)
+        elif kind == "done":
+            current = None
+            print()
+        else:
+            result, metrics = first, second
     
     # Print Final Report
     print("\n" + "="*80)
@@ -62,6 +277,8 @@ def run_scenario(scenario_num, patient_id, query, description):
     print(f"🛡️ SAFETY VALIDATION:")
     print(f"   {result['safety_check']}")
     print("="*80)
+    ttft = f"{metrics['ttft_s']:.2f}s" if metrics["ttft_s"] is not None else "n/a"
+    print(f"\n⏱️ Time to first token: {ttft} | Processing Time: {metrics['total_s']:.2f} seconds")
     
     return result
 
@@ -72,42 +289,34 @@ if __name__ == "__main__":
     print("🏥 MED PERPLEXITY: MULTI-AGENT AI SYSTEM STARTUP...")
     print("Powered by: Groq AI + PubMed + ICMR Guidelines\n")
     
-    import time
-    
     # SCENARIO 1: High-Risk Drug Interaction (CKD + Antibiotic)
     # Expected: System should flag Levofloxacin contraindication
-    start_time = time.time()
     run_scenario(
         scenario_num=1,
         patient_id="P001",
         query="Patient has high fever and chest infection. Recommend antibiotics.",
         description="CRITICAL SAFETY CHECK - Kidney Disease + Antibiotic Interaction"
     )
-    print(f"\n⏱️ Processing Time: {time.time() - start_time:.2f} seconds")
     
     # SCENARIO 2: Simple Case (Healthy Patient with Migraine)
     # Expected: System should approve standard treatment
     input("\n\n⏸️  Press Enter to run SCENARIO 2...")
-    start_time = time.time()
     run_scenario(
         scenario_num=2,
         patient_id="P002",
         query="Patient complains of severe headache and sensitivity to light. Recommend treatment.",
         description="ROUTINE CASE - Migraine Management"
     )
-    print(f"\n⏱️ Processing Time: {time.time() - start_time:.2f} seconds")
     
     # SCENARIO 3: Diabetic Patient Asking for Glucose Management
     # Expected: System should recommend Metformin but check for kidney function
     input("\n\n⏸️  Press Enter to run SCENARIO 3...")
-    start_time = time.time()
     run_scenario(
         scenario_num=3,
         patient_id="P003",
         query="Patient's HbA1c is elevated at 7.2. Need medication to control blood sugar.",
         description="CHRONIC DISEASE MANAGEMENT - Type 2 Diabetes"
     )
-    print(f"\n⏱️ Processing Time: {time.time() - start_time:.2f} seconds")
     
     # Summary
     print("\n" + "="*80)
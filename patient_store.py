@@ -0,0 +1,382 @@
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+# ==========================================
+# PATIENT RECORD STORE
+# ==========================================
+# Keeps an ID -> (offset, length) index over a JSONL patient file so each
+# lookup is a single seek + read instead of parsing the whole database.
+#
+# On-disk layout:
+#   patients.jsonl          one JSON record per line, each with an "id" field
+#   patients.jsonl.idx      sidecar index header, rebuilt automatically when stale
+#   patients.jsonl.idx.npy  the index: 64-bit ID hashes (sorted), offsets and
+#                           line lengths as one (3, n) uint64 array
+#
+# The index array is memory-mapped rather than loaded into a dict, so a
+# million patients cost no Python objects, opening it is O(1), and server
+# workers forked from one parent (server.py) all read the same pages from
+# the OS page cache. A lookup is a binary search on the hash column; the
+# record read back is checked against the requested ID.
+#
+# The file is treated as append-only: updating a patient means appending a
+# new line with the same "id" (the latest line wins). Appends are picked up
+# incrementally by indexing only the new tail of the file into a small dict
+# that overrides the mapped index, and folded into a new array once it grows
+# past TAIL_LIMIT_RATIO of it.
+#
+# The legacy patients.json format (one dict keyed by patient ID) is still
+# supported, but it has to be parsed in full; it is loaded once per file
+# version instead of on every request. Use `python patient_store.py convert`
+# to move a legacy database to JSONL.
+
+DEFAULT_DB_PATH = "patients.json"
+INDEX_VERSION = 2
+TAIL_LIMIT_RATIO = 1 / 32  # Tail entries (vs. mapped ones) before they are merged
+MIN_TAIL_LIMIT = 1024
+
+
+def id_key(patient_id):
+    """Stable 64-bit hash of a patient ID (hash() is salted per process)."""
+    return int.from_bytes(hashlib.blake2b(patient_id.encode(), digest_size=8).digest(), "little")
+
+
+EMPTY_INDEX = np.zeros((3, 0), dtype=np.uint64)
+
+
+def _mapped(path):
+    # A plain ndarray view of the memmap: same pages, without the subclass's
+    # per-operation overhead on the lookup path
+    return np.load(path, mmap_mode="r").view(np.ndarray)
+
+
+class PatientStore:
+    """
+    O(1) patient lookups over a JSONL (or legacy JSON) patient database.
+    Safe to share between threads; reloads itself when the file changes.
+    """
+
+    def __init__(self, path, persist_index=True):
+        self.path = path
+        self.persist_index = persist_index
+        self.index_path = path + ".idx"
+        self.array_path = self.index_path + ".npy"
+        self.is_jsonl = path.endswith(".jsonl")
+        self._lock = threading.Lock()
+        # JSONL: (index array, tail, superseded) swapped as one, so readers
+        # never pair a merged array with the tail it replaced. The array is
+        # (3, n): sorted ID hashes, offsets, lengths; the tail maps IDs
+        # appended since the array was built to (offset, length); superseded
+        # lists the array columns whose ID the tail has a newer line for
+        self._view = (EMPTY_INDEX, {}, ())
+        self._records = {}      # legacy JSON: patient_id -> record
+        self._indexed_size = 0
+        self._signature = None  # (mtime_ns, size) of the indexed file version
+
+    # ------------------------------------------
+    # Public API
+    # ------------------------------------------
+    def get(self, patient_id):
+        """Return the raw patient record, or None if the ID is unknown."""
+        self.refresh()
+        if not self.is_jsonl:
+            return self._records.get(patient_id)
+
+        array, tail, _ = self._view
+        entry = tail.get(patient_id)
+        if entry is not None:
+            return self._read(*entry)
+        for offset, length in self._candidates(array, id_key(patient_id)):
+            record = self._read(offset, length)
+            if record.get("id") == patient_id:
+                return record
+        return None
+
+    def __contains__(self, patient_id):
+        if not self.is_jsonl:
+            self.refresh()
+            return patient_id in self._records
+        return self.get(patient_id) is not None
+
+    def __len__(self):
+        self.refresh()
+        if not self.is_jsonl:
+            return len(self._records)
+        array, tail, superseded = self._view
+        return array.shape[1] + len(tail) - len(superseded)
+
+    def ids(self):
+        """Return the list of known patient IDs (JSONL: read from the file)."""
+        self.refresh()
+        if not self.is_jsonl:
+            return list(self._records)
+        return [record["id"] for record in self.records()]
+
+    def records(self):
+        """
+        Yield every patient record (the latest version of each) in one
+        sequential read of the file, for whole-population jobs.
+        """
+        self.refresh()
+        if not self.is_jsonl:
+            for patient_id, record in self._records.items():
+                yield record if "id" in record else dict(record, id=patient_id)
+            return
+
+        array, tail, superseded = self._view
+        current = np.delete(array[1], superseded)
+        current = np.sort(np.concatenate([current, np.array([o for o, _ in tail.values()], dtype=np.uint64)]))
+        wanted = iter(current.tolist())
+        next_offset = next(wanted, None)
+        offset, end = 0, self._indexed_size
+        with open(self.path, "rb") as f:
+            for line in f:
+                if offset >= end or next_offset is None:
+                    break
+                if offset == next_offset:
+                    yield json.loads(line)
+                    next_offset = next(wanted, None)
+                offset += len(line)
+
+    def refresh(self):
+        """
+        Bring the in-memory index up to date with the file on disk.
+        Cheap (one stat call) when nothing has changed.
+        """
+        stat = os.stat(self.path)  # Raises FileNotFoundError like open() did
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return
+
+        with self._lock:
+            if signature == self._signature:
+                return
+            if self.is_jsonl:
+                self._refresh_jsonl(signature)
+            else:
+                with open(self.path, "r") as f:
+                    self._records = json.load(f)
+            self._signature = signature
+
+    # ------------------------------------------
+    # JSONL indexing
+    # ------------------------------------------
+    def _read(self, offset, length):
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.read(length))
+
+    @staticmethod
+    def _candidates(array, key):
+        """(offset, length) of every mapped entry whose ID hashes to `key`."""
+        keys, key = array[0], np.uint64(key)
+        i = int(np.searchsorted(keys, key))
+        while i < len(keys) and keys[i] == key:
+            yield int(array[1, i]), int(array[2, i])
+            i += 1
+
+    def _superseded(self, array, patient_ids):
+        """Columns of `array` whose ID is one of `patient_ids` (one record read per hash match)."""
+        if not array.shape[1]:
+            return []
+        columns = []
+        for patient_id in patient_ids:
+            key = np.uint64(id_key(patient_id))
+            i = int(np.searchsorted(array[0], key))
+            while i < array.shape[1] and array[0, i] == key:
+                if self._read(int(array[1, i]), int(array[2, i])).get("id") == patient_id:
+                    columns.append(i)
+                    break
+                i += 1
+        return columns
+
+    def _refresh_jsonl(self, signature):
+        size = signature[1]
+
+        if self._signature is None and self._load_sidecar(signature):
+            return
+
+        if self._signature is not None and size > self._indexed_size and self._prefix_intact():
+            # Append-only growth: only index the new tail
+            self._extend_tail(signature)
+        else:
+            self._rebuild(signature)
+
+    def _prefix_intact(self):
+        """Heuristic check that the already-indexed prefix was not rewritten."""
+        if self._indexed_size == 0:
+            return True
+        with open(self.path, "rb") as f:
+            f.seek(self._indexed_size - 1)
+            return f.read(1) == b"\n"
+
+    def _rebuild(self, signature):
+        # Build into a fresh dict so concurrent readers never see a half-built index
+        index = {}
+        self._scan(index, 0, signature[1])
+        self._install(self._to_array(index), signature)
+
+    def _extend_tail(self, signature):
+        """Index the lines appended since _indexed_size, then merge the tail if it grew too large."""
+        array, tail, superseded = self._view
+        # Scan into a copy: readers iterate the live tail without the lock
+        new_tail = dict(tail)
+        self._scan(new_tail, self._indexed_size, signature[1])
+        # Only IDs new to the tail can supersede another column
+        superseded = tuple(superseded) + tuple(self._superseded(array, new_tail.keys() - tail.keys()))
+        self._view = (array, new_tail, superseded)
+        self._merge_tail(signature)
+
+    def _merge_tail(self, signature):
+        """Fold the tail into a new index array once it is large enough to slow lookups down."""
+        array, tail, superseded = self._view
+        if len(tail) <= max(MIN_TAIL_LIMIT, array.shape[1] * TAIL_LIMIT_RATIO):
+            return
+        kept = np.delete(array, superseded, axis=1)
+        self._install(np.concatenate([kept, self._to_array(tail)], axis=1), signature)
+
+    @staticmethod
+    def _to_array(index):
+        """(3, n) array of hash / offset / length for an ID -> (offset, length) dict, sorted by hash."""
+        array = np.empty((3, len(index)), dtype=np.uint64)
+        array[0] = np.fromiter((id_key(patient_id) for patient_id in index), dtype=np.uint64, count=len(index))
+        array[1:] = np.array(list(index.values()), dtype=np.uint64).reshape(-1, 2).T
+        return array
+
+    def _install(self, array, signature):
+        """Make `array` (covering the file up to _indexed_size) the index, persisted and mapped."""
+        array = array[:, np.argsort(array[0], kind="stable")]
+        self._view = (self._save_sidecar(array, signature), {}, ())
+
+    def _scan(self, index, start, end):
+        offset = start
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            while offset < end:
+                line = f.readline()
+                if not line:
+                    break
+                if not line.endswith(b"\n") and offset + len(line) >= end:
+                    # Partially written last line; pick it up on the next refresh
+                    break
+                stripped = line.strip()
+                if stripped:
+                    record = json.loads(stripped)
+                    index[record["id"]] = (offset, len(line))
+                offset += len(line)
+        self._indexed_size = offset
+
+    def _load_sidecar(self, signature):
+        if not self.persist_index:
+            return False
+        try:
+            with open(self.index_path, "r") as f:
+                data = json.load(f)
+            if data.get("version") != INDEX_VERSION or data.get("size", 0) > signature[1]:
+                return False
+            array = _mapped(self.array_path)
+        except (OSError, ValueError):
+            return False
+        if array.shape != (3, data.get("count")):
+            return False
+
+        self._view = (array, {}, ())
+        self._indexed_size = data["size"]
+        if data["size"] == signature[1] and data.get("mtime_ns") == signature[0]:
+            return True
+
+        # File grew since the sidecar was written: index the tail
+        if data["size"] < signature[1] and self._prefix_intact():
+            self._extend_tail(signature)
+        else:
+            self._rebuild(signature)
+        return True
+
+    def _save_sidecar(self, array, signature):
+        """Write `array` and its header; returns the memory-mapped copy (or `array` when not persisted)."""
+        if not self.persist_index:
+            return array
+        size = self._indexed_size
+        mtime_ns = signature[0] if size == signature[1] else None
+        try:
+            # The array first: an old header never describes a new array
+            with self._temp_file(self.array_path, "wb") as f:
+                np.save(f, array)
+            with self._temp_file(self.index_path, "w") as f:
+                json.dump({"version": INDEX_VERSION, "size": size, "mtime_ns": mtime_ns,
+                           "count": array.shape[1]}, f)
+            return _mapped(self.array_path)
+        except OSError as e:
+            # A read-only data directory just means we re-index on startup
+            print(f"Patient index not persisted: {e}")
+            return array
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _temp_file(path, mode):
+        """
+        Write `path` through a uniquely named temporary file renamed over it,
+        so server workers refreshing after the same append never write to,
+        or rename, each other's half-written file.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".",
+                                        prefix=os.path.basename(path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, mode) as f:
+                yield f
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+
+# ==========================================
+# SHARED STORE (one per process)
+# ==========================================
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_patient_store(path=None):
+    """
+    Return the process-wide store for `path` (defaults to $PATIENTS_DB or
+    patients.json), creating it on first use.
+    """
+    path = path or os.getenv("PATIENTS_DB", DEFAULT_DB_PATH)
+    store = _stores.get(path)
+    if store is None:
+        with _stores_lock:
+            store = _stores.setdefault(path, PatientStore(path))
+    return store
+
+
+def convert_json_to_jsonl(src_path, dest_path):
+    """Convert a legacy patients.json dict into the indexed JSONL format."""
+    with open(src_path, "r") as f:
+        db = json.load(f)
+    with open(dest_path, "w") as out:
+        for patient_id, record in db.items():
+            record = dict(record)
+            record.setdefault("id", patient_id)
+            out.write(json.dumps(record, separators=(",", ":")) + "\n")
+    return len(db)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) == 4 and sys.argv[1] == "convert":
+        count = convert_json_to_jsonl(sys.argv[2], sys.argv[3])
+        PatientStore(sys.argv[3]).refresh()  # Write the sidecar index up front
+        print(f"Converted {count} patients: {sys.argv[2]} -> {sys.argv[3]}")
+    else:
+        print("Usage: python patient_store.py convert patients.json patients.jsonl")
@@ -1,20 +1,18 @@
-import json
+from patient_store import get_patient_store
 
 def personalization_node(state):
     """
-    Reads patient_id from state, fetches profile from patients.json,
-    and updates the 'patient_profile' in the state.
+    Reads patient_id from state, fetches profile from the patient store
+    (patients.json by default, see patient_store.py), and updates the
+    'patient_profile' in the state.
     """
     print("\n--- 👤 AGENT 1: FETCHING ABDM RECORD ---")
     
     patient_id = state.get("patient_id")
     
     try:
-        # Open the local "database" file
-        with open("patients.json", "r") as f:
-            db = json.load(f)
-            
-        data = db.get(patient_id)
+        # Indexed lookup in the local "database" (loaded once per process)
+        data = get_patient_store().get(patient_id)
         
         if data:
             # Format a complete summary for the downstream agents with all available data
@@ -38,4 +36,12 @@ def personalization_node(state):
             
     except FileNotFoundError:
         print("Error: patients.json file not found.")
-        return {"patient_profile": {"error": "Database Missing"}}
\ No newline at end of file
+        return {"patient_profile": {"error": "Database Missing"}}
+
+async def apersonalization_node(state):
+    """
+    Async variant of personalization_node. The indexed store lookup is a
+    single small seek + read, cheaper than handing it off to a thread, so it
+    runs inline on the event loop.
+    """
+    return personalization_node(state)
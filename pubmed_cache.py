@@ -0,0 +1,113 @@
+import json
+import os
+import re
+import xml.etree.ElementTree as ET
+
+from cache import TieredCache, default_cache_path
+
+# ==========================================
+# PUBMED RESULT CACHE
+# ==========================================
+# esearch results (term -> PMID list) and efetch payloads (PMID -> article
+# XML) are cached separately, so a new query that overlaps an old one only
+# fetches the PMIDs we have not seen yet.
+
+DEFAULT_TTL = 7 * 24 * 3600  # PubMed records rarely change within a week
+
+_ttl = float(os.getenv("PUBMED_CACHE_TTL", DEFAULT_TTL))
+_path = default_cache_path("pubmed.sqlite")
+
+search_cache = TieredCache(_path, "pubmed_esearch", max_memory_items=2048, ttl=_ttl)
+article_cache = TieredCache(_path, "pubmed_article", max_memory_items=4096, max_disk_items=500_000, ttl=_ttl)
+
+
+def normalize_term(term):
+    """Case/spacing/punctuation-insensitive form of a search term."""
+    return " ".join(re.findall(r"[a-z0-9]+", term.lower()))
+
+
+def search_key(term, max_results):
+    return f"{max_results}:{normalize_term(term)}"
+
+
+def split_articles(payload):
+    """Split an efetch XML payload into {pmid: article_xml}."""
+    root = ET.fromstring(payload)
+    articles = {}
+    for article in list(root):
+        pmid = article.findtext(".//PMID")
+        if pmid:
+            articles[pmid.strip()] = ET.tostring(article, encoding="unicode")
+    return articles
+
+
+def join_articles(article_xml):
+    """Reassemble cached articles into a single PubmedArticleSet document."""
+    return "<PubmedArticleSet>\n" + "\n".join(article_xml) + "\n</PubmedArticleSet>"
+
+
+def cache_stats():
+    """Hit/miss counters for both cache layers."""
+    return {
+        "esearch": dict(search_cache.stats, hit_rate=round(search_cache.hit_rate(), 3)),
+        "efetch": dict(article_cache.stats, hit_rate=round(article_cache.hit_rate(), 3)),
+    }
+
+
+def read_query_log(path):
+    """
+    Yield clinical queries from a log file: either one query per line, or
+    JSONL with a "query" / "user_query" field.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                record = json.loads(line)
+                line = record.get("query") or record.get("user_query")
+                if not line:
+                    continue
+            yield line
+
+
+def prewarm(path, limit=None):
+    """
+    Populate the cache by replaying distinct queries from a query log.
+    Returns the number of searches issued: 0 when a local PubMed mirror
+    answers every search (PUBMED_MIRROR_PATH without PUBMED_REMOTE_FALLBACK),
+    since the cache is then never read.
+    """
+    import pubmed_mirror
+    from research_agent import pubmed_search_term, search_eutils
+
+    if pubmed_mirror.get_mirror() is not None and not pubmed_mirror.remote_fallback_enabled():
+        return 0
+
+    seen = set()
+    for query in read_query_log(path):
+        term = pubmed_search_term(query)
+        key = normalize_term(term)
+        if key in seen:
+            continue
+        seen.add(key)
+        search_eutils(term)  # The cache sits behind the mirror, if any
+        if limit and len(seen) >= limit:
+            break
+    return len(seen)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) >= 3 and sys.argv[1] == "prewarm":
+        count = prewarm(sys.argv[2], limit=int(sys.argv[3]) if len(sys.argv) > 3 else None)
+        if count:
+            print(f"Prewarmed {count} distinct queries.")
+        else:
+            print("Nothing prewarmed: searches are answered by the PubMed mirror "
+                  "(PUBMED_MIRROR_PATH) and the cache is only read with PUBMED_REMOTE_FALLBACK=on.")
+        print(json.dumps(cache_stats(), indent=2))
+    else:
+        print("Usage: python pubmed_cache.py prewarm <query_log> [limit]")
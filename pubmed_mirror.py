@@ -0,0 +1,358 @@
+import gzip
+import os
+import re
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+# ==========================================
+# LOCAL PUBMED MIRROR
+# ==========================================
+# Streams PubMed baseline / daily update files (pubmed24n0001.xml.gz, ...)
+# into a SQLite database with an FTS5 full-text index over title, abstract
+# and MeSH terms, so searches are answered locally instead of through the
+# rate-limited E-utilities API.
+#
+#   python pubmed_mirror.py ingest pubmed.db baseline/*.xml.gz updatefiles/*.xml.gz
+#   python pubmed_mirror.py search pubmed.db "metformin chronic kidney disease"
+#
+# Parsing is incremental (iterparse): each <PubmedArticle> is written and
+# then cleared, so memory stays flat however large the file. Files are
+# applied in name order and recorded, so re-running ingest only applies new
+# update files. An update file can revise an article (same PMID, replaced)
+# or delete it (<DeleteCitation>).
+#
+# Tunables (environment):
+#   PUBMED_MIRROR_PATH       mirror database; when set, search_pubmed uses it
+#   PUBMED_REMOTE_FALLBACK   "on" to fall back to E-utilities when the mirror
+#                            has no match or fails (default off)
+#   PUBMED_MIRROR_CANDIDATES best BM25 matches re-ranked with the India
+#                            boost per search (default 100)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    pmid INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    abstract TEXT NOT NULL,
+    mesh TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+    title, abstract, mesh,
+    content='articles', content_rowid='pmid', tokenize='porter unicode61'
+);
+CREATE TABLE IF NOT EXISTS ingested_files (
+    name TEXT PRIMARY KEY,
+    articles INTEGER NOT NULL,
+    deletions INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    ingested_at REAL NOT NULL
+);
+"""
+
+BATCH_SIZE = 5000
+CANDIDATES = int(os.getenv("PUBMED_MIRROR_CANDIDATES", 100))
+
+# Words that carry no signal for article retrieval (our search terms end in
+# "India guidelines treatment")
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it of on or the to with patient patients
+need needs recommend treatment guidelines guideline
+""".split())
+# Setting words: too common to match on (any Indian article would do), so
+# they only lift the score of articles that match the clinical words too
+CONTEXT_WORDS = frozenset({"india", "indian"})
+CONTEXT_BOOST = 1.5  # BM25 multiplier for matches that mention the setting
+# A match needs a majority of the clinical words; queries are cut to this
+# many words so the expression stays small. Words shorter than
+# MIN_WORD_LENGTH and numbers ("s", "7.2") are dropped before the cut.
+MAX_QUERY_WORDS = 8
+MIN_WORD_LENGTH = 3
+WORD_RE = re.compile(r"[a-z0-9]+")
+FREQUENCY_CACHE_SIZE = 100_000
+
+
+# ------------------------------------------
+# Parsing
+# ------------------------------------------
+def _text(elem):
+    """All text inside an element, including inline markup like <i>."""
+    return "".join(elem.itertext()).strip() if elem is not None else ""
+
+
+def parse_article(elem):
+    """(pmid, title, abstract, mesh) from a <PubmedArticle> element."""
+    citation = elem.find("MedlineCitation")
+    pmid = int(citation.findtext("PMID").strip())
+    article = citation.find("Article")
+    title = _text(article.find("ArticleTitle")) if article is not None else ""
+    sections = []
+    for part in (article.iterfind("Abstract/AbstractText") if article is not None else ()):
+        label = part.get("Label")
+        text = _text(part)
+        sections.append(f"{label}: {text}" if label else text)
+    mesh = "; ".join(_text(d) for d in citation.iterfind("MeshHeadingList/MeshHeading/DescriptorName"))
+    return pmid, title, " ".join(sections), mesh
+
+
+def iter_records(path):
+    """
+    Yield ("article", (pmid, title, abstract, mesh)) and ("delete", pmid)
+    records from a PubMed XML (or .xml.gz) file in constant memory.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        context = ET.iterparse(f, events=("start", "end"))
+        _, root = next(context)
+        for event, elem in context:
+            if event != "end":
+                continue
+            if elem.tag == "PubmedArticle":
+                yield "article", parse_article(elem)
+                root.clear()  # Drop the finished article (and any siblings) from the tree
+            elif elem.tag == "DeleteCitation":
+                for pmid in elem.iterfind("PMID"):
+                    yield "delete", int(pmid.text.strip())
+                root.clear()
+
+
+# ------------------------------------------
+# Storage
+# ------------------------------------------
+def connect(path, readonly=False):
+    if readonly:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+    return conn
+
+
+def _delete(conn, pmids):
+    """Remove articles and their full-text rows (external-content FTS needs the old values)."""
+    for pmid in pmids:
+        row = conn.execute("SELECT title, abstract, mesh FROM articles WHERE pmid = ?", (pmid,)).fetchone()
+        if row is not None:
+            conn.execute("INSERT INTO articles_fts(articles_fts, rowid, title, abstract, mesh) "
+                         "VALUES ('delete', ?, ?, ?, ?)", (pmid, *row))
+            conn.execute("DELETE FROM articles WHERE pmid = ?", (pmid,))
+
+
+def _upsert(conn, records):
+    _delete(conn, [record[0] for record in records])  # Revised citations replace the old version
+    conn.executemany("INSERT INTO articles(pmid, title, abstract, mesh) VALUES (?, ?, ?, ?)", records)
+    conn.executemany("INSERT INTO articles_fts(rowid, title, abstract, mesh) VALUES (?, ?, ?, ?)", records)
+
+
+def ingest_file(conn, path):
+    """Apply one baseline/update file. Returns (articles, deletions)."""
+    start = time.perf_counter()
+    batch, articles, deletions = {}, 0, 0
+    with conn:
+        for kind, record in iter_records(path):
+            if kind == "article":
+                batch[record[0]] = record  # Latest version in the file wins
+                articles += 1
+                if len(batch) >= BATCH_SIZE:
+                    _upsert(conn, list(batch.values()))
+                    batch.clear()
+            else:
+                # Keep the file's order: pending revisions land before a later delete
+                _upsert(conn, list(batch.values()))
+                batch.clear()
+                _delete(conn, [record])
+                deletions += 1
+        _upsert(conn, list(batch.values()))
+        conn.execute("INSERT OR REPLACE INTO ingested_files VALUES (?, ?, ?, ?, ?)",
+                     (os.path.basename(path), articles, deletions, time.perf_counter() - start, time.time()))
+    return articles, deletions
+
+
+def ingest(db_path, paths, force=False):
+    """Apply files in name order, skipping ones already ingested (unless force)."""
+    conn = connect(db_path)
+    try:
+        done = {name for (name,) in conn.execute("SELECT name FROM ingested_files")}
+        applied = []
+        for path in sorted(paths, key=os.path.basename):
+            if os.path.basename(path) in done and not force:
+                continue
+            applied.append((path, *ingest_file(conn, path)))
+        return applied
+    finally:
+        conn.close()
+
+
+# ------------------------------------------
+# Search
+# ------------------------------------------
+def query_words(term):
+    """(clinical words, setting words) of a search term, in order, without duplicates."""
+    words = [w for w in dict.fromkeys(WORD_RE.findall(term.lower()))
+             if w not in STOPWORDS and len(w) >= MIN_WORD_LENGTH and not w.isdigit()]
+    return ([w for w in words if w not in CONTEXT_WORDS][:MAX_QUERY_WORDS],
+            [w for w in words if w in CONTEXT_WORDS])
+
+
+def _at_least(quorum, words):
+    """FTS5 expression for "at least `quorum` of `words`", words[0] written once."""
+    if quorum == 1:
+        return " OR ".join(f'"{w}"' for w in words)
+    if quorum == len(words):
+        return " AND ".join(f'"{w}"' for w in words)
+    return f'("{words[0]}" AND ({_at_least(quorum - 1, words[1:])})) OR ({_at_least(quorum, words[1:])})'
+
+
+def match_expression(term, frequency=None):
+    """
+    FTS5 query matching articles with a majority of the clinical words,
+    e.g. "fever cough infection" -> any two of the three. Setting words
+    ("india") are left out: see CONTEXT_WORDS.
+
+    Ranking scans every article containing each word occurrence in the
+    expression, so given `frequency(word)` (articles containing it) the
+    commonest words are placed where they are written the fewest times.
+    """
+    words, _ = query_words(term)
+    if not words:
+        return ""
+    if frequency is not None:
+        words.sort(key=frequency, reverse=True)
+    return _at_least(len(words) // 2 + 1, words)
+
+
+class PubMedMirror:
+    """Read-only access to a mirror database, one connection per thread."""
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"PubMed mirror not found: {path}")
+        self.path = path
+        self._local = threading.local()
+        self._frequency = {}  # word -> articles containing it (only orders expressions, so may be stale)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._local.conn = connect(self.path, readonly=True)
+            self._local.pid = os.getpid()
+        return conn
+
+    def frequency(self, word):
+        """Number of articles containing `word`, cached."""
+        count = self._frequency.get(word)
+        if count is None:
+            if len(self._frequency) >= FREQUENCY_CACHE_SIZE:
+                self._frequency.clear()
+            count = self._frequency[word] = self._conn().execute(
+                "SELECT COUNT(*) FROM articles_fts WHERE articles_fts MATCH ?", (f'"{word}"',)).fetchone()[0]
+        return count
+
+    def search(self, term, limit=3):
+        """
+        PMIDs of the best BM25 matches for the clinical words (title and MeSH
+        weigh more than abstract). Of the top CANDIDATES, those that also
+        mention the setting words score CONTEXT_BOOST times higher.
+        """
+        expression = match_expression(term, self.frequency)
+        if not expression:
+            return []
+        conn = self._conn()
+        rows = conn.execute(
+            "SELECT rowid, rank FROM articles_fts WHERE articles_fts MATCH ?"
+            " AND rank MATCH 'bm25(5.0, 1.0, 3.0)' ORDER BY rank LIMIT ?",
+            (expression, max(limit, CANDIDATES))).fetchall()
+        _, context = query_words(term)
+        if context and rows:
+            setting = " OR ".join(f'"{w}"' for w in context)
+            in_setting = {pmid for (pmid,) in conn.execute(
+                "SELECT rowid FROM articles_fts WHERE articles_fts MATCH ?", (f"({setting}) AND ({expression})",))}
+            # bm25 scores are negative (lower is better): scaling up lifts the row
+            rows.sort(key=lambda row: row[1] * (CONTEXT_BOOST if row[0] in in_setting else 1.0))
+        return [str(pmid) for pmid, _ in rows[:limit]]
+
+    def fetch(self, pmids):
+        """{pmid: PubmedArticle XML} in the same shape efetch returns."""
+        if not pmids:
+            return {}
+        marks = ",".join("?" * len(pmids))
+        rows = self._conn().execute(
+            f"SELECT pmid, title, abstract, mesh FROM articles WHERE pmid IN ({marks})", [int(p) for p in pmids])
+        return {str(row[0]): render_article(*row) for row in rows}
+
+    def search_articles(self, term, limit=3):
+        """Article XML for the best matches, in rank order."""
+        pmids = self.search(term, limit)
+        articles = self.fetch(pmids)
+        return [articles[pmid] for pmid in pmids if pmid in articles]
+
+    def stats(self):
+        conn = self._conn()
+        return {
+            "articles": conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0],
+            "files": conn.execute("SELECT COUNT(*) FROM ingested_files").fetchone()[0],
+            "last_file": (conn.execute("SELECT name FROM ingested_files ORDER BY name DESC LIMIT 1")
+                          .fetchone() or [None])[0],
+        }
+
+
+def render_article(pmid, title, abstract, mesh):
+    """Minimal <PubmedArticle> XML, so mirror results look like efetch output downstream."""
+    article = ET.Element("PubmedArticle")
+    citation = ET.SubElement(article, "MedlineCitation")
+    ET.SubElement(citation, "PMID").text = str(pmid)
+    body = ET.SubElement(citation, "Article")
+    ET.SubElement(body, "ArticleTitle").text = title
+    ET.SubElement(ET.SubElement(body, "Abstract"), "AbstractText").text = abstract
+    if mesh:
+        headings = ET.SubElement(citation, "MeshHeadingList")
+        for name in mesh.split("; "):
+            ET.SubElement(ET.SubElement(headings, "MeshHeading"), "DescriptorName").text = name
+    return ET.tostring(article, encoding="unicode")
+
+
+_mirror = None
+_mirror_lock = threading.Lock()
+
+
+def get_mirror():
+    """The mirror at $PUBMED_MIRROR_PATH, or None when not configured."""
+    global _mirror
+    path = os.getenv("PUBMED_MIRROR_PATH")
+    if not path:
+        return None
+    if _mirror is None or _mirror.path != path:
+        with _mirror_lock:
+            if _mirror is None or _mirror.path != path:
+                _mirror = PubMedMirror(path)
+    return _mirror
+
+
+def remote_fallback_enabled():
+    return os.getenv("PUBMED_REMOTE_FALLBACK", "off").lower() in ("1", "on", "true", "yes")
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+
+    if len(sys.argv) >= 4 and sys.argv[1] == "ingest":
+        for path, articles, deletions in ingest(sys.argv[2], sys.argv[3:]):
+            print(f"{os.path.basename(path)}: {articles} articles, {deletions} deletions")
+        print(json.dumps(PubMedMirror(sys.argv[2]).stats()))
+    elif len(sys.argv) >= 4 and sys.argv[1] == "search":
+        mirror = PubMedMirror(sys.argv[2])
+        start = time.perf_counter()
+        pmids = mirror.search(" ".join(sys.argv[3:]), limit=5)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        for pmid, xml in mirror.fetch(pmids).items():
+            print(pmid, ET.fromstring(xml).findtext(".//ArticleTitle"))
+        print(f"({elapsed_ms:.2f} ms)")
+    elif len(sys.argv) == 3 and sys.argv[1] == "stats":
+        print(json.dumps(PubMedMirror(sys.argv[2]).stats()))
+    else:
+        print("Usage: python pubmed_mirror.py ingest <db> <file.xml[.gz]>...\n"
+              "       python pubmed_mirror.py search <db> <query>\n"
+              "       python pubmed_mirror.py stats <db>")
@@ -1,127 +1,226 @@
 import os
-import requests
-from groq import Groq
 from dotenv import load_dotenv
+import checkpoint
+import http_client
+from evidence import compact_evidence
+import llm_cache
+from llm_client import get_async_client, get_client
+import pubmed_cache
+import pubmed_mirror
+from guideline_index import format_passages, get_guideline_index
+import tracing
+from streaming import FieldStream
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Groq client
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-
-# Fallback Knowledge Base (used if APIs fail)
-KNOWLEDGE_BASE = {
-    "infection": """
-    [SOURCE: ICMR Guidelines for Antimicrobial Use 2024]
-    For Community-Acquired Pneumonia (bacterial):
-    - First Line: Amoxicillin 500mg TDS.
-    - Alternative (if allergic): Azithromycin 500mg OD.
-    - Severe/Comorbid: Levofloxacin 750mg OD (Caution in Renal Failure).
-    """,
-    "diabetes": """
-    [SOURCE: ICMR Guidelines for Management of Type 2 Diabetes 2018]
-    - First Line: Metformin 500mg BD.
-    - Contraindication: Avoid Metformin if eGFR < 30 mL/min (Kidney Disease).
-    - Target HbA1c: < 7.0%.
-    """,
-    "pain": """
-    [SOURCE: Standard Treatment Guidelines India]
-    For Acute Pain:
-    - Mild: Paracetamol 500mg.
-    - Moderate: Ibuprofen 400mg (Avoid in CKD/Ulcers).
-    - Severe: Tramadol 50mg.
-    """
-}
+# NCBI E-utilities endpoint (override to point at a mirror or local stub)
+EUTILS_URL = os.getenv("PUBMED_EUTILS_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils")
+# NCBI API key: raises the E-utilities limit from 3 to 10 requests/s (see scheduler.py)
+EUTILS_AUTH = {"api_key": os.getenv("NCBI_API_KEY")} if os.getenv("NCBI_API_KEY") else {}
 
-def search_pubmed(query, max_results=3):
+# Local guideline corpus (guidelines/), used as prompt context and as the
+# fallback when the LLM is unavailable. See guideline_index.py.
+GUIDELINE_PASSAGES = int(os.getenv("GUIDELINE_PASSAGES", 3))
+
+def pubmed_search_term(query):
+    """PubMed search term used for a clinical query."""
+    return f"{query} India guidelines treatment"
+
+def _pubmed_steps(query, max_results):
     """
-    Search PubMed for relevant medical research articles.
-    Returns formatted citations and abstracts.
+    Cache-aware PubMed search logic, independent of the HTTP client.
+    Yields (url, params) for every request it needs, receives the response
+    back via send(), and returns the result. search_pubmed drives it with the
+    blocking client and asearch_pubmed with the async one.
     """
-    try:
-        # Step 1: Search PubMed for article IDs
-        search_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
+    # Step 1: Search PubMed for article IDs (cached per normalized term)
+    key = pubmed_cache.search_key(query, max_results)
+    ids = pubmed_cache.search_cache.get(key)
+    tracing.count("cache_requests", cache="pubmed_esearch", result="miss" if ids is None else "hit")
+    
+    if ids is None:
+        search_url = f"{EUTILS_URL}/esearch.fcgi"
         search_params = {
             "db": "pubmed",
             "term": query,
             "retmax": max_results,
-            "retmode": "json"
+            "retmode": "json",
+            **EUTILS_AUTH
         }
         
-        search_response = requests.get(search_url, params=search_params, timeout=10)
+        search_response = yield search_url, search_params
         search_data = search_response.json()
         
-        if "esearchresult" not in search_data or not search_data["esearchresult"].get("idlist"):
+        if "esearchresult" not in search_data:
             return None
         
-        ids = search_data["esearchresult"]["idlist"]
-        
-        # Step 2: Fetch article details
-        fetch_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
+        ids = search_data["esearchresult"].get("idlist", [])
+        pubmed_cache.search_cache.set(key, ids)
+    
+    if not ids:
+        return None
+    
+    # Step 2: Fetch article details, only for PMIDs not cached yet
+    articles = pubmed_cache.article_cache.get_many(ids)
+    missing = [pmid for pmid in ids if pmid not in articles]
+    tracing.count("cache_requests", len(articles), cache="pubmed_efetch", result="hit")
+    tracing.count("cache_requests", len(missing), cache="pubmed_efetch", result="miss")
+    
+    if missing:
+        fetch_url = f"{EUTILS_URL}/efetch.fcgi"
         fetch_params = {
             "db": "pubmed",
-            "id": ",".join(ids),
-            "retmode": "xml"
+            "id": ",".join(missing),
+            "retmode": "xml",
+            **EUTILS_AUTH
         }
         
-        fetch_response = requests.get(fetch_url, params=fetch_params, timeout=10)
+        fetch_response = yield fetch_url, fetch_params
         
         if fetch_response.status_code == 200:
-            return fetch_response.text[:2000]  # Return first 2000 chars of XML
-        
+            for pmid, article_xml in pubmed_cache.split_articles(fetch_response.content).items():
+                pubmed_cache.article_cache.set(pmid, article_xml)
+                articles[pmid] = article_xml
+    
+    if not articles:
         return None
-        
+    
+    return pubmed_cache.join_articles([articles[pmid] for pmid in ids if pmid in articles])
+
+def _mirror_search(query, max_results):
+    """
+    Answer a search from the local PubMed mirror (pubmed_mirror.py) when
+    PUBMED_MIRROR_PATH is set. Returns (answered, xml); answered is False
+    when the E-utilities API should be tried instead.
+    """
+    try:
+        mirror = pubmed_mirror.get_mirror()
+        if mirror is None:
+            return False, None
+        with tracing.span("pubmed.mirror") as span:
+            articles = mirror.search_articles(query, max_results)
+            span.set(results=len(articles))
     except Exception as e:
-        print(f"PubMed API Error: {e}")
-        return None
+        print(f"PubMed mirror error: {e}")
+        articles = []
+    if articles:
+        return True, pubmed_cache.join_articles(articles)
+    return not pubmed_mirror.remote_fallback_enabled(), None
 
-def research_node(state):
+def search_pubmed(query, max_results=3):
     """
-    Uses PubMed API + Groq LLM to research treatment guidelines.
-    Falls back to local knowledge base if APIs fail.
+    Search PubMed for relevant medical research articles.
+    Returns the articles as a PubmedArticleSet XML document (compacted into
+    cited evidence when the research prompt is built, see evidence.py).
+    Served from the local mirror when one is configured; otherwise (or as
+    the optional fallback) from E-utilities, cached (see pubmed_cache.py):
+    the PMID list per search term and the article XML per PMID, so repeated
+    or overlapping queries skip the network round trips.
     """
-    print("\n--- 📚 AGENT 2: RESEARCHING MEDICAL LITERATURE ---")
-    
-    query = state.get("user_query", "")
-    patient_profile = state.get("patient_profile", {})
-    
+    answered, xml = _mirror_search(query, max_results)
+    if answered:
+        return xml
+    return search_eutils(query, max_results)
+
+def search_eutils(query, max_results=3):
+    """search_pubmed through E-utilities and the cache only, never the mirror (see pubmed_cache.prewarm)."""
+    try:
+        steps = _pubmed_steps(query, max_results)
+        request = next(steps)
+        while True:
+            url, params = request
+            request = steps.send(http_client.get(url, params=params, provider="ncbi"))
+    except StopIteration as done:
+        return done.value
+    except http_client.CircuitOpenError as e:
+        print(f"PubMed unavailable, skipping search: {e}")
+        return None
+    except Exception as e:
+        print(f"PubMed API Error: {e}")
+        return None
+
+async def asearch_pubmed(query, max_results=3):
+    """Async variant of search_pubmed (same caching, async HTTP client)."""
+    answered, xml = _mirror_search(query, max_results)  # Local SQLite, fast enough to run inline
+    if answered:
+        return xml
+    try:
+        steps = _pubmed_steps(query, max_results)
+        request = next(steps)
+        while True:
+            url, params = request
+            request = steps.send(await http_client.aget(url, params=params, provider="ncbi"))
+    except StopIteration as done:
+        return done.value
+    except http_client.CircuitOpenError as e:
+        print(f"PubMed unavailable, skipping search: {e}")
+        return None
+    except Exception as e:
+        print(f"PubMed API Error: {e}")
+        return None
+
+def local_guidelines(query, conditions=(), k=GUIDELINE_PASSAGES):
+    """Top-k guideline passages for the query (and patient conditions), BM25-ranked."""
+    index = get_guideline_index()
+    if index is None:
+        return []
+    return index.search(query, k=k, context=" ".join(conditions))
+
+def fallback_guidelines(query):
+    """The best-matching local guideline passage as cited text, or None."""
+    passages = local_guidelines(query, k=1)
+    return format_passages(passages) if passages else None
+
+# State each node reads (see checkpoint.py). Vitals and lab reports are not
+# declared, so with checkpoints on the research node runs without them (they
+# are left to the safety review) and a new lab value does not invalidate the
+# research; without checkpoints the prompt includes them as before.
+RETRIEVAL_INPUTS = ("user_query",)
+RESEARCH_INPUTS = ("user_query", "pubmed_results", "patient_profile.age", "patient_profile.gender",
+                   "patient_profile.conditions", "patient_profile.medications", "patient_profile.allergies")
+
+def build_research_request(query, patient_profile, pubmed_results):
+    """Keyword arguments for the research chat completion call."""
     # Extract comprehensive patient context
     conditions = patient_profile.get("conditions", [])
     conditions_str = ", ".join(conditions) if conditions else "general patient"
-    vitals = patient_profile.get("vitals", {})
     age = patient_profile.get("age", "Unknown")
     gender = patient_profile.get("gender", "Unknown")
-    recent_labs = patient_profile.get("recent_labs", "No recent labs")
     
-    # Step 1: Search PubMed
-    print("Searching PubMed database...")
-    pubmed_results = search_pubmed(f"{query} India guidelines treatment")
+    # Lab context, unless a checkpointed run projected it away (see RESEARCH_INPUTS)
+    labs = ""
+    if "vitals" in patient_profile or "recent_labs" in patient_profile:
+        labs = (f"\n- Lab Values: {patient_profile.get('vitals', {})}"
+                f"\n- Recent Lab Report: {patient_profile.get('recent_labs', 'No recent labs')}")
     
-    # Step 2: Use Groq LLM to synthesize findings
-    try:
-        # Build highly detailed context-aware prompt
-        prompt = f"""You are an expert clinical decision support AI for Indian healthcare, trained on ICMR guidelines and Indian pharmacology standards.
+    # Ground the prompt in the best-matching local guideline passages too
+    passages = local_guidelines(query, conditions)
+    
+    # Best abstract sentences from the PubMed results, cited, within a token budget
+    evidence = compact_evidence(pubmed_results, query, conditions)
+    
+    # Build highly detailed context-aware prompt
+    prompt = f"""You are an expert clinical decision support AI for Indian healthcare, trained on ICMR guidelines and Indian pharmacology standards.
 
 COMPLETE PATIENT PROFILE:
 - Age: {age} years | Gender: {gender}
 - Medical Conditions: {conditions_str}
 - Current Medications: {', '.join(patient_profile.get('medications', []))}
-- Known Allergies: {', '.join(patient_profile.get('allergies', [])) if patient_profile.get('allergies') else 'None'}
-- Lab Values: {vitals}
-- Recent Lab Report: {recent_labs}
+- Known Allergies: {', '.join(patient_profile.get('allergies', [])) if patient_profile.get('allergies') else 'None'}{labs}
 
 CLINICAL QUERY: {query}
 
 RESEARCH DATA AVAILABLE:
-- PubMed Results: {pubmed_results if pubmed_results else "Limited"}
-- ICMR Guidelines: Available for reference
+- PubMed Evidence: {evidence if evidence else "Limited"}
+- ICMR Guidelines: {format_passages(passages) if passages else "Available for reference"}
 
 YOUR TASK:
 Provide a detailed, evidence-based treatment recommendation that:
 1. References specific ICMR/Indian clinical guidelines
 2. Lists 2-3 medications with exact dosages appropriate for THIS patient's age and conditions
 3. Prioritizes Jan Aushadhi (generic) alternatives with approximate costs
-4. Includes specific precautions based on the patient's lab values and comorbidities
+4. Includes specific precautions based on the patient's {'lab values and comorbidities' if labs else 'comorbidities and current medications'}
 5. Explains the clinical rationale briefly
 
 OUTPUT FORMAT (150 words max):
@@ -132,42 +231,114 @@ OUTPUT FORMAT (150 words max):
 [Specific to this patient's profile]
 
 **Evidence Basis:**
-[ICMR guideline reference or clinical evidence]"""
+[ICMR guideline reference or clinical evidence, citing PMIDs]"""
 
-        print("Analyzing with AI medical reasoning...")
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert Indian medical AI trained on ICMR guidelines. Provide evidence-based, India-specific treatment recommendations."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            model="llama-3.3-70b-versatile",  # Groq's current medical-capable model
-            temperature=0.3,  # Lower temperature for more consistent medical advice
-            max_tokens=500
-        )
+    return {
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are an expert Indian medical AI trained on ICMR guidelines. Provide evidence-based, India-specific treatment recommendations."
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        "model": "llama-3.3-70b-versatile",  # Groq's current medical-capable model
+        "temperature": 0.3,  # Lower temperature for more consistent medical advice
+        "max_tokens": 500
+    }
+
+def research_fallback(query, error):
+    """Research result from the local knowledge base when the LLM call fails."""
+    print(f"⚠ API Error: {error}. Using fallback knowledge base.")
+    
+    # Fallback to hardcoded guidelines
+    findings = fallback_guidelines(query) or "No specific guidelines found. Recommend specialist consultation."
+    checkpoint.skip()  # Retry the LLM next time instead of keeping the fallback
+    
+    return {"research_findings": findings}
+
+def retrieval_result(pubmed_results):
+    if pubmed_results is None:
+        checkpoint.skip()  # Search failed or found nothing; try again next time
+    return {"pubmed_results": pubmed_results}
+
+def retrieval_node(state):
+    """
+    Searches PubMed for the clinical query. Only reads 'user_query', so the
+    graph runs it in parallel with patient loading.
+    """
+    print("\n--- 🔎 AGENT 2a: SEARCHING PUBMED ---")
+    
+    query = state.get("user_query", "")
+    return retrieval_result(search_pubmed(pubmed_search_term(query)))
+
+async def aretrieval_node(state):
+    """Async variant of retrieval_node."""
+    print("\n--- 🔎 AGENT 2a: SEARCHING PUBMED ---")
+    
+    query = state.get("user_query", "")
+    return retrieval_result(await asearch_pubmed(pubmed_search_term(query)))
+
+def research_node(state):
+    """
+    Uses PubMed API + Groq LLM to research treatment guidelines.
+    Falls back to local knowledge base if APIs fail.
+    Reuses 'pubmed_results' from retrieval_node when it already ran,
+    otherwise searches PubMed itself.
+    """
+    print("\n--- 📚 AGENT 2: RESEARCHING MEDICAL LITERATURE ---")
+    
+    query = state.get("user_query", "")
+    
+    # Step 1: Search PubMed (unless the retrieval node already did)
+    if "pubmed_results" in state:
+        pubmed_results = state["pubmed_results"]
+    else:
+        print("Searching PubMed database...")
+        pubmed_results = search_pubmed(pubmed_search_term(query))
+    
+    # Step 2: Use Groq LLM to synthesize findings
+    try:
+        request = build_research_request(query, state.get("patient_profile", {}), pubmed_results)
         
-        findings = chat_completion.choices[0].message.content
+        print("Analyzing with AI medical reasoning...")
+        # Stream tokens to the caller as they arrive (no-op under plain invoke)
+        stream = FieldStream("research_findings")
+        findings = llm_cache.stream(get_client(), request, stream, bypass=state.get("bypass_cache", False),
+                                    label="research")
+        stream.done()
         print(f"✓ Research Complete. AI-generated clinical recommendation ready.")
         
         return {"research_findings": findings}
         
     except Exception as e:
-        print(f"⚠ API Error: {e}. Using fallback knowledge base.")
+        return research_fallback(query, e)
+
+async def aresearch_node(state):
+    """Async variant of research_node (AsyncGroq + async PubMed search)."""
+    print("\n--- 📚 AGENT 2: RESEARCHING MEDICAL LITERATURE ---")
+    
+    query = state.get("user_query", "")
+    
+    if "pubmed_results" in state:
+        pubmed_results = state["pubmed_results"]
+    else:
+        print("Searching PubMed database...")
+        pubmed_results = await asearch_pubmed(pubmed_search_term(query))
+    
+    try:
+        request = build_research_request(query, state.get("patient_profile", {}), pubmed_results)
         
-        # Fallback to hardcoded guidelines
-        query_lower = query.lower()
-        if "infection" in query_lower or "fever" in query_lower or "cough" in query_lower:
-            findings = KNOWLEDGE_BASE["infection"]
-        elif "sugar" in query_lower or "diabetes" in query_lower:
-            findings = KNOWLEDGE_BASE["diabetes"]
-        elif "pain" in query_lower or "headache" in query_lower:
-            findings = KNOWLEDGE_BASE["pain"]
-        else:
-            findings = "No specific guidelines found. Recommend specialist consultation."
+        print("Analyzing with AI medical reasoning...")
+        stream = FieldStream("research_findings")
+        findings = await llm_cache.astream(get_async_client(), request, stream,
+                                           bypass=state.get("bypass_cache", False), label="research")
+        stream.done()
+        print(f"✓ Research Complete. AI-generated clinical recommendation ready.")
         
-        return {"research_findings": findings}
\ No newline at end of file
+        return {"research_findings": findings}
+        
+    except Exception as e:
+        return research_fallback(query, e)
@@ -0,0 +1,268 @@
+import json
+from collections import deque
+from functools import lru_cache
+
+from interaction_graph import SEVERITIES, InteractionGraph
+
+# ==========================================
+# COMPILED RULE ENGINE FOR SAFETY CHECKS
+# ==========================================
+# The contraindication and interaction tables are compiled once into
+# Aho-Corasick automata, so a single pass over the recommendation text finds
+# every drug it mentions no matter how large the formulary gets. Patient
+# conditions, allergies and medications are scanned the same way and reduced
+# to sets of rule IDs, which turns the old nested `any(...)` loops into set
+# intersections. Drug-drug interactions are screened on the sparse graph in
+# interaction_graph.py.
+#
+# Rule file format (JSON):
+# {
+#   "contraindications": {"metformin": {"condition_conflict": [...], "reason": "...",
+#                                       "egfr_below": 30}},        # eGFR threshold optional
+#   "interactions": {"warfarin": ["aspirin", "ibuprofen"]},   # or {"aspirin": "major", ...}
+#   "synonyms": {"metformin": ["glycomet"]}        # optional
+# }
+
+
+def egfr_value(patient_profile):
+    """The patient's recorded eGFR as a float, or None."""
+    try:
+        return float((patient_profile.get("vitals") or {})["eGFR"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class Automaton:
+    """
+    Aho-Corasick multi-pattern matcher over lowercased text.
+    Matches only on word boundaries: a hit must not be preceded or followed
+    by a letter, so "ckd" does not fire inside another word. With
+    word_end=False only the start is checked, so a phrase also matches its
+    plural and derived forms ("peptic ulcer" in "Peptic Ulcers", "asthma"
+    in "Asthmatic bronchitis").
+    """
+
+    def __init__(self, word_end=True):
+        self.word_end = word_end
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]   # state -> [(pattern_length, value), ...]
+        self._built = False
+
+    def add(self, pattern, value):
+        pattern = " ".join(pattern.lower().split())
+        if not pattern:
+            return
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(pattern), value))
+        self._built = False
+
+    def build(self):
+        """Compute failure links (breadth-first)."""
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = deque(goto[0].values())
+        for state in queue:
+            fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] = out[nxt] + out[fail[nxt]]
+        self._built = True
+        return self
+
+    def find(self, text):
+        """Yield (start, end, value) for every word-bounded match in `text`."""
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        text = text.lower()
+        n = len(text)
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                end = i + 1
+                after_ok = not self.word_end or end == n or not text[end].isalpha()
+                if not after_ok:
+                    continue
+                for length, value in out[state]:
+                    start = end - length
+                    if start == 0 or not text[start - 1].isalpha():
+                        yield start, end, value
+
+    def values(self, text):
+        """Return the set of values matched anywhere in `text`."""
+        return {value for _, _, value in self.find(text)}
+
+
+class RuleEngine:
+    """
+    Compiled form of the CONTRAINDICATIONS / DRUG_INTERACTIONS tables.
+    `check()` produces the same contraindication warnings, in the same
+    order, as the original substring loops in safety_agent.py, except that
+    a condition phrase must start a word ("ckd" no longer fires inside
+    another word; plurals and derived forms still match). Allergies are checked
+    for every drug the rules know (contraindicated drugs first, in rule
+    order, then the rest by name), and interactions across all current and
+    proposed drugs, most severe first.
+    """
+
+    def __init__(self, contraindications, interactions, synonyms=None):
+        synonyms = synonyms or {}
+        self.contraindications = contraindications
+        self.interactions = interactions
+
+        # Rule order decides warning order, like the dict iteration it replaces
+        self.contra_drugs = list(contraindications)
+        self.interaction_drugs = list(interactions)
+        self._contra_rank = {drug: i for i, drug in enumerate(self.contra_drugs)}
+
+        # Drug-drug interactions, screened pairwise in both directions
+        self.interaction_graph = InteractionGraph.from_table(interactions)
+        graph_ids = self.interaction_graph.ids
+
+        # One automaton for every drug name we need to spot in free text
+        self.drug_matcher = Automaton()
+        for drug in set(self.contra_drugs) | set(graph_ids):
+            for name in [drug] + list(synonyms.get(drug, [])):
+                self.drug_matcher.add(name, drug)
+        self.drug_matcher.build()
+
+        # Condition phrases -> IDs, and which phrase IDs each drug conflicts with
+        self.condition_matcher = Automaton(word_end=False)
+        phrase_ids = {}
+        self.drug_conflicts = {}
+        for drug, info in contraindications.items():
+            ids = set()
+            for phrase in info["condition_conflict"]:
+                key = phrase.lower()
+                if key not in phrase_ids:
+                    phrase_ids[key] = len(phrase_ids)
+                    self.condition_matcher.add(phrase, phrase_ids[key])
+                ids.add(phrase_ids[key])
+            self.drug_conflicts[drug] = frozenset(ids)
+        self.condition_matcher.build()
+
+        # Renal thresholds: drug -> contraindicated below this eGFR
+        self.egfr_below = {drug: info["egfr_below"] for drug, info in contraindications.items()
+                           if info.get("egfr_below") is not None}
+
+        # Patient field values repeat a lot ("Hypertension", "Metformin 500mg"),
+        # so each distinct string is scanned once and kept as a hashed set
+        self.drugs_in = lru_cache(maxsize=65536)(self._frozen(self.drug_matcher))
+        self.conditions_in = lru_cache(maxsize=65536)(self._frozen(self.condition_matcher))
+
+    @staticmethod
+    def _frozen(matcher):
+        return lambda text: frozenset(matcher.values(text))
+
+    @classmethod
+    def from_file(cls, path):
+        """Load rule tables from an external JSON file."""
+        with open(path, "r") as f:
+            data = json.load(f)
+        return cls(
+            data.get("contraindications", {}),
+            data.get("interactions", {}),
+            data.get("synonyms", {}),
+        )
+
+    def proposed_drugs(self, text):
+        """Canonical names of every rule drug mentioned in `text`."""
+        return self.drug_matcher.values(text)
+
+    def check(self, proposed_text, patient_profile):
+        """
+        Run allergy, contraindication and interaction rules.
+        Returns (warnings, is_safe).
+        """
+        mentioned = self.proposed_drugs(proposed_text)
+
+        conditions = patient_profile.get("conditions", [])
+        allergies = patient_profile.get("allergies", [])
+        current_meds = patient_profile.get("medications", [])
+
+        proposed_contra = sorted((d for d in mentioned if d in self._contra_rank),
+                                 key=self._contra_rank.__getitem__)
+
+        warnings = []
+
+        # Check allergies (any recognised drug, not just the contraindicated ones)
+        if mentioned and allergies:
+            allergic_to = set()
+            for allergy in allergies:
+                allergic_to |= self.drugs_in(allergy)
+            others = sorted(mentioned - self._contra_rank.keys())
+            for drug in proposed_contra + others:
+                if drug in allergic_to:
+                    warnings.append(f"CRITICAL: Patient is allergic to {drug.upper()}.")
+
+        # Check disease contraindications
+        if proposed_contra and conditions:
+            condition_hits = [(c, self.conditions_in(c)) for c in conditions]
+            for drug in proposed_contra:
+                conflicts = self.drug_conflicts[drug]
+                for condition, hits in condition_hits:
+                    if conflicts & hits:
+                        info = self.contraindications[drug]
+                        warnings.append(f"CONTRAINDICATION: {drug.upper()} + {condition}. {info['reason']}")
+
+        # Check renal function thresholds
+        egfr = egfr_value(patient_profile)
+        if egfr is not None:
+            for drug in proposed_contra:
+                threshold = self.egfr_below.get(drug)
+                if threshold is not None and egfr < threshold:
+                    warnings.append(f"CONTRAINDICATION: {drug.upper()} with eGFR {egfr:g} (below {threshold}). "
+                                    f"{self.contraindications[drug]['reason']}")
+
+        # Check drug-drug interactions
+        warnings.extend(self.interaction_warnings(mentioned, current_meds))
+
+        return warnings, not warnings
+
+    def interaction_warnings(self, proposed_drugs, current_meds):
+        """Warnings for every interacting pair among the proposed drugs and current medications."""
+        graph = self.interaction_graph
+        ids = graph.ids
+        current = {}  # graph ID -> the medication entry naming it
+        for med in current_meds:
+            for drug in self.drugs_in(med):
+                if drug in ids:
+                    current.setdefault(ids[drug], med)
+        # A drug the patient already takes is screened as a current medication
+        proposed = {ids[d] for d in proposed_drugs if d in ids} - current.keys()
+        if len(proposed) + len(current) < 2:
+            return []
+
+        names = graph.names
+        warnings = []
+        conflicts = graph.conflicts(proposed | current.keys())
+        for a, b, level in sorted(conflicts, key=lambda c: (-c[2], names[c[0]], names[c[1]])):
+            severity = SEVERITIES[level - 1]
+            if a in current and b in current:
+                warnings.append(f"INTERACTION: current medications {current[a]} and {current[b]} "
+                                f"interact ({severity}).")
+            elif a in current or b in current:
+                drug, med = (b, current[a]) if a in current else (a, current[b])
+                warnings.append(f"INTERACTION: {names[drug].upper()} interacts with {med} ({severity}).")
+            else:
+                warnings.append(f"INTERACTION: {names[a].upper()} and {names[b].upper()} "
+                                f"are both proposed ({severity}).")
+        return warnings
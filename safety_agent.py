@@ -1,14 +1,18 @@
 import json
 import os
-import requests
-from groq import Groq
 from dotenv import load_dotenv
+import checkpoint
+from drug_normalizer import get_normalizer
+import http_client
+import llm_cache
+import scheduler
+from llm_client import get_async_client, get_client
+from rule_engine import RuleEngine
+from streaming import FieldStream
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Groq client
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
 
 # ==========================================
 # 1. THE KNOWLEDGE BASE (The "Trap" Database)
@@ -32,29 +36,65 @@ CONTRAINDICATIONS = {
     }
 }
 
-# Dictionary of known severe drug-drug interactions
+# Dictionary of known drug-drug interactions (symmetric: either drug may be
+# the proposed one). A plain list means severity "major"; see interaction_graph.py.
 DRUG_INTERACTIONS = {
     "warfarin": ["aspirin", "ibuprofen"], # Blood thinners + NSAIDs
-    "sildenafil": ["nitroglycerin", "isosorbide"] # Nitrates
+    "sildenafil": {"nitroglycerin": "contraindicated", "isosorbide": "contraindicated"} # Nitrates
 }
 
+# Compiled once per process. Set SAFETY_RULES_FILE to load a full formulary
+# (see rule_engine.py for the JSON format) instead of the demo tables above.
+_rule_engine = None
+
+def get_rule_engine():
+    """Return the compiled rule engine, building it on first use."""
+    global _rule_engine
+    if _rule_engine is None:
+        rules_file = os.getenv("SAFETY_RULES_FILE")
+        if rules_file:
+            _rule_engine = RuleEngine.from_file(rules_file)
+        else:
+            # Brand names and synonyms from the drug name table (Glycomet -> metformin, ...)
+            _rule_engine = RuleEngine(CONTRAINDICATIONS, DRUG_INTERACTIONS, get_normalizer().synonyms())
+    return _rule_engine
+
+# RxNav endpoint (override to point at a local stub)
+RXNAV_URL = os.getenv("RXNAV_URL", "https://rxnav.nlm.nih.gov/REST")
+
+# "on" adds RxNav's interaction list (one batched call) to the rule warnings
+RXNAV_INTERACTIONS = os.getenv("RXNAV_INTERACTIONS", "off").lower() in ("1", "on", "true", "yes")
+
 # ==========================================
 # 2. THE SAFETY AGENT LOGIC
 # ==========================================
 
-def check_drug_interactions_api(drug_name):
+def _rxcuis(resolved):
+    """Distinct RxCUIs from a {name: rxcui} resolution, in order."""
+    return list(dict.fromkeys(rxcui for rxcui in resolved.values() if rxcui))
+
+
+def check_drug_interactions_api(drug_names):
     """
-    Check drug interactions using free RxNav API (FDA database).
+    Check interactions among all the given drugs using the free RxNav API,
+    in one request. Names (generic, brand or synonym) are resolved to
+    RxCUIs locally or from the RxCUI cache (see drug_normalizer.py).
     Returns list of interactions or None if API fails.
     """
     try:
-        # RxNav interaction API
-        url = f"https://rxnav.nlm.nih.gov/REST/interaction/list.json?rxcuis={drug_name}"
-        response = requests.get(url, timeout=10)
+        normalizer = get_normalizer()
+        generics = [g for name in drug_names for g in normalizer.canonical(name)]
+        rxcuis = _rxcuis(normalizer.resolve(generics))
+        if len(rxcuis) < 2:
+            return []
+        
+        # RxNav interaction API: every RxCUI in a single call
+        url = f"{RXNAV_URL}/interaction/list.json"
+        response = http_client.get(url, params={"rxcuis": " ".join(rxcuis)}, label="rxnav",
+                                   provider="rxnav")
         
         if response.status_code == 200:
             data = response.json()
-            # Parse interaction data (simplified)
             return data.get("fullInteractionTypeGroup", [])
         
         return None
@@ -63,18 +103,85 @@ def check_drug_interactions_api(drug_name):
         return None
 
 
-def safety_agent_node(state):
+async def acheck_drug_interactions_api(drug_names):
+    """Async variant of check_drug_interactions_api."""
+    try:
+        normalizer = get_normalizer()
+        generics = [g for name in drug_names for g in normalizer.canonical(name)]
+        rxcuis = _rxcuis(await normalizer.aresolve(generics))
+        if len(rxcuis) < 2:
+            return []
+        
+        url = f"{RXNAV_URL}/interaction/list.json"
+        response = await http_client.aget(url, params={"rxcuis": " ".join(rxcuis)}, label="rxnav",
+                                          provider="rxnav")
+        
+        if response.status_code == 200:
+            return response.json().get("fullInteractionTypeGroup", [])
+        
+        return None
+    except Exception as e:
+        print(f"Drug API Error: {e}")
+        return None
+
+
+def rxnav_warnings(groups):
+    """Warning lines for the interaction pairs in an RxNav response."""
+    warnings = []
+    for group in groups or []:
+        for interaction in group.get("fullInteractionType", []):
+            for pair in interaction.get("interactionPair", []):
+                names = [c["minConceptItem"]["name"].upper() for c in pair.get("interactionConcept", [])]
+                warning = f"INTERACTION (RxNav): {' + '.join(names)}. {pair.get('description', '')}".strip()
+                if warning not in warnings:
+                    warnings.append(warning)
+    return warnings
+
+
+def consultation_drugs(state):
+    """Generic names of the proposed drugs and the patient's current medications."""
+    normalizer = get_normalizer()
+    drugs = normalizer.normalize(state.get("research_findings", ""))
+    for med in state.get("patient_profile", {}).get("medications", []):
+        drugs.extend(g for g in normalizer.canonical(med) if g not in drugs)
+    return drugs
+
+
+# State each node reads (see checkpoint.py); the rule checks use the eGFR
+# threshold, the AI review sees every lab value
+RULE_CHECK_INPUTS = ("research_findings", "patient_profile.conditions", "patient_profile.allergies",
+                     "patient_profile.medications", "patient_profile.vitals.eGFR")
+SAFETY_INPUTS = ("research_findings", "rule_warnings", "patient_profile.age", "patient_profile.gender",
+                 "patient_profile.conditions", "patient_profile.allergies", "patient_profile.medications",
+                 "patient_profile.vitals", "patient_profile.lab_flags", "patient_profile.recent_labs")
+
+
+def rule_check_node(state):
     """
-    AI-powered safety validation with rule-based fallback.
-    Uses Groq LLM + local contraindication database.
+    Rule-based part of the safety check on its own, so the graph can run it
+    as soon as the research findings and patient profile are available.
     """
+    print("\n--- 🛡️ AGENT 3a: RULE-BASED SAFETY CHECKS ---")
     
-    print("\n--- 🛡️ AGENT 3: SAFETY GUARDRAIL ANALYZING ---")
-    
-    # 1. Unpack the state
-    proposed_treatment_text = state.get("research_findings", "")
-    patient_profile = state.get("patient_profile", {})
-    
+    warnings, _ = get_rule_engine().check(
+        state.get("research_findings", ""), state.get("patient_profile", {})
+    )
+    print(f"Rule checks complete: {len(warnings)} warning(s).")
+    return {"rule_warnings": warnings}
+
+
+def current_rule_warnings(state):
+    """Rule warnings from rule_check_node if it ran, otherwise computed here."""
+    # Allergies, disease contraindications and drug-drug interactions are all
+    # found in one scan of the recommendation text (see rule_engine.py).
+    if "rule_warnings" in state:
+        warnings = list(state["rule_warnings"])
+        return warnings, not warnings
+    return get_rule_engine().check(state.get("research_findings", ""), state.get("patient_profile", {}))
+
+
+def build_safety_request(proposed_treatment_text, patient_profile, warnings):
+    """Keyword arguments for the safety validation chat completion call."""
     # Extract comprehensive patient data
     patient_conditions = patient_profile.get("conditions", [])
     patient_allergies = patient_profile.get("allergies", [])
@@ -85,41 +192,7 @@ def safety_agent_node(state):
     lab_flags = patient_profile.get("lab_flags", "")
     recent_labs = patient_profile.get("recent_labs", "")
 
-    # 2. Rule-based checks (Fast, guaranteed to catch known issues)
-    warnings = []
-    is_safe = True
-    
-    proposed_lower = proposed_treatment_text.lower()
-
-    # Check allergies
-    for drug in CONTRAINDICATIONS.keys():
-        if drug in proposed_lower:
-            if any(drug in allergy.lower() for allergy in patient_allergies):
-                warnings.append(f"CRITICAL: Patient is allergic to {drug.upper()}.")
-                is_safe = False
-
-    # Check disease contraindications
-    for drug, info in CONTRAINDICATIONS.items():
-        if drug in proposed_lower:
-            conflicts = info["condition_conflict"]
-            for condition in patient_conditions:
-                if any(c.lower() in condition.lower() for c in conflicts):
-                    warnings.append(f"CONTRAINDICATION: {drug.upper()} + {condition}. {info['reason']}")
-                    is_safe = False
-
-    # Check drug-drug interactions
-    for drug, interacting_drugs in DRUG_INTERACTIONS.items():
-        if drug in proposed_lower:
-            for med in current_meds:
-                if any(interacting in med.lower() for interacting in interacting_drugs):
-                    warnings.append(f"INTERACTION: {drug.upper()} interacts with {med}.")
-                    is_safe = False
-
-    # 3. AI-powered deep analysis using Groq
-    try:
-        print("Running AI safety analysis...")
-        
-        prompt = f"""You are an expert clinical pharmacology AI safety validator for Indian hospitals, trained on ICMR protocols and Indian drug safety standards.
+    prompt = f"""You are an expert clinical pharmacology AI safety validator for Indian hospitals, trained on ICMR protocols and Indian drug safety standards.
 
 PROPOSED TREATMENT PLAN:
 {proposed_treatment_text}
@@ -158,47 +231,140 @@ CONFIDENCE: [85-100% - Be confident when lab data supports your assessment]
 ANALYSIS: [3-4 sentences with specific reference to lab values and clinical rationale]
 RECOMMENDATIONS: [Specific dosage adjustments OR confirm treatment is safe as proposed]"""
 
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a medical safety AI trained on Indian pharmacology guidelines and ICMR protocols. Be conservative and flag any potential safety concerns."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            model="llama-3.3-70b-versatile",
-            temperature=0.1,  # Very low temperature for safety-critical analysis
-            max_tokens=400
-        )
-        
-        ai_analysis = chat_completion.choices[0].message.content
-        
-        # Combine rule-based and AI analysis
-        if warnings:
-            final_msg = f"⚠️ SAFETY WARNINGS DETECTED:\n\n"
-            final_msg += "🔴 RULE-BASED CHECKS:\n"
-            final_msg += "\n".join([f"  • {w}" for w in warnings])
-            final_msg += f"\n\n🤖 AI DEEP ANALYSIS:\n{ai_analysis}"
-        else:
-            final_msg = f"✅ RULE-BASED CHECKS: PASSED\n\n🤖 AI SAFETY ANALYSIS:\n{ai_analysis}"
+    return {
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are a medical safety AI trained on Indian pharmacology guidelines and ICMR protocols. Be conservative and flag any potential safety concerns."
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        "model": "llama-3.3-70b-versatile",
+        "temperature": 0.1,  # Very low temperature for safety-critical analysis
+        "max_tokens": 400
+    }
+
+
+def safety_report_header(warnings):
+    """The rule-based part of the safety report, which precedes the AI analysis."""
+    if warnings:
+        header = f"⚠️ SAFETY WARNINGS DETECTED:\n\n"
+        header += "🔴 RULE-BASED CHECKS:\n"
+        header += "\n".join([f"  • {w}" for w in warnings])
+        header += f"\n\n🤖 AI DEEP ANALYSIS:\n"
+    else:
+        header = f"✅ RULE-BASED CHECKS: PASSED\n\n🤖 AI SAFETY ANALYSIS:\n"
+    return header
+
+
+def combine_safety_results(warnings, ai_analysis):
+    """Combine rule-based and AI analysis into the final safety report."""
+    final_msg = safety_report_header(warnings) + ai_analysis
+    
+    print(f"✓ Safety analysis complete.")
+    
+    return {"safety_check": final_msg, "final_answer": final_msg}
+
+
+def review_priority(warnings):
+    """
+    "urgent" when the rule checks found an allergy or a contraindicated
+    combination, so the review jumps the provider queues; None (keep the
+    run's priority) otherwise, and always for batch work.
+    """
+    critical = any(w.startswith("CRITICAL") or "(contraindicated)" in w for w in warnings)
+    if critical and scheduler.current_priority() != "batch":
+        return "urgent"
+    return None
+
+
+def rule_only_result(is_safe, warnings, error):
+    """Safety report from the rule-based checks alone when the AI call fails."""
+    print(f"⚠ AI Analysis failed: {error}. Using rule-based results only.")
+    checkpoint.skip()  # Retry the AI review next time
+    
+    # Fallback to rule-based only
+    if is_safe:
+        safety_msg = "✅ SAFETY CHECK PASSED: No contraindications found against patient profile."
+    else:
+        safety_msg = "⚠️ SAFETY WARNINGS DETECTED:\n" + "\n".join([f"- {w}" for w in warnings])
+    
+    return {"safety_check": safety_msg, "final_answer": safety_msg}
+
+
+def safety_agent_node(state):
+    """
+    AI-powered safety validation with rule-based fallback.
+    Uses Groq LLM + local contraindication database.
+    """
+    
+    print("\n--- 🛡️ AGENT 3: SAFETY GUARDRAIL ANALYZING ---")
+    
+    # 1. Rule-based checks (Fast, guaranteed to catch known issues).
+    # Skipped when rule_check_node already ran earlier in the graph.
+    warnings, is_safe = current_rule_warnings(state)
+    with scheduler.priority(review_priority(warnings)):
+        if RXNAV_INTERACTIONS:
+            warnings = warnings + rxnav_warnings(check_drug_interactions_api(consultation_drugs(state)))
+            is_safe = not warnings
+
+        # 2. AI-powered deep analysis using Groq
+        return ai_safety_review(state, warnings, is_safe)
+
+
+def ai_safety_review(state, warnings, is_safe):
+    """The LLM safety review of the research findings, on top of the rule warnings."""
+    try:
+        print("Running AI safety analysis...")
         
-        print(f"✓ Safety analysis complete.")
+        request = build_safety_request(state.get("research_findings", ""), state.get("patient_profile", {}),
+                                       warnings)
         
-        return {"safety_check": final_msg, "final_answer": final_msg}
+        # Stream the report as it is written: rule results first, then AI tokens
+        stream = FieldStream("safety_check")
+        stream(safety_report_header(warnings))
+        ai_analysis = llm_cache.stream(get_client(), request, stream, bypass=state.get("bypass_cache", False),
+                                       label="safety")
+        stream.done()
+        return combine_safety_results(warnings, ai_analysis)
         
     except Exception as e:
-        print(f"⚠ AI Analysis failed: {e}. Using rule-based results only.")
+        return rule_only_result(is_safe, warnings, e)
+
+
+async def asafety_agent_node(state):
+    """Async variant of safety_agent_node (AsyncGroq)."""
+    
+    print("\n--- 🛡️ AGENT 3: SAFETY GUARDRAIL ANALYZING ---")
+    
+    warnings, is_safe = current_rule_warnings(state)
+    with scheduler.priority(review_priority(warnings)):
+        if RXNAV_INTERACTIONS:
+            warnings = warnings + rxnav_warnings(await acheck_drug_interactions_api(consultation_drugs(state)))
+            is_safe = not warnings
+        return await aai_safety_review(state, warnings, is_safe)
+
+
+async def aai_safety_review(state, warnings, is_safe):
+    """Async variant of ai_safety_review."""
+    try:
+        print("Running AI safety analysis...")
         
-        # Fallback to rule-based only
-        if is_safe:
-            safety_msg = "✅ SAFETY CHECK PASSED: No contraindications found against patient profile."
-        else:
-            safety_msg = "⚠️ SAFETY WARNINGS DETECTED:\n" + "\n".join([f"- {w}" for w in warnings])
+        request = build_safety_request(state.get("research_findings", ""), state.get("patient_profile", {}),
+                                       warnings)
         
-        return {"safety_check": safety_msg, "final_answer": safety_msg}
+        stream = FieldStream("safety_check")
+        stream(safety_report_header(warnings))
+        ai_analysis = await llm_cache.astream(get_async_client(), request, stream,
+                                              bypass=state.get("bypass_cache", False), label="safety")
+        stream.done()
+        return combine_safety_results(warnings, ai_analysis)
+        
+    except Exception as e:
+        return rule_only_result(is_safe, warnings, e)
 
 
 # ==========================================
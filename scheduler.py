@@ -0,0 +1,480 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import heapq
+import itertools
+import os
+import threading
+import time
+
+import tracing
+
+# ==========================================
+# OUTBOUND CALL SCHEDULER (Groq, PubMed, RxNav)
+# ==========================================
+# Every external call the agents make goes through one scheduler per
+# provider instead of racing for the API:
+#
+#   - a token bucket holds each provider to its published rate (NCBI allows
+#     3 requests/s without an API key, 10 with one), so bursts queue here
+#     rather than coming back as 429s that the HTTP retries then amplify;
+#   - calls wait in a priority queue: "urgent" (a consultation whose rule
+#     checks found a CRITICAL allergy or contraindicated combination) goes
+#     ahead of "normal" traffic, and both go ahead of "batch" jobs;
+#   - the number of calls in flight adapts (AIMD): +1/limit per call that
+#     succeeds, halved on a 429 / 503, and cut by 10% while latency stays
+#     well above the best seen, so a slowing provider is not piled onto;
+#   - calls with the same key already in flight are coalesced: duplicates
+#     wait for the running call and share its response.
+#
+#   response = scheduler.call("ncbi", lambda: session.get(url), key=url)
+#   with scheduler.priority("batch"):
+#       ...  # every call made in here queues as batch work
+#
+# A consultation's priority is the "priority" key of the graph state
+# (default "normal", also used with a warning for unknown values; batch.py
+# runs cases as "batch"), and the safety review escalates itself to "urgent"
+# when the rule checks found a critical issue.
+#
+# Limits are per process; a server running N workers divides them with
+# share_limits(N) (server.py does this in each worker).
+# Queue depth, in-flight calls and the concurrency limit are exported as
+# tracing gauges, and queue wait as the "queue.<provider>" histogram.
+#
+# Tunables (environment):
+#   SCHEDULER                   "off" to call providers directly (default on)
+#   SCHED_<PROVIDER>_RATE       requests per second, 0 = unlimited
+#   SCHED_<PROVIDER>_BURST      token bucket size (default: 1s of rate)
+#   SCHED_<PROVIDER>_CONCURRENCY  max calls in flight, 0 = unlimited
+#     PROVIDER is NCBI (default 3/s, 10/s with NCBI_API_KEY; 3 in flight),
+#     RXNAV (20/s, 10 in flight) or GROQ (15/s, 32 in flight)
+#   SCHED_LATENCY_TOLERANCE     latency / best latency above which the
+#                               concurrency limit backs off (default 3)
+
+ENABLED = os.getenv("SCHEDULER", "on").lower() not in ("0", "off", "false", "no")
+
+PRIORITIES = {"urgent": 0, "normal": 1, "batch": 2}
+
+PROVIDERS = {
+    # provider: (rate/s, max in flight, adapt to latency)
+    "ncbi": (10.0 if os.getenv("NCBI_API_KEY") else 3.0, 3, True),
+    "rxnav": (20.0, 10, True),
+    # Completion time follows the answer length rather than load, so only
+    # 429s shrink the Groq limit
+    "groq": (15.0, 32, False),
+}
+
+LATENCY_TOLERANCE = float(os.getenv("SCHED_LATENCY_TOLERANCE", 3))
+THROTTLE_STATUSES = (429, 503)
+
+_priority = contextvars.ContextVar("medp_priority", default="normal")
+
+
+@contextlib.contextmanager
+def priority(level):
+    """Queue the external calls made inside the block at `level` (None keeps the current one)."""
+    if level is None:
+        yield
+        return
+    if level not in PRIORITIES:
+        raise ValueError(f"Unknown priority: {level}")
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    return _priority.get()
+
+
+_unknown_priorities = set()
+
+
+def state_priority(state):
+    """
+    The run's state["priority"] (None if unset). An unknown value runs as
+    "normal" with a warning printed once per value, rather than failing the
+    consultation in whichever node reads it first.
+    """
+    level = state.get("priority")
+    if level is None or (isinstance(level, str) and level in PRIORITIES):
+        return level
+    if repr(level) not in _unknown_priorities:
+        _unknown_priorities.add(repr(level))
+        print(f"Unknown priority {level!r}, running as 'normal' (expected one of {sorted(PRIORITIES)})")
+    return "normal"
+
+
+def prioritized(node):
+    """Wrap a sync or async graph node so its calls queue at the run's state["priority"]."""
+    if asyncio.iscoroutinefunction(node):
+        @functools.wraps(node)
+        async def async_wrapper(state):
+            with priority(state_priority(state)):
+                return await node(state)
+        return async_wrapper
+
+    @functools.wraps(node)
+    def wrapper(state):
+        with priority(state_priority(state)):
+            return node(state)
+    return wrapper
+
+
+def _throttled(result=None, error=None):
+    """True if a response (or exception) is the provider pushing back."""
+    status = getattr(error if error is not None else result, "status_code", None)
+    return status in THROTTLE_STATUSES
+
+
+class _Waiter:
+    __slots__ = ("wake", "granted", "cancelled", "queued_at")
+
+    def __init__(self, wake):
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+        self.queued_at = time.perf_counter()
+
+
+class ProviderScheduler:
+    """
+    Admission control for one provider: token bucket + priority queue +
+    adaptive concurrency limit. Use call() from threads and acall() from
+    coroutines; both share the same queue and limits.
+    """
+
+    def __init__(self, name, rate=0.0, burst=None, max_concurrency=0, adapt_latency=True, min_concurrency=1):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1.0, burst if burst else rate)
+        self.max_concurrency = max_concurrency or float("inf")
+        self.min_concurrency = min_concurrency
+        self.adapt_latency = adapt_latency
+        self.limit = float(max_concurrency) if max_concurrency else float("inf")
+        self.stats = {"calls": 0, "coalesced": 0, "throttled": 0, "backoffs": 0,
+                      "wait_s": 0.0, "max_queue": 0}
+        self._tokens = self.burst
+        self._refilled_at = time.monotonic()
+        self._in_flight = 0
+        self._queue = []  # (priority, seq, waiter)
+        self._seq = itertools.count()
+        self._timer = None
+        self._latency = None  # Smoothed latency of recent calls
+        self._best = None     # Lowest latency seen (drifts up slowly)
+        self._backed_off_at = 0.0
+        self._shared = {}     # coalescing key -> _Shared (threads)
+        self._ashared = {}    # (loop, key) -> Future (coroutines)
+        self._lock = threading.Lock()
+
+    # ------------------------------------------
+    # Admission
+    # ------------------------------------------
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _dispatch(self):
+        """Admit queued calls while tokens and concurrency allow (lock held)."""
+        while self._queue:
+            waiter = self._queue[0][2]
+            if waiter.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            if self._in_flight + 1 > max(self.min_concurrency, self.limit):
+                return
+            if self.rate:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens < 1:
+                    self._schedule((1 - self._tokens) / self.rate)
+                    return
+                self._tokens -= 1
+            heapq.heappop(self._queue)
+            self._in_flight += 1
+            waiter.granted = True
+            wait = time.perf_counter() - waiter.queued_at
+            self.stats["wait_s"] += wait
+            tracing.observe(f"queue.{self.name}", wait)
+            waiter.wake()
+
+    def _schedule(self, delay):
+        """Re-run _dispatch when the next token is due (one timer at a time)."""
+        if self._timer is None:
+            self._timer = threading.Timer(delay, self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            self._dispatch()
+
+    def _enqueue(self, waiter):
+        level = PRIORITIES[_priority.get()]
+        with self._lock:
+            self.stats["calls"] += 1
+            heapq.heappush(self._queue, (level, next(self._seq), waiter))
+            self.stats["max_queue"] = max(self.stats["max_queue"], len(self._queue))
+            self._dispatch()
+
+    def _release(self, latency, throttled):
+        with self._lock:
+            self._in_flight -= 1
+            self._adapt(latency, throttled)
+            self._dispatch()
+
+    def _adapt(self, latency, throttled):
+        """AIMD on the concurrency limit (lock held)."""
+        if self.max_concurrency == float("inf"):
+            return
+        now = time.monotonic()
+        # At most one decrease per round trip: the calls already in flight
+        # were sent under the old limit and will report the same congestion
+        settled = now - self._backed_off_at > (self._latency or 1.0)
+        if throttled:
+            self.stats["throttled"] += 1
+            tracing.count("scheduler_throttled", provider=self.name)
+            self._tokens = min(self._tokens, 0.0)  # The provider's bucket is empty: so is ours
+            if settled:
+                self.limit = max(self.min_concurrency, self.limit / 2)
+                self._backed_off_at = now
+                self.stats["backoffs"] += 1
+            return
+        if latency is None:
+            return
+        self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+        self._best = latency if self._best is None else min(latency, self._best + 0.01 * (latency - self._best))
+        if self.adapt_latency and self._latency > LATENCY_TOLERANCE * self._best:
+            if settled:
+                self.limit = max(self.min_concurrency, self.limit * 0.9)
+                self._backed_off_at = now
+                self.stats["backoffs"] += 1
+        else:
+            self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+    # ------------------------------------------
+    # Calls
+    # ------------------------------------------
+    def _run(self, fn):
+        event = threading.Event()
+        waiter = _Waiter(event.set)
+        self._enqueue(waiter)
+        event.wait()
+        start = time.perf_counter()
+        result = error = None
+        try:
+            result = fn()
+            return result
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._release(time.perf_counter() - start, _throttled(result, error))
+
+    def call(self, fn, key=None):
+        """
+        Run fn() once admitted and return its result. While a call with the
+        same `key` is in flight, further callers wait for it and get its
+        result (or exception) instead of calling the provider again.
+        """
+        if key is None:
+            return self._run(fn)
+        with self._lock:
+            shared = self._shared.get(key)
+            leader = shared is None
+            if leader:
+                shared = self._shared[key] = _Shared()
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            tracing.count("scheduler_coalesced", provider=self.name)
+            return shared.wait()
+        try:
+            result = self._run(fn)
+        except BaseException as e:
+            self._finish(key, shared.fail, e)
+            raise
+        self._finish(key, shared.succeed, result)
+        return result
+
+    def _finish(self, key, settle, value):
+        with self._lock:
+            self._shared.pop(key, None)  # Callers from now on start a fresh call
+        settle(value)
+
+    async def _arun(self, fn):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = _Waiter(lambda: loop.call_soon_threadsafe(_resolve, future))
+        self._enqueue(waiter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                waiter.cancelled = True
+                granted = waiter.granted
+            if granted:
+                self._release(None, False)  # Admitted just as it was cancelled
+            raise
+        start = time.perf_counter()
+        result = error = None
+        try:
+            result = await fn()
+            return result
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._release(time.perf_counter() - start, _throttled(result, error))
+
+    async def acall(self, fn, key=None):
+        """Async equivalent of call(): `fn` is a zero-argument coroutine function."""
+        if key is None:
+            return await self._arun(fn)
+        loop = asyncio.get_running_loop()
+        shared = self._ashared.get((loop, key))
+        if shared is not None:
+            with self._lock:
+                self.stats["coalesced"] += 1
+            tracing.count("scheduler_coalesced", provider=self.name)
+            return await asyncio.shield(shared)
+        shared = self._ashared[(loop, key)] = loop.create_future()
+        try:
+            result = await self._arun(fn)
+        except BaseException as e:
+            del self._ashared[(loop, key)]
+            shared.set_exception(e)
+            shared.exception()  # Retrieved: nobody may be waiting on it
+            raise
+        del self._ashared[(loop, key)]
+        shared.set_result(result)
+        return result
+
+    # ------------------------------------------
+    # Metrics
+    # ------------------------------------------
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats.update(queued=sum(not w.cancelled for _, _, w in self._queue), in_flight=self._in_flight,
+                         limit=None if self.limit == float("inf") else round(self.limit, 2),
+                         latency_s=None if self._latency is None else round(self._latency, 4))
+        stats["wait_s"] = round(stats["wait_s"], 4)
+        return stats
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class _Shared:
+    """The outcome of a coalesced call, for the callers waiting on it."""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+
+    def succeed(self, result):
+        self._result = result
+        self._done.set()
+
+    def fail(self, error):
+        self._error = error
+        self._done.set()
+
+    def wait(self):
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+# ==========================================
+# PROVIDER REGISTRY
+# ==========================================
+_schedulers = {}
+_schedulers_pid = None
+_lock = threading.Lock()
+_processes = 1  # Processes sharing each provider's limits (share_limits)
+
+
+def _config(provider):
+    rate, concurrency, adapt_latency = PROVIDERS.get(provider, (0.0, 0, True))
+    prefix = f"SCHED_{provider.upper()}_"
+    rate = float(os.getenv(prefix + "RATE", rate))
+    burst = float(os.getenv(prefix + "BURST", 0)) or None
+    concurrency = int(os.getenv(prefix + "CONCURRENCY", concurrency))
+    if _processes > 1:
+        rate, burst = rate / _processes, burst and burst / _processes
+        concurrency = -(-concurrency // _processes)  # At least 1 in flight per process
+    return {"rate": rate, "burst": burst, "max_concurrency": concurrency, "adapt_latency": adapt_latency}
+
+
+def get_scheduler(provider):
+    """The process-wide scheduler for a provider (fresh after a fork: queues and timers don't survive one)."""
+    global _schedulers_pid
+    scheduler = _schedulers.get(provider) if _schedulers_pid == os.getpid() else None
+    if scheduler is None:
+        with _lock:
+            if _schedulers_pid != os.getpid():
+                _schedulers.clear()
+                _schedulers_pid = os.getpid()
+            scheduler = _schedulers.get(provider)
+            if scheduler is None:
+                scheduler = _schedulers[provider] = ProviderScheduler(provider, **_config(provider))
+    return scheduler
+
+
+def reset():
+    """Drop every provider's scheduler; the next call re-reads the limits from the environment."""
+    with _lock:
+        _schedulers.clear()
+
+
+def share_limits(processes):
+    """
+    Give this process 1/`processes` of every provider's rate and concurrency
+    limit, for `processes` workers calling the same APIs. Takes effect on
+    the schedulers created after it (call it before the first request).
+    """
+    global _processes
+    _processes = max(1, int(processes))
+    reset()
+
+
+def call(provider, fn, key=None):
+    """Run fn() through the provider's scheduler (directly when SCHEDULER=off)."""
+    if not ENABLED:
+        return fn()
+    return get_scheduler(provider).call(fn, key)
+
+
+async def acall(provider, fn, key=None):
+    """Async equivalent of call() for a zero-argument coroutine function."""
+    if not ENABLED:
+        return await fn()
+    return await get_scheduler(provider).acall(fn, key)
+
+
+def snapshot():
+    """{provider: queue / concurrency stats} for every provider used so far."""
+    return {name: s.snapshot() for name, s in sorted(_schedulers.items())}
+
+
+def _gauges():
+    rows = []
+    for name, stats in snapshot().items():
+        rows.append(("scheduler_queue_depth", {"provider": name}, stats["queued"]))
+        rows.append(("scheduler_in_flight", {"provider": name}, stats["in_flight"]))
+        if stats["limit"] is not None:
+            rows.append(("scheduler_concurrency_limit", {"provider": name}, stats["limit"]))
+    return rows
+
+
+tracing.register_gauges(_gauges)
@@ -0,0 +1,586 @@
+import argparse
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+import scheduler
+import tracing
+
+# ==========================================
+# CONSULTATION SERVER (multi-process)
+# ==========================================
+# Serves the pipeline over HTTP on every core:
+#
+#   python server.py --port 8000 --workers 4
+#
+#   POST /consult   {"patient_id": "P001", "query": "...", "priority": "urgent"}
+#                   -> {"patient_id", "research_findings", "rule_warnings", "safety_check"}
+#   GET  /healthz   worker, queue and circuit breaker status (503 when no
+#                   worker is up or the server is draining)
+#   GET  /metrics   Prometheus text: the front end's request metrics plus
+#                   every worker's spans, counters and gauges (tracing.py)
+#
+# One front-end process parses HTTP and owns the request queue; N worker
+# processes run consultations on the async graph (main.async_app), up to
+# SERVER_WORKER_CONCURRENCY each. The workers are forked after
+# main.preload(), so the compiled graphs, rule automata and drug names are
+# shared copy-on-write (and frozen out of the GC's reach), while the patient
+# index and the guideline index are memory-mapped arrays every worker reads
+# from the same page cache. Nothing is loaded per worker.
+#
+# Backpressure: a request that finds every worker busy waits in one
+# priority queue ("urgent" first, see scheduler.py) of SERVER_QUEUE_SIZE.
+# When the queue is full, or no worker frees up within SERVER_QUEUE_TIMEOUT,
+# it is shed with 503 + Retry-After straight away, rather than timing out
+# after the client has given up. A consultation that runs past
+# SERVER_REQUEST_TIMEOUT is cancelled in its worker (504); its slot is
+# freed when the worker confirms, not when the client gets the 504.
+#
+# A worker that dies is replaced; its in-flight requests get 502. SIGTERM
+# or Ctrl+C drains: stop accepting, finish what is queued and running (up to
+# SERVER_DRAIN_TIMEOUT), then stop the workers. Each worker gets 1/N of the
+# outbound rate limits (scheduler.share_limits).
+#
+# Tunables (environment):
+#   SERVER_WORKERS              worker processes (default: CPU count)
+#   SERVER_WORKER_CONCURRENCY   consultations in flight per worker (default 32)
+#   SERVER_QUEUE_SIZE           requests waiting for a worker before new ones
+#                               are shed (default 256)
+#   SERVER_QUEUE_TIMEOUT        seconds a request may wait for a worker (default 5)
+#   SERVER_REQUEST_TIMEOUT      seconds per consultation (default 120)
+#   SERVER_DRAIN_TIMEOUT        seconds to finish work on shutdown (default 30)
+#   MEDP_TRACING                on by default here ("off" empties /metrics)
+
+WORKERS = int(os.getenv("SERVER_WORKERS", 0)) or os.cpu_count() or 1
+WORKER_CONCURRENCY = int(os.getenv("SERVER_WORKER_CONCURRENCY", 32))
+QUEUE_SIZE = int(os.getenv("SERVER_QUEUE_SIZE", 256))
+QUEUE_TIMEOUT = float(os.getenv("SERVER_QUEUE_TIMEOUT", 5))
+REQUEST_TIMEOUT = float(os.getenv("SERVER_REQUEST_TIMEOUT", 120))
+DRAIN_TIMEOUT = float(os.getenv("SERVER_DRAIN_TIMEOUT", 30))
+
+MAX_BODY = 1 << 20
+RETRY_AFTER_S = 1
+PIPE_LIMIT = 1 << 24  # Longest message line between front end and workers
+RESULT_FIELDS = ("patient_id", "research_findings", "rule_warnings", "safety_check")
+BREAKER_SEVERITY = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class Overloaded(Exception):
+    """Shed: the queue is full or no worker freed up in time."""
+
+
+class WorkerLost(Exception):
+    """The worker running the request exited."""
+
+
+class WorkerError(Exception):
+    """The consultation raised in its worker."""
+
+
+# ==========================================
+# WORKER PROCESS
+# ==========================================
+def _worker_main(sock, workers):
+    """Entry point of a forked worker; never returns."""
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The front end drains, then closes our pipe
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    sys.stdout = open(os.devnull, "w")  # Agent progress output is for the CLI
+    tracing.reset()  # Metrics copied from the front end are its own to report
+    scheduler.share_limits(workers)
+    # The forking thread still counts the front end's loop as running, so
+    # the worker's loop gets a thread of its own
+    thread = threading.Thread(target=asyncio.run, args=(_run_jobs(sock),), name="worker")
+    thread.start()
+    thread.join()
+    os._exit(0)
+
+
+async def _run_jobs(sock):
+    """Run jobs from the front end until it closes the pipe, then finish them."""
+    import http_client
+    from main import get_app
+
+    app = get_app(use_async=True)
+    reader, writer = await asyncio.open_connection(sock=sock, limit=PIPE_LIMIT)
+    tasks = {}
+
+    def reply(message):
+        writer.write((json.dumps(message) + "\n").encode("utf-8"))
+
+    async def consult(job_id, inputs):
+        try:
+            result = await app.ainvoke(inputs)
+            reply({"id": job_id, "result": {field: result.get(field) for field in RESULT_FIELDS}})
+        except asyncio.CancelledError:
+            reply({"id": job_id, "error": "cancelled"})
+        except Exception as e:
+            reply({"id": job_id, "error": f"{type(e).__name__}: {e}"})
+        finally:
+            tasks.pop(job_id, None)
+
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        message = json.loads(line)
+        op = message["op"]
+        if op == "consult":
+            tasks[message["id"]] = asyncio.create_task(consult(message["id"], message["inputs"]))
+        elif op == "cancel":
+            task = tasks.get(message["id"])
+            if task is not None:
+                task.cancel()
+        elif op == "stats":
+            reply({"id": message["id"], "result": {"metrics": tracing.dump(),
+                                                   "breakers": http_client.breaker_states()}})
+
+    if tasks:
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+    await writer.drain()
+    await http_client.aclose()
+    writer.close()
+
+
+# ==========================================
+# FRONT END: WORKER POOL AND QUEUE
+# ==========================================
+class Worker:
+    """The front end's handle on one worker process."""
+
+    def __init__(self, index, pid, reader, writer):
+        self.index = index
+        self.pid = pid
+        self.reader = reader
+        self.writer = writer
+        self.started = time.monotonic()
+        self.active = 0    # Consultations assigned (the pool's slots)
+        self.pending = {}  # message id -> Future for the reply
+        self.alive = True
+
+    def send(self, message):
+        self.writer.write((json.dumps(message) + "\n").encode("utf-8"))
+
+    def request(self, op, **fields):
+        """Send one message; returns its id and the Future its reply resolves."""
+        job_id = next(_message_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[job_id] = future
+        self.send({"id": job_id, "op": op, **fields})
+        return job_id, future
+
+    def resolve(self, message):
+        future = self.pending.pop(message["id"], None)
+        if future is None or future.done():
+            return
+        if "error" in message:
+            future.set_exception(WorkerError(message["error"]))
+        else:
+            future.set_result(message["result"])
+
+    def lost(self):
+        self.alive = False
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(WorkerLost(f"worker {self.index} (pid {self.pid}) exited"))
+        self.pending.clear()
+
+
+_message_ids = itertools.count(1)
+
+
+class WorkerPool:
+    """
+    Forks and supervises the workers and hands out their consultation
+    slots: least-loaded worker first, then the priority queue.
+    """
+
+    def __init__(self, size=WORKERS, concurrency=WORKER_CONCURRENCY, queue_size=QUEUE_SIZE,
+                 queue_timeout=QUEUE_TIMEOUT, request_timeout=REQUEST_TIMEOUT):
+        self.size = size
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.request_timeout = request_timeout
+        self.workers = {}   # index -> Worker
+        self.stopping = False
+        self.pid = os.getpid()
+        self.inherited = set()  # Front-end sockets a new worker must close (listener, connections)
+        self._queue = []    # (priority, seq, Future[Worker])
+        self._seq = itertools.count()
+        self._supervisors = set()
+
+    # ------------------------------------------
+    # Processes
+    # ------------------------------------------
+    async def start(self):
+        for index in range(self.size):
+            await self.spawn(index)
+        return self
+
+    async def spawn(self, index):
+        parent_sock, child_sock = socket.socketpair()
+        pid = os.fork()
+        if pid == 0:
+            parent_sock.close()
+            for fd in self.inherited | {w.writer.get_extra_info("socket").fileno() for w in self.workers.values()}:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+            _worker_main(child_sock, self.size)
+        child_sock.close()
+        reader, writer = await asyncio.open_connection(sock=parent_sock, limit=PIPE_LIMIT)
+        worker = self.workers[index] = Worker(index, pid, reader, writer)
+        task = asyncio.create_task(self._supervise(worker))
+        self._supervisors.add(task)
+        task.add_done_callback(self._supervisors.discard)
+        self._dispatch()
+
+    async def _supervise(self, worker):
+        """Route the worker's replies; replace it if it exits."""
+        try:
+            while True:
+                line = await worker.reader.readline()
+                if not line:
+                    break
+                worker.resolve(json.loads(line))
+        except (ConnectionError, ValueError):
+            pass
+        worker.lost()
+        worker.writer.close()
+        await self._reap(worker.pid)
+        if self.workers.get(worker.index) is worker:
+            del self.workers[worker.index]
+        if not self.stopping:
+            tracing.count("server_worker_restarts")
+            print(f"Worker {worker.index} (pid {worker.pid}) exited; starting a new one", file=sys.stderr)
+            if time.monotonic() - worker.started < 1:
+                await asyncio.sleep(1)  # Don't spin on a worker that dies at startup
+            if not self.stopping:
+                await self.spawn(worker.index)
+
+    @staticmethod
+    async def _reap(pid):
+        while True:
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if done:
+                return
+            await asyncio.sleep(0.05)
+
+    async def stop(self, timeout=5):
+        """Close every worker's pipe (they finish their jobs and exit), then wait for them."""
+        self.stopping = True
+        for worker in self.workers.values():
+            worker.writer.close()
+        if self._supervisors:
+            _, running = await asyncio.wait(self._supervisors, timeout=timeout)
+            for worker in list(self.workers.values()):
+                if worker.alive:
+                    os.kill(worker.pid, signal.SIGKILL)
+            if running:
+                await asyncio.wait(running)
+
+    # ------------------------------------------
+    # Slots
+    # ------------------------------------------
+    def _free_worker(self):
+        free = [w for w in self.workers.values() if w.alive and w.active < self.concurrency]
+        return min(free, key=lambda w: w.active, default=None)
+
+    def _dispatch(self):
+        """Hand free slots to the queue, highest priority first."""
+        while self._queue:
+            worker = self._free_worker()
+            if worker is None:
+                return
+            _, _, future = heapq.heappop(self._queue)
+            worker.active += 1
+            future.set_result(worker)
+
+    async def acquire(self, priority="normal"):
+        """A worker with a free slot for this request (raises Overloaded)."""
+        worker = None if self._queue else self._free_worker()
+        if worker is not None:
+            worker.active += 1
+            return worker
+        if len(self._queue) >= self.queue_size:
+            raise Overloaded("request queue full")
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (scheduler.PRIORITIES[priority], next(self._seq), future)
+        heapq.heappush(self._queue, entry)
+        try:
+            await asyncio.wait([future], timeout=self.queue_timeout)
+        finally:
+            if not future.done():
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                future.cancel()
+            elif asyncio.current_task().cancelling():
+                self.release(future.result())
+        if future.cancelled():
+            raise Overloaded(f"no worker free within {self.queue_timeout:g}s")
+        return future.result()
+
+    def release(self, worker):
+        worker.active -= 1
+        self._dispatch()
+
+    async def consult(self, inputs):
+        """Run one consultation on the least busy worker; returns the result fields."""
+        queued_at = time.perf_counter()
+        worker = await self.acquire(inputs.get("priority") or "normal")
+        tracing.observe("server.queue", time.perf_counter() - queued_at)
+        try:
+            job_id, future = worker.request("consult", inputs=inputs)
+        except Exception:
+            self.release(worker)
+            raise
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.request_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            if worker.alive:
+                worker.send({"id": job_id, "op": "cancel"})  # The job replies "cancelled"
+            raise
+        finally:
+            if future.done():
+                self.release(worker)
+            else:
+                # The job is still running in the worker: its slot stays taken
+                # until it replies (or the worker is lost), so the pool never
+                # has more jobs in a worker than its concurrency
+                future.add_done_callback(lambda f: self._release_after(worker, f))
+
+    def _release_after(self, worker, future):
+        if not future.cancelled():
+            future.exception()  # Retrieved: nobody awaits a timed-out job's reply
+        self.release(worker)
+
+    async def stats(self, timeout=2.0):
+        """[{"metrics": tracing.dump(), "breakers": {...}}] from every worker that answers in time."""
+        futures = [w.request("stats")[1] for w in self.workers.values() if w.alive]
+        if not futures:
+            return []
+        done, _ = await asyncio.wait(futures, timeout=timeout)
+        return [f.result() for f in done if f.exception() is None]
+
+    def snapshot(self):
+        return {
+            "workers": sum(w.alive for w in self.workers.values()),
+            "expected_workers": self.size,
+            "in_flight": sum(w.active for w in self.workers.values()),
+            "capacity": self.size * self.concurrency,
+            "queued": len(self._queue),
+            "queue_size": self.queue_size,
+        }
+
+    def gauges(self):
+        if os.getpid() != self.pid:
+            return []  # A worker forked after registration: the pool is not its to report
+        stats = self.snapshot()
+        return [("server_workers", {}, stats["workers"]),
+                ("server_in_flight", {}, stats["in_flight"]),
+                ("server_queue_depth", {}, stats["queued"])]
+
+
+# ==========================================
+# FRONT END: HTTP
+# ==========================================
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error", 502: "Bad Gateway",
+           503: "Service Unavailable", 504: "Gateway Timeout"}
+
+
+class ConsultationServer:
+    """
+    Minimal keep-alive HTTP/1.1 front end on asyncio (the same shape as
+    benchmarks/stub_server.py) in front of a WorkerPool.
+    """
+
+    def __init__(self, sock, pool):
+        self.sock = sock
+        self.pool = pool
+        self.draining = False
+        self._server = None
+        self._connections = set()
+        self._stopped = None
+
+    async def serve(self, on_ready=None):
+        """Start the workers and serve until shutdown(); on_ready(port) once listening."""
+        self._stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, self.shutdown)
+        self.pool.inherited.add(self.sock.fileno())
+        await self.pool.start()
+        tracing.register_gauges(self.pool.gauges)
+        self._server = await asyncio.start_server(self._handle, sock=self.sock, limit=MAX_BODY)
+        if on_ready:
+            on_ready(self.sock.getsockname()[1])
+        await self._stopped.wait()
+
+        # Drain: no new connections, finish the queued and running consultations
+        self._server.close()
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        while (self.pool.snapshot()["in_flight"] or self.pool.snapshot()["queued"]) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        await self.pool.stop()
+        for writer in list(self._connections):
+            writer.close()
+
+    def shutdown(self):
+        if not self.draining:
+            print("Draining: finishing queued and running consultations...", file=sys.stderr)
+            self.draining = True
+            self._stopped.set()
+
+    async def _handle(self, reader, writer):
+        self._connections.add(writer)
+        fd = writer.get_extra_info("socket").fileno()
+        self.pool.inherited.add(fd)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0) or 0)
+                if length > MAX_BODY:
+                    await self._write(writer, 413, {"error": "request body too large"}, close=True)
+                    break
+                body = await reader.readexactly(length)
+
+                close = headers.get("connection", "").lower() == "close" or self.draining
+                status, payload, extra = await self._respond(method, urlsplit(target).path, body)
+                await self._write(writer, status, payload, extra, close)
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            pass  # Idle keep-alive connection at shutdown
+        finally:
+            self.pool.inherited.discard(fd)
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _respond(self, method, path, body):
+        """(status, JSON payload or Prometheus text, extra headers)."""
+        if path == "/consult":
+            if method != "POST":
+                return 405, {"error": "use POST"}, {}
+            start = time.perf_counter()
+            status, payload, extra = await self._consult(body)
+            tracing.observe("server.consult", time.perf_counter() - start)
+            tracing.count("server_requests", status=status)
+            return status, payload, extra
+        if method != "GET":
+            return 405, {"error": "use GET"}, {}
+        if path == "/healthz":
+            return await self._health()
+        if path == "/metrics":
+            dumps = [stats["metrics"] for stats in await self.pool.stats()]
+            return 200, tracing.to_prometheus(merge=dumps), {}
+        return 404, {"error": "not found"}, {}
+
+    async def _consult(self, body):
+        try:
+            request = json.loads(body or b"{}")
+            inputs = {"patient_id": str(request["patient_id"]),
+                      "user_query": str(request.get("query") or request["user_query"]),
+                      "priority": request.get("priority") or "normal",
+                      "bypass_cache": bool(request.get("bypass_cache", False))}
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return 400, {"error": 'expected JSON {"patient_id": ..., "query": ...}'}, {}
+        if inputs["priority"] not in scheduler.PRIORITIES:
+            return 400, {"error": f"priority must be one of {sorted(scheduler.PRIORITIES)}"}, {}
+        if self.draining:
+            return 503, {"error": "server shutting down"}, {"Retry-After": RETRY_AFTER_S}
+
+        try:
+            return 200, await self.pool.consult(inputs), {}
+        except Overloaded as e:
+            return 503, {"error": f"overloaded: {e}"}, {"Retry-After": RETRY_AFTER_S}
+        except asyncio.TimeoutError:
+            return 504, {"error": f"consultation exceeded {self.pool.request_timeout:g}s"}, {}
+        except WorkerLost as e:
+            return 502, {"error": str(e)}, {}
+        except WorkerError as e:
+            return 500, {"error": str(e)}, {}
+
+    async def _health(self):
+        breakers = {}
+        for stats in await self.pool.stats(timeout=1.0):
+            for host, state in stats["breakers"].items():
+                if BREAKER_SEVERITY[state] >= BREAKER_SEVERITY[breakers.get(host, "closed")]:
+                    breakers[host] = state  # Worst state across the workers
+        pool = self.pool.snapshot()
+        if self.draining:
+            status = "draining"
+        elif not pool["workers"]:
+            status = "down"
+        elif pool["workers"] < pool["expected_workers"] or "open" in breakers.values():
+            status = "degraded"
+        else:
+            status = "ok"
+        code = 200 if status in ("ok", "degraded") else 503
+        return code, {"status": status, **pool, "breakers": breakers}, {}
+
+    @staticmethod
+    async def _write(writer, status, payload, extra=None, close=False):
+        if isinstance(payload, str):
+            content_type, data = "text/plain; version=0.0.4", payload.encode("utf-8")
+        else:
+            content_type, data = "application/json", json.dumps(payload).encode("utf-8")
+        headers = "".join(f"{name}: {value}\r\n" for name, value in (extra or {}).items())
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(data)}\r\n{headers}"
+            f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n".encode("latin-1") + data
+        )
+        await writer.drain()
+
+
+def serve(host="127.0.0.1", port=8000, workers=WORKERS, on_ready=None):
+    """Preload, bind, fork the workers and serve until SIGTERM / Ctrl+C."""
+    import main
+
+    if os.getenv("MEDP_TRACING") is None:
+        tracing.enable()
+    main.preload()
+    sock = socket.create_server((host, port), backlog=4096)
+    server = ConsultationServer(sock, WorkerPool(size=workers))
+    asyncio.run(server.serve(on_ready))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Med Perplexity consultation server (see server.py).")
+    parser.add_argument("--host", default=os.getenv("SERVER_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("SERVER_PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+
+    def announce(port):
+        print(f"Med Perplexity server listening on http://{args.host}:{port} "
+              f"({args.workers} workers, Ctrl+C to stop)", flush=True)
+
+    serve(args.host, args.port, args.workers, on_ready=announce)
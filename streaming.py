@@ -0,0 +1,41 @@
+# ==========================================
+# TOKEN STREAMING
+# ==========================================
+# Nodes publish partial output through LangGraph's "custom" stream channel
+# as {"field": <state key>, "delta": <text>} events, followed by one
+# {"field": ..., "done": True} event when the field is complete. The deltas
+# for a field concatenate to the value the node finally returns for it.
+#
+#   for mode, event in app.stream(inputs, stream_mode=["custom", "values"]):
+#       ...
+#
+# Outside a graph run (or with a plain invoke) emitting is a no-op.
+
+
+def _noop(chunk):
+    pass
+
+
+def get_writer():
+    """The current run's custom stream writer, or a no-op outside a graph."""
+    from langgraph.config import get_stream_writer  # Deferred: langgraph takes ~1s to import
+
+    try:
+        return get_stream_writer()
+    except RuntimeError:
+        return _noop
+
+
+class FieldStream:
+    """Callable that streams text deltas for one state field."""
+
+    def __init__(self, field):
+        self.field = field
+        self._write = get_writer()
+
+    def __call__(self, delta):
+        if delta:
+            self._write({"field": self.field, "delta": delta})
+
+    def done(self):
+        self._write({"field": self.field, "done": True})
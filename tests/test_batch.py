@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+import batch
+
+
+def fake_run_case(app, case):
+    return {"status": "ok", "research_findings": case["query"], "latency_s": 0.01, "ttft_s": None}
+
+
+def read_results(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def no_graph(monkeypatch):
+    monkeypatch.setattr(batch, "run_case", fake_run_case)
+
+
+@pytest.mark.parametrize("name, content", [
+    ("cases.jsonl", '{"id": "c1", "patient_id": "P001", "query": "a"}\n'
+                    '{"id": "c2", "query": "b"}\n'
+                    'not json\n'
+                    '{"id": "c4", "patient_id": "P002", "query": "d"}\n'),
+    ("cases.csv", "id,query\nc1,a\n"),
+])
+def test_bad_rows_are_recorded_as_failed_and_the_batch_continues(tmp_path, no_graph, name, content):
+    cases, output = tmp_path / name, str(tmp_path / "results.jsonl")
+    cases.write_text(content)
+
+    summary = batch.run_batch(str(cases), output, concurrency=2, app=object(), progress_every=0)
+
+    results = {record["id"]: record for record in read_results(output)}
+    errors = {id_: record["error"] for id_, record in results.items() if record["status"] == "error"}
+    if name.endswith(".jsonl"):
+        assert errors.keys() == {"c2", "row-3"}
+        assert errors["c2"] == "row 2: missing patient_id"
+        assert errors["row-3"].startswith("row 3: invalid JSON")
+        assert results["c1"]["status"] == results["c4"]["status"] == "ok"
+        assert (summary["processed"], summary["failures"], summary["invalid"]) == (4, 2, 2)
+    else:
+        assert errors == {"c1": "row 1: missing patient_id"}
+
+
+def test_bad_rows_are_retried_on_resume(tmp_path, no_graph):
+    cases, output = tmp_path / "cases.jsonl", str(tmp_path / "results.jsonl")
+    cases.write_text('{"id": "c1", "query": "a"}\n')
+    batch.run_batch(str(cases), output, app=object(), progress_every=0)
+
+    cases.write_text('{"id": "c1", "patient_id": "P001", "query": "a"}\n')
+    summary = batch.run_batch(str(cases), output, app=object(), progress_every=0)
+
+    assert summary["skipped"] == 0 and summary["failures"] == 0
+    assert [record["status"] for record in read_results(output)] == ["error", "ok"]
@@ -0,0 +1,82 @@
+import copy
+import json
+
+import pytest
+
+import checkpoint
+import main
+from cache import TieredCache
+
+PROFILE = {
+    "age": 67, "gender": "Male", "conditions": ["Type 2 Diabetes"], "medications": ["Metformin 500mg"],
+    "allergies": [], "vitals": {"eGFR": 58, "creatinine": 1.3}, "lab_flags": "", "recent_labs": "HbA1c 7.2",
+}
+STATE = {"patient_id": "P001", "user_query": "HbA1c elevated. Need medication.", "patient_profile": PROFILE}
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    """The checkpointed nodes of main.NODE_DEPENDENCIES around stand-ins that record their calls."""
+    monkeypatch.setattr(checkpoint, "checkpoint_cache", TieredCache(None, "node_output"))
+    calls = []
+
+    def stand_in(name, outputs):
+        def node(projected):
+            calls.append((name, projected))
+            return {field: json.dumps(projected, sort_keys=True) for field in outputs}
+        return node
+
+    nodes = {name: checkpoint.checkpointed(name, stand_in(name, outputs), inputs)
+             for name, (inputs, outputs) in main.NODE_DEPENDENCIES.items()}
+
+    def run(state):
+        calls.clear()
+        state = copy.deepcopy(state)
+        for node in nodes.values():
+            state.update(node(state))
+        return [name for name, _ in calls], dict(calls)
+
+    return run
+
+
+def changed(path, value):
+    state = copy.deepcopy(STATE)
+    *parents, leaf = path.split(".")
+    target = state
+    for part in parents:
+        target = target[part]
+    target[leaf] = value
+    return state
+
+
+@pytest.mark.parametrize("path, value, expected", [
+    ("patient_profile.vitals.creatinine", 2.1, ["safety"]),
+    ("patient_profile.vitals.eGFR", 24, ["rule_check", "safety"]),
+    ("patient_profile.recent_labs", "HbA1c 8.1", ["safety"]),
+    ("patient_profile.medications", ["Metformin 500mg", "Warfarin 5mg"], ["research", "rule_check", "safety"]),
+    ("user_query", "Fever and chest infection. Recommend antibiotics.",
+     ["retrieve", "research", "rule_check", "safety"]),
+])
+def test_rerun_recomputes_only_affected_nodes(graph, path, value, expected):
+    first, _ = graph(STATE)
+    assert first == list(main.NODE_DEPENDENCIES)
+    rerun, _ = graph(changed(path, value))
+    assert rerun == expected
+    assert main.affected_nodes([path]) == expected
+
+
+def test_unchanged_rerun_is_served_from_checkpoints(graph):
+    graph(STATE)
+    assert graph(copy.deepcopy(STATE))[0] == []
+
+
+def test_nodes_see_only_their_declared_inputs(graph):
+    _, seen = graph(STATE)
+    assert "vitals" not in seen["research"]["patient_profile"]
+    assert seen["rule_check"]["patient_profile"]["vitals"] == {"eGFR": 58}
+    assert seen["safety"]["patient_profile"]["vitals"] == PROFILE["vitals"]
+
+
+def test_combined_graph_reruns_consult_on_lab_changes():
+    rerun = main.affected_nodes(["patient_profile.vitals.creatinine"], topology="combined")
+    assert rerun == ["consult", "rule_check", "safety"]
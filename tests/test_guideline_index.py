@@ -0,0 +1,26 @@
+import pytest
+
+from guideline_index import GuidelineIndex
+
+
+@pytest.fixture(scope="module")
+def index():
+    return GuidelineIndex.from_directory("guidelines")
+
+
+@pytest.mark.parametrize("query", [
+    "Patient has a skin rash. Recommend treatment.",
+    "depression management",
+    "Recommend treatment",
+])
+def test_generic_or_uncovered_queries_find_nothing(index, query):
+    assert index.search(query, k=3, context="Type 2 Diabetes") == []
+
+
+@pytest.mark.parametrize("query, source", [
+    ("Patient has high fever and chest infection. Recommend antibiotics.", "Antimicrobial"),
+    ("Patient complains of severe headache and sensitivity to light. Recommend treatment.", "Standard Treatment"),
+    ("Patient's HbA1c is elevated at 7.2. Need medication to control blood sugar.", "Type 2 Diabetes"),
+])
+def test_demo_queries_find_their_guideline(index, query, source):
+    assert source in index.search(query, k=1)[0]["source"]
@@ -0,0 +1,117 @@
+import asyncio
+import time
+
+import pytest
+
+import http_client
+from benchmarks.stub_server import StubServer
+from http_client import CircuitBreaker, CircuitOpenError
+
+RESET = 0.2
+
+
+@pytest.fixture
+def stub():
+    server = StubServer(profile={"latency_ms": {"esearch": 1}, "jitter": 0}).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def breaker(stub, monkeypatch):
+    """A fresh breaker for the stub's host that opens after 2 failures and half-opens after RESET."""
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=RESET)
+    monkeypatch.setattr(http_client, "_breakers", {f"127.0.0.1:{stub.port}": breaker})
+    monkeypatch.setattr(http_client, "MAX_RETRIES", 0)
+    return breaker
+
+
+def esearch_url(stub):
+    return f"{stub.base_url}/entrez/eutils/esearch.fcgi"
+
+
+def aget(url, timeout=None):
+    """http_client.aget on a fresh event loop; `timeout` cancels the call from outside."""
+    async def main():
+        try:
+            return await asyncio.wait_for(http_client.aget(url, params={"term": "fever"}), timeout)
+        finally:
+            await http_client.aclose()
+    return asyncio.run(main())
+
+
+def fail_requests(stub, rate):
+    stub.profile["error_rate"]["esearch"] = rate
+
+
+def test_opens_half_opens_and_closes(stub, breaker):
+    fail_requests(stub, 1.0)
+    assert aget(esearch_url(stub)).status_code == 503
+    assert breaker.state == "closed"
+    assert aget(esearch_url(stub)).status_code == 503
+    assert breaker.state == "open"
+
+    calls = stub.requests["esearch"]
+    with pytest.raises(CircuitOpenError):
+        aget(esearch_url(stub))
+    assert stub.requests["esearch"] == calls  # Failed fast, the host was not called
+
+    time.sleep(RESET)
+    fail_requests(stub, 0.0)
+    assert aget(esearch_url(stub)).status_code == 200  # The half-open trial
+    assert breaker.state == "closed"
+
+
+def test_failed_trial_reopens(stub, breaker):
+    fail_requests(stub, 1.0)
+    aget(esearch_url(stub))
+    aget(esearch_url(stub))
+    time.sleep(RESET)
+    assert aget(esearch_url(stub)).status_code == 503
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        aget(esearch_url(stub))
+
+
+def test_cancelled_trial_frees_the_breaker(stub, breaker):
+    fail_requests(stub, 1.0)
+    aget(esearch_url(stub))
+    aget(esearch_url(stub))
+    time.sleep(RESET)
+
+    stub.profile["latency_ms"]["esearch"] = 500
+    with pytest.raises(asyncio.TimeoutError):
+        aget(esearch_url(stub), timeout=0.05)  # Cancels the trial mid-request
+    assert breaker.state == "open"
+
+    stub.profile["latency_ms"]["esearch"] = 1
+    fail_requests(stub, 0.0)
+    assert aget(esearch_url(stub)).status_code == 200  # No second reset wait
+    assert breaker.state == "closed"
+
+
+def test_unexpected_error_frees_the_breaker(stub, breaker, monkeypatch):
+    fail_requests(stub, 1.0)
+    aget(esearch_url(stub))
+    aget(esearch_url(stub))
+    time.sleep(RESET)
+
+    def broken(*args):
+        raise ValueError("unreadable response")
+    monkeypatch.setattr(http_client, "AsyncResponse", broken)
+    with pytest.raises(ValueError):
+        aget(esearch_url(stub))
+    assert breaker.state == "open"
+    assert breaker.allow()  # The next caller gets the trial
+
+
+def test_sync_get_shares_the_breaker(stub, breaker):
+    fail_requests(stub, 1.0)
+    aget(esearch_url(stub))
+    aget(esearch_url(stub))
+    with pytest.raises(CircuitOpenError):
+        http_client.get(esearch_url(stub), params={"term": "fever"})
+    time.sleep(RESET)
+    fail_requests(stub, 0.0)
+    assert http_client.get(esearch_url(stub), params={"term": "fever"}).status_code == 200
+    assert breaker.state == "closed"
@@ -0,0 +1,82 @@
+import json
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+from patient_store import PatientStore
+
+
+def write_lines(path, records, mode="a"):
+    with open(path, mode) as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def touch(path, step):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + step))  # A new signature even within one tick
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "patients.jsonl")
+    write_lines(path, [{"id": f"P{i}", "v": 0} for i in range(2000)], mode="w")
+    return path
+
+
+def test_appended_versions_replace_the_indexed_ones(db):
+    store = PatientStore(db)
+    assert len(store) == 2000
+    for step in range(1, 4):
+        write_lines(db, [{"id": f"P{i}", "v": step} for i in range(0, 3000, 7)])
+        touch(db, step)
+        store.refresh()
+        assert len(store) == 2000 + len(range(2002, 3000, 7))
+        assert store.get("P7")["v"] == step
+    records = list(store.records())
+    assert len(records) == len(store)
+    assert {r["id"]: r["v"] for r in records}["P14"] == 3
+
+
+def test_len_reads_no_records(db, monkeypatch):
+    store = PatientStore(db)
+    store.refresh()
+    write_lines(db, [{"id": f"P{i}", "v": 1} for i in range(500)])
+    touch(db, 1)
+    store.refresh()
+
+    def no_reads(*args):
+        raise AssertionError("len() read a record from disk")
+    monkeypatch.setattr(store, "_read", no_reads)
+    assert len(store) == 2000
+
+
+def _save_repeatedly(path, array, rounds, errors):
+    store = PatientStore(path)
+    store._indexed_size = os.path.getsize(path)
+    signature = (os.stat(path).st_mtime_ns, store._indexed_size)
+    for _ in range(rounds):
+        saved = store._save_sidecar(array, signature)
+        if not isinstance(saved.base, np.memmap):
+            errors.put("sidecar not persisted")
+            return
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_concurrent_sidecar_writes_stay_intact(db):
+    array = PatientStore(db, persist_index=False)
+    array.refresh()
+    array = array._view[0]
+    context = multiprocessing.get_context("fork")
+    errors = context.Queue()
+    workers = [context.Process(target=_save_repeatedly, args=(db, array, 50, errors)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert errors.empty()
+    assert not [name for name in os.listdir(os.path.dirname(db)) if name.endswith(".tmp")]
+    reopened = PatientStore(db)
+    assert len(reopened) == 2000 and reopened.get("P1999")["v"] == 0
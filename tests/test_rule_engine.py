@@ -0,0 +1,49 @@
+import pytest
+
+from rule_engine import Automaton, RuleEngine
+from safety_agent import CONTRAINDICATIONS, DRUG_INTERACTIONS
+
+
+def baseline_contraindications(proposed_text, conditions):
+    """The substring loop safety_agent.py ran before the rule engine."""
+    proposed_lower = proposed_text.lower()
+    warnings = []
+    for drug, info in CONTRAINDICATIONS.items():
+        if drug in proposed_lower:
+            for condition in conditions:
+                if any(c.lower() in condition.lower() for c in info["condition_conflict"]):
+                    warnings.append(f"CONTRAINDICATION: {drug.upper()} + {condition}. {info['reason']}")
+    return warnings
+
+
+@pytest.fixture(scope="module")
+def engine():
+    return RuleEngine(CONTRAINDICATIONS, DRUG_INTERACTIONS)
+
+
+@pytest.mark.parametrize("proposed, conditions", [
+    ("Ibuprofen 400mg TDS", ["Peptic Ulcers"]),
+    ("Ibuprofen 400mg TDS", ["Kidney Diseases"]),
+    ("Ibuprofen 400mg TDS", ["Asthmatic bronchitis"]),
+    ("Levofloxacin 500mg OD", ["Arrhythmias", "Chronic Kidney Diseases"]),
+    ("Metformin 500mg BD", ["CKD stage 3", "Renal Failure (acute)"]),
+    ("Ibuprofen and levofloxacin", ["Peptic Ulcer Disease", "Hypertension"]),
+    ("Paracetamol 650mg", ["Peptic Ulcers"]),
+])
+def test_contraindications_match_baseline_loops(engine, proposed, conditions):
+    warnings, _ = engine.check(proposed, {"conditions": conditions})
+    got = [w for w in warnings if w.startswith("CONTRAINDICATION") and " + " in w]
+    assert got == baseline_contraindications(proposed, conditions)
+    assert got or proposed.startswith("Paracetamol")
+
+
+def test_condition_phrase_must_start_a_word(engine):
+    warnings, is_safe = engine.check("Metformin 500mg", {"conditions": ["Blackdeath"]})
+    assert warnings == [] and is_safe
+
+
+def test_drug_names_need_both_boundaries():
+    matcher = Automaton()
+    matcher.add("aspirin", "aspirin")
+    assert matcher.values("Ecosprin (aspirin) 75") == {"aspirin"}
+    assert matcher.values("aspirinate") == set()
@@ -0,0 +1,53 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from server import Worker, WorkerPool
+
+
+class Pipe:
+    """Stands in for a worker's socket writer; keeps what the front end sent."""
+
+    def __init__(self):
+        self.messages = []
+
+    def write(self, data):
+        self.messages.append(json.loads(data))
+
+
+def test_timed_out_job_keeps_its_slot_until_the_worker_replies():
+    async def main():
+        pool = WorkerPool(size=1, concurrency=1, queue_size=4, queue_timeout=5, request_timeout=0.05)
+        worker = pool.workers[0] = Worker(0, os.getpid(), None, Pipe())
+
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.consult({"patient_id": "P001", "user_query": "fever"})
+        job, cancel = worker.writer.messages
+        assert cancel == {"id": job["id"], "op": "cancel"}
+        assert worker.active == 1  # Still running in the worker
+
+        queued = asyncio.create_task(pool.acquire())
+        await asyncio.sleep(0.01)
+        assert not queued.done()  # The pool does not oversubscribe the worker
+
+        worker.resolve({"id": job["id"], "error": "cancelled"})
+        assert await asyncio.wait_for(queued, 1) is worker
+        pool.release(worker)
+        assert worker.active == 0
+
+    asyncio.run(main())
+
+
+def test_lost_worker_frees_a_timed_out_slot():
+    async def main():
+        pool = WorkerPool(size=1, concurrency=1, queue_size=4, queue_timeout=5, request_timeout=0.05)
+        worker = pool.workers[0] = Worker(0, os.getpid(), None, Pipe())
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.consult({"patient_id": "P001", "user_query": "fever"})
+        worker.lost()
+        await asyncio.sleep(0)  # Done callbacks run on the next loop iteration
+        assert worker.active == 0
+
+    asyncio.run(main())
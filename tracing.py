@@ -0,0 +1,330 @@
+import asyncio
+import contextvars
+import functools
+import itertools
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+
+# ==========================================
+# TRACING & LATENCY METRICS
+# ==========================================
+# Lightweight spans for graph nodes and external calls (PubMed, RxNav, LLM),
+# aggregated into in-process latency histograms and counters and exported
+# as JSON or Prometheus text format.
+#
+#   with tracing.span("http.esearch", host=host) as s:
+#       ...
+#       s.set(status=200)
+#
+# Span names are dotted: "node.<graph node>", "http.<endpoint>",
+# "llm.<purpose>". Attributes (status, tokens, cache hit/miss, ...) are kept
+# on the recent-span log; token counts and cache lookups also feed counters.
+# observe() records a duration measured outside a span (scheduler queue
+# waits), and register_gauges() adds point-in-time values to the export.
+# dump() hands a process's metrics to another one, which merges them into
+# its own export (the server's /metrics covers every worker).
+#
+# Tunables (environment):
+#   MEDP_TRACING        "on" to record spans (default off: span() returns a
+#                       shared no-op object and nothing is measured)
+#   MEDP_TRACE_BUFFER   number of recent finished spans kept (default 1000)
+
+ENABLED = os.getenv("MEDP_TRACING", "off").lower() in ("1", "on", "true", "yes")
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, math.inf)
+
+_lock = threading.Lock()
+_histograms = {}   # span name -> Histogram
+_counters = {}     # (metric, sorted label items) -> value
+_gauge_sources = []  # callables returning [(metric, labels, value)], read at export
+_recent = deque(maxlen=int(os.getenv("MEDP_TRACE_BUFFER", 1000)))
+_ids = itertools.count(1)
+_current = contextvars.ContextVar("medp_span", default=None)
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    """Drop all recorded spans, histograms and counters."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _recent.clear()
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (cumulative on export, like Prometheus)."""
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Estimate a quantile by linear interpolation inside its bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = min(BUCKETS[i], self.max)
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum_s": round(self.total, 6),
+            "mean_s": round(self.total / self.count, 6) if self.count else None,
+            "p50_s": _round(self.quantile(0.50)),
+            "p95_s": _round(self.quantile(0.95)),
+            "p99_s": _round(self.quantile(0.99)),
+            "max_s": round(self.max, 6),
+        }
+
+
+def _round(value):
+    return None if value is None else round(value, 6)
+
+
+class Span:
+    """A timed operation. Use via span(); call set() to attach attributes."""
+
+    __slots__ = ("name", "attrs", "span_id", "parent_id", "start", "duration", "_token")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.span_id = next(_ids)
+        parent = _current.get()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.duration = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        _finish(self)
+        return False
+
+    def to_dict(self):
+        return {"name": self.name, "span_id": self.span_id, "parent_id": self.parent_id,
+                "duration_s": round(self.duration, 6), **self.attrs}
+
+
+class _NoopSpan:
+    """Returned by span() while tracing is disabled."""
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name, **attrs):
+    """Context manager timing one operation (a shared no-op when disabled)."""
+    if not ENABLED:
+        return _NOOP
+    return Span(name, attrs)
+
+
+def _finish(finished):
+    with _lock:
+        histogram = _histograms.get(finished.name)
+        if histogram is None:
+            histogram = _histograms[finished.name] = Histogram()
+        histogram.observe(finished.duration)
+        _recent.append(finished)
+
+
+def count(metric, value=1, **labels):
+    """Add `value` to a labelled counter, e.g. count("cache_requests", cache="llm", result="hit")."""
+    if not ENABLED or not value:
+        return
+    key = (metric, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds):
+    """Record a duration measured elsewhere (e.g. time spent queued) in the `name` histogram."""
+    if not ENABLED:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+
+def register_gauges(source):
+    """
+    Export point-in-time values (queue depth, ...) alongside the counters.
+    `source()` returns [(metric, {label: value}, value)] and is called on
+    every export, so it must not call back into tracing.
+    """
+    _gauge_sources.append(source)
+
+
+def _gauges():
+    # Read outside _lock: sources take their own locks
+    rows = [row for source in _gauge_sources for row in source()]
+    return sorted((metric, tuple(sorted(labels.items())), value) for metric, labels, value in rows)
+
+
+def traced(name, fn):
+    """Wrap a sync or async graph node so each call is recorded as a span."""
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            if not ENABLED:
+                return await fn(*args, **kwargs)
+            with span(name):
+                return await fn(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not ENABLED:
+            return fn(*args, **kwargs)
+        with span(name):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+# ==========================================
+# EXPORT
+# ==========================================
+def snapshot(recent=100):
+    """Histograms, counters, gauges and the most recent spans as a JSON-able dict."""
+    gauges = [{"metric": metric, **dict(labels), "value": value} for metric, labels, value in _gauges()]
+    with _lock:
+        histograms = {name: h.summary() for name, h in sorted(_histograms.items())}
+        counters = [{"metric": metric, **dict(labels), "value": value}
+                    for (metric, labels), value in sorted(_counters.items())]
+        spans = [s.to_dict() for s in list(_recent)[-recent:]] if recent else []
+    return {"enabled": ENABLED, "histograms": histograms, "counters": counters, "gauges": gauges,
+            "recent_spans": spans}
+
+
+def to_json(recent=100, indent=2):
+    return json.dumps(snapshot(recent), indent=indent)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(items):
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def dump():
+    """
+    This process's histograms, counters and gauges as plain JSON-able data,
+    for another process to add into its export (to_prometheus(merge=...)).
+    """
+    gauges = [[metric, labels, value] for metric, labels, value in _gauges()]
+    with _lock:
+        histograms = {name: [list(h.counts), h.count, h.total, h.max] for name, h in _histograms.items()}
+        counters = [[metric, labels, value] for (metric, labels), value in _counters.items()]
+    return {"histograms": histograms, "counters": counters, "gauges": gauges}
+
+
+def _combine(dumps):
+    """Sum dump()s: ({span: Histogram}, {(metric, labels): value} for counters, the same for gauges)."""
+    histograms, counters, gauges = {}, {}, {}
+    for data in dumps:
+        for name, (counts, total_count, total, maximum) in data["histograms"].items():
+            h = histograms.setdefault(name, Histogram())
+            h.counts = [a + b for a, b in zip(h.counts, counts)]
+            h.count += total_count
+            h.total += total
+            h.max = max(h.max, maximum)
+        for rows, combined in ((data["counters"], counters), (data["gauges"], gauges)):
+            for metric, labels, value in rows:
+                key = (metric, tuple(tuple(item) for item in labels))
+                combined[key] = combined.get(key, 0) + value
+    return histograms, counters, gauges
+
+
+def to_prometheus(prefix="medp", merge=()):
+    """
+    Prometheus text exposition format (histograms, counters and gauges).
+    `merge` adds dump()s from other processes (server.py workers) into the
+    totals, so one scrape covers all of them.
+    """
+    histograms, counters, gauges = _combine([dump(), *merge])
+    lines = []
+
+    metric = f"{prefix}_span_duration_seconds"
+    lines.append(f"# HELP {metric} Duration of traced operations.")
+    lines.append(f"# TYPE {metric} histogram")
+    for name, h in sorted(histograms.items()):
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS, h.counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == math.inf else repr(bound)
+            lines.append(f"{metric}_bucket{_labels([('span', name), ('le', le)])} {cumulative}")
+        lines.append(f"{metric}_sum{_labels([('span', name)])} {h.total:.6f}")
+        lines.append(f"{metric}_count{_labels([('span', name)])} {h.count}")
+
+    for rows, kind, suffix in ((counters, "counter", "_total"), (gauges, "gauge", "")):
+        typed = set()
+        for (name, labels), value in sorted(rows.items()):
+            metric = f"{prefix}_{name}{suffix}"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} {kind}")
+            lines.append(f"{metric}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write(path):
+    """Write the current metrics to `path` (.prom -> Prometheus text, else JSON)."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(to_prometheus() if path.endswith(".prom") else to_json())